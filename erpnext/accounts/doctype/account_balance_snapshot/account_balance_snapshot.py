@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint, cstr, flt, getdate, get_first_day, get_last_day, add_days
+from frappe.model.document import Document
+from frappe.model.naming import set_new_name
+
+class AccountBalanceSnapshot(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabAccount Balance Snapshot`
+		where Key_name="account_party_period_end" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabAccount Balance Snapshot`
+			add unique index account_party_period_end(account, party_type, party, period_end)""")
+
+def use_balance_snapshots():
+	return cint(frappe.db.get_single_value("Accounts Settings", "maintain_balance_snapshots"))
+
+def update_balance_snapshots(gl_entries, cancel=False):
+	"""Add (or on cancel, subtract) GL Entries to the monthly closing balances of
+	their account and party"""
+	if not gl_entries or not use_balance_snapshots():
+		return
+
+	report_type = get_report_type_map([d.get("account") for d in gl_entries])
+
+	movements = {}
+	for d in gl_entries:
+		# balance of profit and loss accounts excludes closing entries
+		if d.get("voucher_type") == "Period Closing Voucher" \
+			and report_type.get(d.get("account")) == "Profit and Loss":
+				continue
+
+		key = (d.get("company"), d.get("account"), cstr(d.get("party_type")), cstr(d.get("party")),
+			get_last_day(d.get("posting_date")))
+		movement = movements.setdefault(key, [0.0, 0.0])
+		movement[0] += flt(d.get("debit")) - flt(d.get("credit"))
+		movement[1] += flt(d.get("debit_in_account_currency")) - flt(d.get("credit_in_account_currency"))
+
+	for key in sorted(movements):
+		balance, balance_in_account_currency = movements[key]
+		if cancel:
+			balance, balance_in_account_currency = -balance, -balance_in_account_currency
+
+		add_to_snapshots(key, balance, balance_in_account_currency)
+
+def add_to_snapshots(key, balance, balance_in_account_currency):
+	"""Add movement to the closing balance of the period and of all the later periods"""
+	company, account, party_type, party, period_end = key
+	filters = {"account": account, "party_type": party_type, "party": party, "period_end": period_end}
+
+	if not frappe.db.sql("""select name from `tabAccount Balance Snapshot`
+		where account=%(account)s and party_type=%(party_type)s and party=%(party)s
+		and period_end=%(period_end)s for update""", filters):
+			previous = frappe.db.sql("""select balance, balance_in_account_currency
+				from `tabAccount Balance Snapshot`
+				where account=%(account)s and party_type=%(party_type)s and party=%(party)s
+				and period_end < %(period_end)s order by period_end desc limit 1""", filters)
+
+			snapshot = frappe.get_doc({
+				"doctype": "Account Balance Snapshot",
+				"company": company,
+				"account": account,
+				"party_type": party_type,
+				"party": party,
+				"period_end": period_end,
+				"balance": flt(previous[0][0]) if previous else 0.0,
+				"balance_in_account_currency": flt(previous[0][1]) if previous else 0.0
+			})
+			set_new_name(snapshot)
+			snapshot.db_insert()
+
+	filters.update({"balance": balance, "balance_in_account_currency": balance_in_account_currency})
+	frappe.db.sql("""update `tabAccount Balance Snapshot`
+		set balance = balance + %(balance)s,
+			balance_in_account_currency = balance_in_account_currency + %(balance_in_account_currency)s
+		where account=%(account)s and party_type=%(party_type)s and party=%(party)s
+		and period_end >= %(period_end)s""", filters)
+
+def get_balance_from_snapshots(account=None, date=None, party_type=None, party=None,
+		in_account_currency=True, year_start_date=None):
+	"""Balance as per the closing snapshot of the previous month and the GL Entries
+	posted after it. `account` is the Account document"""
+	if account and account.report_type == "Profit and Loss":
+		return get_closing_balance(account, date, party_type, party, in_account_currency) \
+			- get_closing_balance(account, add_days(year_start_date, -1), party_type, party, in_account_currency)
+
+	return get_closing_balance(account, date, party_type, party, in_account_currency)
+
+def get_closing_balance(account=None, date=None, party_type=None, party=None, in_account_currency=True):
+	conditions, values = [], {}
+	if account:
+		if account.is_group:
+			conditions.append("""account in (select name from `tabAccount`
+				where lft >= %(lft)s and rgt <= %(rgt)s)""")
+			values.update({"lft": account.lft, "rgt": account.rgt})
+		else:
+			conditions.append("account = %(account)s")
+			values["account"] = account.name
+
+	if party_type and party:
+		conditions.append("party_type = %(party_type)s and party = %(party)s")
+		values.update({"party_type": party_type, "party": party})
+
+	balance_field = "balance_in_account_currency" if in_account_currency else "balance"
+	snapshot_conditions = list(conditions)
+	if date:
+		values["month_start"] = get_first_day(date)
+		snapshot_conditions.append("period_end < %(month_start)s")
+
+	# latest snapshot of every account and party
+	balance = flt(frappe.db.sql("""select sum(snapshot.{0}) from `tabAccount Balance Snapshot` snapshot,
+			(select account, party_type, party, max(period_end) as period_end
+				from `tabAccount Balance Snapshot` where {1}
+				group by account, party_type, party) latest
+		where snapshot.account = latest.account and snapshot.party_type = latest.party_type
+			and snapshot.party = latest.party and snapshot.period_end = latest.period_end""".format(
+			balance_field, " and ".join(snapshot_conditions) or "1=1"), values)[0][0])
+
+	if date:
+		if in_account_currency:
+			select_field = "sum(debit_in_account_currency) - sum(credit_in_account_currency)"
+		else:
+			select_field = "sum(debit) - sum(credit)"
+
+		if account and account.report_type == "Profit and Loss":
+			conditions.append("voucher_type != 'Period Closing Voucher'")
+
+		values["date"] = getdate(date)
+		balance += flt(frappe.db.sql("""select {0} from `tabGL Entry`
+			where posting_date >= %(month_start)s and posting_date <= %(date)s and {1}""".format(
+				select_field, " and ".join(conditions) or "1=1"), values)[0][0])
+
+	return balance
+
+def rebuild_balance_snapshots(company):
+	"""Regenerate balance snapshots of the company from GL Entries"""
+	frappe.db.sql("delete from `tabAccount Balance Snapshot` where company=%s", company)
+
+	report_type = dict(frappe.db.sql("""select name, report_type from tabAccount where company=%s""", company))
+
+	movements = frappe.db.sql("""select account, ifnull(party_type, '') as party_type,
+			ifnull(party, '') as party, last_day(posting_date) as period_end,
+			sum(if(voucher_type='Period Closing Voucher', debit - credit, 0)) as closing_balance,
+			sum(if(voucher_type='Period Closing Voucher',
+				debit_in_account_currency - credit_in_account_currency, 0)) as closing_balance_in_account_currency,
+			sum(debit - credit) as balance,
+			sum(debit_in_account_currency - credit_in_account_currency) as balance_in_account_currency
+		from `tabGL Entry` where company=%s
+		group by account, party_type, party, period_end
+		order by account, party_type, party, period_end""", company, as_dict=1)
+
+	last_key, balance, balance_in_account_currency = None, 0.0, 0.0
+	for d in movements:
+		key = (d.account, d.party_type, d.party)
+		if key != last_key:
+			last_key, balance, balance_in_account_currency = key, 0.0, 0.0
+
+		balance += flt(d.balance)
+		balance_in_account_currency += flt(d.balance_in_account_currency)
+
+		if report_type.get(d.account) == "Profit and Loss":
+			balance -= flt(d.closing_balance)
+			balance_in_account_currency -= flt(d.closing_balance_in_account_currency)
+
+		snapshot = frappe.get_doc({
+			"doctype": "Account Balance Snapshot",
+			"company": company,
+			"account": d.account,
+			"party_type": d.party_type,
+			"party": d.party,
+			"period_end": d.period_end,
+			"balance": balance,
+			"balance_in_account_currency": balance_in_account_currency
+		})
+		set_new_name(snapshot)
+		snapshot.db_insert()
+
+def get_report_type_map(accounts):
+	accounts = list(set(filter(None, accounts)))
+	if not accounts:
+		return {}
+
+	return dict(frappe.db.sql("""select name, report_type from tabAccount where name in ({0})"""
+		.format(", ".join(["%s"] * len(accounts))), tuple(accounts)))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from erpnext.accounts.utils import get_balance_on
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+from erpnext.accounts.doctype.account_balance_snapshot.account_balance_snapshot \
+	import rebuild_balance_snapshots
+
+class TestAccountBalanceSnapshot(unittest.TestCase):
+	def tearDown(self):
+		frappe.db.set_value("Accounts Settings", None, "maintain_balance_snapshots", 0)
+
+	def get_balances(self):
+		return [get_balance_on(account, date) for account in ("_Test Bank - _TC",
+			"_Test Account Cost for Goods Sold - _TC", "Current Assets - _TC")
+			for date in ("2013-01-31", "2013-02-14", "2013-03-01", None)]
+
+	def test_balance_from_snapshots(self):
+		make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+			"_Test Bank - _TC", 100, "_Test Cost Center - _TC", submit=True)
+
+		balances = self.get_balances()
+
+		frappe.db.set_value("Accounts Settings", None, "maintain_balance_snapshots", 1)
+		rebuild_balance_snapshots("_Test Company")
+		self.assertEqual(self.get_balances(), balances)
+
+		jv = make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+			"_Test Bank - _TC", 100, "_Test Cost Center - _TC", submit=True)
+		balances_with_snapshots = self.get_balances()
+
+		jv.cancel()
+		self.assertEqual(self.get_balances(), balances)
+
+		frappe.db.set_value("Accounts Settings", None, "maintain_balance_snapshots", 0)
+		jv = make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+			"_Test Bank - _TC", 100, "_Test Cost Center - _TC", submit=True)
+		self.assertEqual(self.get_balances(), balances_with_snapshots)
+		jv.cancel()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint, cstr, flt, getdate, get_first_day, get_last_day
+from frappe.model.document import Document
+from frappe.model.naming import set_new_name
+
+class AccountPeriodBalance(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabAccount Period Balance`
+		where Key_name="account_period_balance_key" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabAccount Period Balance`
+			add unique index account_period_balance_key(account, cost_center, fiscal_year,
+				period_start, is_opening, is_period_closing)""")
+
+	frappe.db.add_index("Account Period Balance", ["company", "period_start"])
+
+def use_account_period_balances(company=None):
+	"""Account Period Balances are maintained, and if `company` is given,
+	have been built for the company"""
+	if not cint(frappe.db.get_single_value("Accounts Settings", "maintain_account_period_balances")):
+		return False
+
+	if company:
+		return cint(frappe.db.get_global(get_built_key(company)))
+
+	return True
+
+def is_month_aligned(from_date=None, to_date=None):
+	"""Account Period Balances can answer for a date range only if it covers whole months"""
+	if from_date and getdate(from_date) != get_first_day(from_date):
+		return False
+
+	if to_date and getdate(to_date) != get_last_day(to_date):
+		return False
+
+	return True
+
+def get_built_key(company):
+	return "account_period_balances_built:" + company
+
+def set_built(company, built=1):
+	frappe.db.set_global(get_built_key(company), built)
+
+def update_account_period_balances(gl_entries, cancel=False):
+	"""Add (or on cancel, subtract) debit and credit of GL Entries to their
+	account period balance"""
+	if not gl_entries or not use_account_period_balances():
+		return
+
+	movements = {}
+	for d in gl_entries:
+		posting_date = getdate(d.get("posting_date"))
+		key = (d.get("company"), d.get("account"), cstr(d.get("cost_center")), cstr(d.get("fiscal_year")),
+			get_first_day(posting_date), "Yes" if d.get("is_opening") == "Yes" else "No",
+			1 if d.get("voucher_type") == "Period Closing Voucher" else 0)
+
+		movement = movements.setdefault(key, [0.0, 0.0])
+		movement[0] += flt(d.get("debit"))
+		movement[1] += flt(d.get("credit"))
+
+	for key in sorted(movements):
+		debit, credit = movements[key]
+		if cancel:
+			debit, credit = -debit, -credit
+
+		add_to_account_period_balance(key, debit, credit)
+
+def add_to_account_period_balance(key, debit, credit):
+	company, account, cost_center, fiscal_year, period_start, is_opening, is_period_closing = key
+	filters = {
+		"account": account,
+		"cost_center": cost_center,
+		"fiscal_year": fiscal_year,
+		"period_start": period_start,
+		"is_opening": is_opening,
+		"is_period_closing": is_period_closing
+	}
+
+	name = frappe.db.sql("""select name from `tabAccount Period Balance`
+		where account=%(account)s and cost_center=%(cost_center)s and fiscal_year=%(fiscal_year)s
+			and period_start=%(period_start)s and is_opening=%(is_opening)s
+			and is_period_closing=%(is_period_closing)s
+		for update""", filters)
+
+	if name:
+		frappe.db.sql("""update `tabAccount Period Balance`
+			set debit = debit + %s, credit = credit + %s where name=%s""", (debit, credit, name[0][0]))
+	else:
+		make_account_period_balance(frappe._dict(filters, company=company, debit=debit, credit=credit))
+
+def make_account_period_balance(values):
+	balance = frappe.get_doc({
+		"doctype": "Account Period Balance",
+		"company": values.company,
+		"account": values.account,
+		"cost_center": values.cost_center,
+		"fiscal_year": values.fiscal_year,
+		"period_start": values.period_start,
+		"period_end": get_last_day(values.period_start),
+		"is_opening": values.is_opening,
+		"is_period_closing": cint(values.is_period_closing),
+		"debit": flt(values.debit),
+		"credit": flt(values.credit)
+	})
+	set_new_name(balance)
+	balance.db_insert()
+
+def rebuild_account_period_balances(company, from_date=None, to_date=None):
+	"""Regenerate account period balances of the company from GL Entries, for the months
+	between `from_date` and `to_date` if given"""
+	conditions, values = "", {"company": company}
+	if from_date:
+		conditions += " and {0} >= %(from_date)s"
+		values["from_date"] = get_first_day(from_date)
+
+	if to_date:
+		conditions += " and {0} <= %(to_date)s"
+		values["to_date"] = get_last_day(to_date)
+
+	frappe.db.sql("""delete from `tabAccount Period Balance` where company=%(company)s {0}"""
+		.format(conditions.format("period_start")), values)
+
+	for d in frappe.db.sql("""select company, account, ifnull(cost_center, '') as cost_center,
+			ifnull(fiscal_year, '') as fiscal_year,
+			date_sub(posting_date, interval dayofmonth(posting_date) - 1 day) as period_start,
+			if(is_opening = 'Yes', 'Yes', 'No') as is_opening,
+			if(voucher_type = 'Period Closing Voucher', 1, 0) as is_period_closing,
+			sum(debit) as debit, sum(credit) as credit
+		from `tabGL Entry`
+		where company=%(company)s {0}
+		group by account, cost_center, fiscal_year, period_start, is_opening, is_period_closing"""
+		.format(conditions.format("posting_date")), values, as_dict=1):
+			make_account_period_balance(d)
+
+	if not (from_date or to_date):
+		set_built(company)
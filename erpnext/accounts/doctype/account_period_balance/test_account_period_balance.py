@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from erpnext.accounts.report.trial_balance.trial_balance import execute as trial_balance
+from erpnext.accounts.report.financial_statements import get_period_list, get_data
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+	import rebuild_account_period_balances, set_built
+
+class TestAccountPeriodBalance(unittest.TestCase):
+	def tearDown(self):
+		frappe.db.set_value("Accounts Settings", None, "maintain_account_period_balances", 0)
+		set_built("_Test Company", 0)
+
+	def get_balances(self):
+		fiscal_year = "_Test Fiscal Year 2013"
+		period_list = get_period_list(fiscal_year, "Monthly")
+
+		return (trial_balance(frappe._dict({"company": "_Test Company", "fiscal_year": fiscal_year}))[1],
+			get_data("_Test Company", "Expense", "Debit", period_list, accumulated_values=0))
+
+	def test_reports_from_account_period_balances(self):
+		make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+			"_Test Bank - _TC", 100, "_Test Cost Center - _TC", submit=True)
+
+		balances = self.get_balances()
+
+		frappe.db.set_value("Accounts Settings", None, "maintain_account_period_balances", 1)
+		rebuild_account_period_balances("_Test Company")
+		self.assertEqual(self.get_balances(), balances)
+
+		jv = make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+			"_Test Bank - _TC", 100, "_Test Cost Center - _TC", submit=True)
+		self.assertNotEqual(self.get_balances(), balances)
+
+		jv.cancel()
+		self.assertEqual(self.get_balances(), balances)
+
+		# balances of a company not built are not used
+		set_built("_Test Company", 0)
+		frappe.db.sql("delete from `tabAccount Period Balance` where company='_Test Company'")
+		self.assertEqual(self.get_balances(), balances)
@@ -10,9 +10,43 @@ from frappe.utils import cint, comma_and
 from frappe.model.document import Document
 
 class AccountsSettings(Document):
+	def validate(self):
+		self.flags.rebuild_balance_snapshots = cint(self.maintain_balance_snapshots) \
+			and not cint(frappe.db.get_single_value("Accounts Settings", "maintain_balance_snapshots"))
+		self.flags.rebuild_open_items = cint(self.maintain_open_items) \
+			and not cint(frappe.db.get_single_value("Accounts Settings", "maintain_open_items"))
+		self.flags.rebuild_account_period_balances = cint(self.maintain_account_period_balances) \
+			and not cint(frappe.db.get_single_value("Accounts Settings", "maintain_account_period_balances"))
+		self.flags.disable_account_period_balances = not cint(self.maintain_account_period_balances) \
+			and cint(frappe.db.get_single_value("Accounts Settings", "maintain_account_period_balances"))
+
 	def on_update(self):
 		frappe.db.set_default("auto_accounting_for_stock", self.auto_accounting_for_stock)
 
+		if self.flags.rebuild_balance_snapshots:
+			from erpnext.accounts.doctype.account_balance_snapshot.account_balance_snapshot \
+				import rebuild_balance_snapshots
+
+			for company in frappe.db.sql_list("select name from tabCompany"):
+				rebuild_balance_snapshots(company)
+
+		if self.flags.rebuild_open_items:
+			from erpnext.accounts.doctype.open_item.open_item import rebuild_open_items
+
+			for company in frappe.db.sql_list("select name from tabCompany"):
+				rebuild_open_items(company)
+
+		if self.flags.rebuild_account_period_balances or self.flags.disable_account_period_balances:
+			from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+				import rebuild_account_period_balances, set_built
+
+			for company in frappe.db.sql_list("select name from tabCompany"):
+				if self.flags.rebuild_account_period_balances:
+					rebuild_account_period_balances(company)
+				else:
+					# balances are not maintained any more, rebuild when enabled again
+					set_built(company, 0)
+
 		if cint(self.auto_accounting_for_stock):
 			# set default perpetual account in company
 			for company in frappe.db.sql("select name from tabCompany"):
@@ -8,6 +8,7 @@ from frappe.utils import getdate, add_days, add_years, cstr
 from dateutil.relativedelta import relativedelta
 
 from frappe.model.document import Document
+from erpnext.accounts.utils import clear_fiscal_year_cache
 
 class FiscalYear(Document):
 	def set_as_default(self):
@@ -40,6 +41,10 @@ class FiscalYear(Document):
 
 	def on_update(self):
 		check_duplicate_fiscal_year(self)
+		clear_fiscal_year_cache()
+
+	def on_trash(self):
+		clear_fiscal_year_cache()
 
 @frappe.whitelist()
 def check_duplicate_fiscal_year(doc):
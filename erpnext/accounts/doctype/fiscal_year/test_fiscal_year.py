@@ -4,6 +4,7 @@
 from __future__ import unicode_literals
 
 import frappe, unittest
+from erpnext.accounts.utils import get_fiscal_year, FiscalYearError
 
 test_records = frappe.get_test_records('Fiscal Year')
 test_ignore = ["Company"]
@@ -21,3 +22,28 @@ class TestFiscalYear(unittest.TestCase):
 		fy.insert()
 		self.assertEquals(fy.year_end_date, '2001-03-31')
 
+
+	def test_fiscal_year_cache(self):
+		if frappe.db.exists("Fiscal Year", "_Test Fiscal Year 1990"):
+			frappe.delete_doc("Fiscal Year", "_Test Fiscal Year 1990")
+
+		self.assertRaises(FiscalYearError, get_fiscal_year, "1990-06-01", verbose=0)
+
+		fy = frappe.get_doc({
+			"doctype": "Fiscal Year",
+			"year": "_Test Fiscal Year 1990",
+			"year_start_date": "1990-01-01",
+			"year_end_date": "1990-12-31"
+		})
+		fy.insert()
+
+		self.assertEquals(get_fiscal_year("1990-06-01")[0], "_Test Fiscal Year 1990")
+		self.assertEquals(get_fiscal_year("1990-12-31", company="_Test Company")[0], "_Test Fiscal Year 1990")
+
+		fy.append("companies", {"company": "_Test Company 1"})
+		fy.save()
+		self.assertRaises(FiscalYearError, get_fiscal_year, "1990-06-01", company="_Test Company", verbose=0)
+		self.assertEquals(get_fiscal_year("1990-06-01", company="_Test Company 1")[0], "_Test Fiscal Year 1990")
+
+		frappe.delete_doc("Fiscal Year", "_Test Fiscal Year 1990")
+		self.assertRaises(FiscalYearError, get_fiscal_year, "1990-06-01", verbose=0)
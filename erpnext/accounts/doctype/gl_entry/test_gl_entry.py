@@ -3,7 +3,9 @@
 
 from __future__ import unicode_literals
 import frappe, unittest
+from frappe.utils import flt
 from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+from erpnext.accounts.general_ledger import make_gl_entries, merge_similar_entries
 
 class TestGLEntry(unittest.TestCase):
 	def test_round_off_entry(self):
@@ -23,3 +25,61 @@ class TestGLEntry(unittest.TestCase):
 			and debit = 0 and credit = '.01'""", jv.name)
 
 		self.assertTrue(round_off_entry)
+
+	def test_bulk_posting(self):
+		jv = make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+			"_Test Bank - _TC", 100, "_Test Cost Center - _TC", submit=True)
+
+		gl_map = frappe.db.sql("""select * from `tabGL Entry`
+			where voucher_type='Journal Entry' and voucher_no=%s order by account""", jv.name, as_dict=1)
+		old_names = [d.name for d in gl_map]
+
+		frappe.db.sql("""delete from `tabGL Entry` where voucher_type='Journal Entry' and voucher_no=%s""", jv.name)
+		for d in gl_map:
+			for fieldname in ("name", "owner", "creation", "modified", "modified_by", "docstatus", "idx"):
+				d.pop(fieldname, None)
+
+		make_gl_entries(gl_map, merge_entries=False, bulk=True)
+
+		new_gl_map = frappe.db.sql("""select * from `tabGL Entry`
+			where voucher_type='Journal Entry' and voucher_no=%s order by account""", jv.name, as_dict=1)
+
+		self.assertEqual(len(new_gl_map), len(old_names))
+		for d in new_gl_map:
+			self.assertEqual(d.docstatus, 1)
+			self.assertTrue(d.name not in old_names)
+
+		self.assertEqual(sum(flt(d.debit) for d in new_gl_map), 100)
+		self.assertEqual(sum(flt(d.credit) for d in new_gl_map), 100)
+
+	def test_bulk_posting_validates_links(self):
+		jv = make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+			"_Test Bank - _TC", 100, "_Test Cost Center - _TC", submit=True)
+
+		gl_map = frappe.db.sql("""select * from `tabGL Entry`
+			where voucher_type='Journal Entry' and voucher_no=%s order by account""", jv.name, as_dict=1)
+		for d in gl_map:
+			for fieldname in ("name", "owner", "creation", "modified", "modified_by", "docstatus", "idx"):
+				d.pop(fieldname, None)
+
+		gl_map[0].update({"against_voucher_type": "Sales Invoice", "against_voucher": "_Test Missing Invoice"})
+		self.assertRaises(frappe.LinkValidationError, make_gl_entries, gl_map, merge_entries=False, bulk=True)
+
+	def test_merge_similar_entries(self):
+		gl_map = []
+		for i in xrange(10000):
+			gl_map.append(frappe._dict({
+				"account": "_Test Account {0}".format(i % 1000),
+				"cost_center": "_Test Cost Center - _TC",
+				"debit": 1.0,
+				"debit_in_account_currency": 1.0
+			}))
+
+		merged_gl_map = merge_similar_entries(gl_map)
+
+		self.assertEqual(len(merged_gl_map), 1000)
+		self.assertEqual([d.account for d in merged_gl_map],
+			["_Test Account {0}".format(i) for i in xrange(1000)])
+		for d in merged_gl_map:
+			self.assertEqual(d.debit, 10)
+			self.assertEqual(d.debit_in_account_currency, 10)
@@ -403,7 +403,8 @@ class JournalEntry(AccountsController):
 				)
 
 		if gl_map:
-			make_gl_entries(gl_map, cancel=cancel, adv_adj=adv_adj)
+			# entries are made from the validated accounts table, posted together
+			make_gl_entries(gl_map, cancel=cancel, adv_adj=adv_adj, bulk=True)
 
 	def get_balance(self):
 		if not self.get('accounts'):
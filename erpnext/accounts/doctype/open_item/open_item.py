@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint, flt
+from frappe.model.document import Document
+from frappe.model.naming import set_new_name
+
+class OpenItem(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabOpen Item`
+		where Key_name="voucher_party_account" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabOpen Item`
+			add unique index voucher_party_account(voucher_type, voucher_no, party_type, party, account)""")
+
+	frappe.db.add_index("Open Item", ["party_type", "party", "account"])
+
+def use_open_items():
+	return cint(frappe.db.get_single_value("Accounts Settings", "maintain_open_items"))
+
+# A party GL Entry belongs to the open item of its against voucher, or of its own voucher
+# if it is not booked against any voucher. Amounts are positive when receivable from a Customer
+# or payable to a Supplier.
+open_item_voucher_type = "if(ifnull(against_voucher, '') = '', voucher_type, against_voucher_type)"
+open_item_voucher_no = "if(ifnull(against_voucher, '') = '', voucher_no, against_voucher)"
+
+open_item_amounts = """
+	if(party_type = 'Supplier', -1, 1) * sum(debit - credit) as outstanding_amount,
+	if(party_type = 'Supplier', -1, 1)
+		* sum(debit_in_account_currency - credit_in_account_currency) as outstanding_amount_in_account_currency,
+	if(party_type = 'Supplier', -1, 1) * sum(if(ifnull(against_voucher, '') = ''
+			or (against_voucher_type = voucher_type and against_voucher = voucher_no),
+		debit_in_account_currency - credit_in_account_currency, 0)) as invoice_amount,
+	min(posting_date) as posting_date"""
+
+def update_open_items(gl_entries):
+	"""Recompute open items of the vouchers referred by party GL Entries, after they are
+	posted or cancelled"""
+	if not gl_entries or not use_open_items():
+		return
+
+	vouchers = set()
+	for d in gl_entries:
+		if d.get("party_type") and d.get("party"):
+			vouchers.add((d.get("account"), d.get("party_type"), d.get("party"),
+				d.get("voucher_type"), d.get("voucher_no")))
+
+			if d.get("against_voucher_type") and d.get("against_voucher"):
+				vouchers.add((d.get("account"), d.get("party_type"), d.get("party"),
+					d.get("against_voucher_type"), d.get("against_voucher")))
+
+	for args in sorted(vouchers):
+		refresh_open_item(*args)
+
+def refresh_open_item(account, party_type, party, voucher_type, voucher_no):
+	values = {
+		"account": account,
+		"party_type": party_type,
+		"party": party,
+		"voucher_type": voucher_type,
+		"voucher_no": voucher_no
+	}
+
+	open_item = frappe.db.sql("""select company, account, party_type, party, {0}
+		from `tabGL Entry`
+		where account=%(account)s and party_type=%(party_type)s and party=%(party)s
+			and ((against_voucher_type=%(voucher_type)s and against_voucher=%(voucher_no)s)
+				or (voucher_type=%(voucher_type)s and voucher_no=%(voucher_no)s
+					and ifnull(against_voucher, '') = ''))
+		group by company, account, party_type, party""".format(open_item_amounts), values, as_dict=1)
+
+	name = frappe.db.sql("""select name from `tabOpen Item`
+		where voucher_type=%(voucher_type)s and voucher_no=%(voucher_no)s
+			and party_type=%(party_type)s and party=%(party)s and account=%(account)s
+		for update""", values)
+
+	if not open_item or is_settled(open_item[0]):
+		if name:
+			frappe.db.sql("delete from `tabOpen Item` where name=%s", name[0][0])
+		return
+
+	open_item = open_item[0]
+	if name:
+		frappe.db.sql("""update `tabOpen Item`
+			set posting_date=%(posting_date)s, invoice_amount=%(invoice_amount)s,
+				outstanding_amount=%(outstanding_amount)s,
+				outstanding_amount_in_account_currency=%(outstanding_amount_in_account_currency)s
+			where name=%(name)s""", dict(open_item, name=name[0][0]))
+	else:
+		make_open_item(open_item, voucher_type, voucher_no)
+
+def make_open_item(values, voucher_type, voucher_no):
+	open_item = frappe.get_doc({
+		"doctype": "Open Item",
+		"company": values.company,
+		"account": values.account,
+		"party_type": values.party_type,
+		"party": values.party,
+		"voucher_type": voucher_type,
+		"voucher_no": voucher_no,
+		"posting_date": values.posting_date,
+		"invoice_amount": flt(values.invoice_amount),
+		"outstanding_amount": flt(values.outstanding_amount),
+		"outstanding_amount_in_account_currency": flt(values.outstanding_amount_in_account_currency)
+	})
+	set_new_name(open_item)
+	open_item.db_insert()
+
+def is_settled(open_item):
+	precision = frappe.get_precision("Sales Invoice", "outstanding_amount")
+	return not (flt(open_item.outstanding_amount, precision)
+		or flt(open_item.outstanding_amount_in_account_currency, precision))
+
+def get_open_items_from_gl(company):
+	"""Returns open items of the company as per GL Entries"""
+	return [d for d in frappe.db.sql("""select company, account, party_type, party,
+			{0} as voucher_type, {1} as voucher_no, {2}
+		from `tabGL Entry`
+		where company=%s and ifnull(party_type, '') != '' and ifnull(party, '') != ''
+		group by account, party_type, party, {0}, {1}""".format(open_item_voucher_type,
+			open_item_voucher_no, open_item_amounts), company, as_dict=1) if not is_settled(d)]
+
+def rebuild_open_items(company):
+	"""Regenerate open items of the company from GL Entries"""
+	frappe.db.sql("delete from `tabOpen Item` where company=%s", company)
+
+	for d in get_open_items_from_gl(company):
+		make_open_item(d, d.voucher_type, d.voucher_no)
+
+def check_open_items(company):
+	"""Returns list of open items that do not match GL Entries, with the amount
+	outstanding as per GL Entries and as per Open Item"""
+	precision = frappe.get_precision("Sales Invoice", "outstanding_amount")
+	fields = ("outstanding_amount", "outstanding_amount_in_account_currency", "invoice_amount")
+
+	def get_key(d):
+		return (d.voucher_type, d.voucher_no, d.party_type, d.party, d.account)
+
+	expected = dict((get_key(d), d) for d in get_open_items_from_gl(company))
+	actual = dict((get_key(d), d) for d in frappe.db.sql("""select voucher_type, voucher_no,
+		party_type, party, account, {0} from `tabOpen Item` where company=%s""".format(", ".join(fields)),
+		company, as_dict=1))
+
+	mismatches = []
+	for key in sorted(set(expected.keys() + actual.keys())):
+		gl, open_item = expected.get(key, {}), actual.get(key, {})
+		if any(flt(gl.get(f), precision) != flt(open_item.get(f), precision) for f in fields):
+			mismatches.append(frappe._dict({
+				"voucher_type": key[0],
+				"voucher_no": key[1],
+				"party_type": key[2],
+				"party": key[3],
+				"account": key[4],
+				"outstanding_as_per_gl": flt(gl.get("outstanding_amount"), precision),
+				"outstanding_as_per_open_item": flt(open_item.get("outstanding_amount"), precision)
+			}))
+
+	return mismatches
+
+def get_open_invoices(party_type, party, account, condition=None):
+	"""Open items with positive outstanding, in the format of `get_outstanding_invoices`.
+	`condition` may filter on `posting_date` and `invoice_amount`"""
+	precision = frappe.get_precision("Sales Invoice", "outstanding_amount")
+
+	return [{
+		'voucher_no': d.voucher_no,
+		'voucher_type': d.voucher_type,
+		'posting_date': d.posting_date,
+		'invoice_amount': flt(d.invoice_amount),
+		'payment_amount': flt(d.invoice_amount) - flt(d.outstanding_amount_in_account_currency),
+		'outstanding_amount': flt(d.outstanding_amount_in_account_currency, precision)
+	} for d in frappe.db.sql("""select voucher_type, voucher_no, posting_date,
+			invoice_amount, outstanding_amount_in_account_currency
+		from `tabOpen Item`
+		where party_type=%(party_type)s and party=%(party)s and account=%(account)s
+			and invoice_amount > 0 and outstanding_amount_in_account_currency > 0.005 {0}
+		order by posting_date, voucher_no""".format(condition or ""),
+		{"party_type": party_type, "party": party, "account": account}, as_dict=1)]
+
+def get_party_outstanding(party_type, party, company):
+	"""Total outstanding of the party in company currency"""
+	return flt(frappe.db.sql("""select sum(outstanding_amount) from `tabOpen Item`
+		where party_type=%s and party=%s and company=%s""", (party_type, party, company))[0][0])
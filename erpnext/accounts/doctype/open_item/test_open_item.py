@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import flt, nowdate
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from erpnext.accounts.doctype.journal_entry.journal_entry import get_payment_entry_against_invoice
+from erpnext.accounts.doctype.open_item.open_item import rebuild_open_items, check_open_items
+
+class TestOpenItem(unittest.TestCase):
+	def setUp(self):
+		frappe.db.set_value("Accounts Settings", None, "maintain_open_items", 1)
+		rebuild_open_items("_Test Company")
+
+	def tearDown(self):
+		frappe.db.set_value("Accounts Settings", None, "maintain_open_items", 0)
+
+	def get_outstanding(self, voucher_type, voucher_no):
+		return flt(frappe.db.get_value("Open Item", {"voucher_type": voucher_type,
+			"voucher_no": voucher_no}, "outstanding_amount"))
+
+	def test_open_item_on_payment(self):
+		si = create_sales_invoice(rate=500)
+		self.assertEqual(self.get_outstanding("Sales Invoice", si.name), 500)
+
+		jv = get_payment_entry_against_invoice("Sales Invoice", si.name, amount=200, journal_entry=True)
+		jv.cheque_no = "112233"
+		jv.cheque_date = nowdate()
+		jv.insert()
+		jv.submit()
+
+		self.assertEqual(self.get_outstanding("Sales Invoice", si.name), 300)
+		self.assertEqual(flt(frappe.db.get_value("Sales Invoice", si.name, "outstanding_amount")), 300)
+		self.assertEqual(check_open_items("_Test Company"), [])
+
+		jv.cancel()
+		self.assertEqual(self.get_outstanding("Sales Invoice", si.name), 500)
+
+		si.cancel()
+		self.assertFalse(frappe.db.exists("Open Item", {"voucher_type": "Sales Invoice", "voucher_no": si.name}))
+		self.assertEqual(check_open_items("_Test Company"), [])
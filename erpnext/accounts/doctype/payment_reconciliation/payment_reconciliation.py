@@ -7,6 +7,7 @@ from frappe.utils import flt
 from frappe import msgprint, _
 from frappe.model.document import Document
 from erpnext.accounts.utils import get_outstanding_invoices
+from erpnext.accounts.doctype.open_item.open_item import use_open_items
 
 class PaymentReconciliation(Document):
 	def get_unreconciled_entries(self):
@@ -157,7 +158,9 @@ class PaymentReconciliation(Document):
 		cond = " and posting_date >= '{0}'".format(frappe.db.escape(self.from_date)) if self.from_date else ""
 		cond += " and posting_date <= '{0}'".format(frappe.db.escape(self.to_date)) if self.to_date else ""
 
-		if self.party_type == "Customer":
+		if use_open_items():
+			dr_or_cr = "invoice_amount"
+		elif self.party_type == "Customer":
 			dr_or_cr = "debit_in_account_currency"
 		else:
 			dr_or_cr = "credit_in_account_currency"
@@ -8,7 +8,7 @@ import frappe
 import json
 import copy
 from frappe import throw, _
-from frappe.utils import flt, cint
+from frappe.utils import flt, cint, cstr, getdate
 from frappe.model.document import Document
 
 class MultiplePricingRuleConflict(frappe.ValidationError): pass
@@ -109,14 +109,47 @@ def apply_pricing_rule(args):
 	item_list = args.get("items")
 	args.pop("items")
 
+	set_party_details(args)
+	item_details_map = get_item_details_map([item.get("item_code") for item in item_list])
+	index = get_pricing_rule_index()
+
 	for item in item_list:
 		args_copy = copy.deepcopy(args)
 		args_copy.update(item)
-		out.append(get_pricing_rule_for_item(args_copy))
+
+		item_details = item_details_map.get(args_copy.item_code)
+		if item_details:
+			for fieldname in ("item_group", "brand", "variant_of"):
+				if not args_copy.get(fieldname):
+					args_copy[fieldname] = item_details.get(fieldname)
+
+		out.append(get_pricing_rule_for_item(args_copy, index))
 
 	return out
 
-def get_pricing_rule_for_item(args):
+def set_party_details(args):
+	if args.transaction_type=="selling":
+		if args.customer and not (args.customer_group and args.territory):
+			customer = frappe.db.get_value("Customer", args.customer, ["customer_group", "territory"])
+			if customer:
+				args.customer_group, args.territory = customer
+
+		args.supplier = args.supplier_type = None
+
+	elif args.supplier and not args.supplier_type:
+		args.supplier_type = frappe.db.get_value("Supplier", args.supplier, "supplier_type")
+		args.customer = args.customer_group = args.territory = None
+
+def get_item_details_map(item_codes):
+	item_codes = list(set(filter(None, item_codes)))
+	if not item_codes:
+		return {}
+
+	return dict((d.name, d) for d in frappe.db.sql("""select name, item_group, brand, variant_of
+		from tabItem where name in ({0})""".format(", ".join(["%s"] * len(item_codes))),
+		tuple(item_codes), as_dict=1))
+
+def get_pricing_rule_for_item(args, index=None):
 	if args.get("parenttype") == "Material Request": return {}
 
 	item_details = frappe._dict({
@@ -137,19 +170,9 @@ def get_pricing_rule_for_item(args):
 		if not args.item_group:
 			frappe.throw(_("Item Group not mentioned in item master for item {0}").format(args.item_code))
 
-	if args.transaction_type=="selling":
-		if args.customer and not (args.customer_group and args.territory):
-			customer = frappe.db.get_value("Customer", args.customer, ["customer_group", "territory"])
-			if customer:
-				args.customer_group, args.territory = customer
+	set_party_details(args)
 
-		args.supplier = args.supplier_type = None
-
-	elif args.supplier and not args.supplier_type:
-		args.supplier_type = frappe.db.get_value("Supplier", args.supplier, "supplier_type")
-		args.customer = args.customer_group = args.territory = None
-
-	pricing_rules = get_pricing_rules(args)
+	pricing_rules = get_pricing_rules(args, index)
 	pricing_rule = filter_pricing_rules(args, pricing_rules)
 
 	if pricing_rule:
@@ -167,71 +190,130 @@ def get_pricing_rule_for_item(args):
 			item_details.discount_percentage = pricing_rule.discount_percentage
 	return item_details
 
-def get_pricing_rules(args):
-	def _get_tree_conditions(parenttype, allow_blank=True):
-		field = frappe.scrub(parenttype)
-		condition = ""
-		if args.get(field):
-			try:
-				lft, rgt = frappe.db.get_value(parenttype, args[field], ["lft", "rgt"])
-			except TypeError:
-				frappe.throw(_("Invalid {0}").format(args[field]))
-
-			parent_groups = frappe.db.sql_list("""select name from `tab%s`
-				where lft<=%s and rgt>=%s""" % (parenttype, '%s', '%s'), (lft, rgt))
+def get_pricing_rules(args, index=None):
+	"""Returns active Pricing Rules applicable for the item and party in `args`,
+	looked up in the pricing rule index"""
+	if not index:
+		index = get_pricing_rule_index()
 
-			if parent_groups:
-				if allow_blank: parent_groups.append('')
-				condition = " ifnull("+field+", '') in ('" + \
-					"', '".join([frappe.db.escape(d) for d in parent_groups])+"')"
-		return condition
+	# load variant of if not defined
+	if "variant_of" not in args:
+		args.variant_of = frappe.db.get_value("Item", args.item_code, "variant_of")
 
+	names = set(index.item_code.get(args.item_code, []))
+	if args.variant_of:
+		names.update(index.item_code.get(args.variant_of, []))
+	if args.brand:
+		names.update(index.brand.get(args.brand, []))
+	for item_group in get_ancestors(index, "Item Group", args.item_group):
+		names.update(index.item_group.get(item_group, []))
+
+	if not names:
+		return []
+
+	customer_groups = get_ancestors(index, "Customer Group", args.get("customer_group"))
+	territories = get_ancestors(index, "Territory", args.get("territory"))
+	transaction_date = getdate(args.transaction_date) if args.get("transaction_date") else None
+	if not args.price_list: args.price_list = None
 
-	conditions = item_variant_condition = ""
-	values =  {"item_code": args.get("item_code"), "brand": args.get("brand")}
+	pricing_rules = []
+	for name in names:
+		rule = index.rules[name]
+		if not cint(rule.get(args.transaction_type)):
+			continue
+
+		if not all((rule.get(field) or "") in ((args.get(field), "") if args.get(field) else ("",))
+			for field in ["company", "customer", "supplier", "supplier_type", "campaign", "sales_partner"]):
+				continue
+
+		if (customer_groups and (rule.customer_group or "") not in customer_groups) \
+			or (territories and (rule.territory or "") not in territories):
+				continue
+
+		if (rule.for_price_list or "") not in (args.price_list, ""):
+			continue
+
+		if transaction_date and not (getdate(rule.valid_from or "2000-01-01") <= transaction_date
+			<= getdate(rule.valid_upto or "2500-12-31")):
+				continue
+
+		pricing_rules.append(frappe._dict(rule))
+
+	return sorted(pricing_rules, key=lambda d: (cstr(d.priority), d.name), reverse=True)
+
+def get_ancestors(index, doctype, name):
+	"""Returns name and all its parent groups (with blank, for party trees) or empty list"""
+	if not name:
+		return []
+
+	ancestors = index.ancestors[doctype].get(name)
+	if ancestors is None:
+		frappe.throw(_("Invalid {0}").format(name))
+
+	return ancestors + [""] if doctype != "Item Group" else ancestors
+
+def get_pricing_rule_index():
+	"""Active Pricing Rules keyed by item code, item group and brand, with the parent groups
+	of Item Group, Customer Group and Territory. Cached for the request and in redis, and
+	rebuilt when Pricing Rules or the group trees change"""
+	fingerprint = get_pricing_rule_fingerprint()
+
+	index = getattr(frappe.local, "pricing_rule_index", None)
+	if not index or index.fingerprint != fingerprint:
+		index = frappe.cache().get_value("pricing_rule_index")
+		if not index or index.fingerprint != fingerprint:
+			index = build_pricing_rule_index()
+			index.fingerprint = fingerprint
+			frappe.cache().set_value("pricing_rule_index", index)
+
+		frappe.local.pricing_rule_index = index
+
+	return index
+
+def get_pricing_rule_fingerprint():
+	return tuple(cstr(v) for v in frappe.db.sql("""select
+		(select count(name) from `tabPricing Rule`), (select max(modified) from `tabPricing Rule`),
+		(select count(name) from `tabItem Group`), (select max(modified) from `tabItem Group`),
+		(select count(name) from `tabCustomer Group`), (select max(modified) from `tabCustomer Group`),
+		(select count(name) from `tabTerritory`), (select max(modified) from `tabTerritory`)""")[0])
+
+def build_pricing_rule_index():
+	index = frappe._dict({
+		"rules": {},
+		"item_code": {},
+		"item_group": {},
+		"brand": {},
+		"ancestors": {}
+	})
 
-	for field in ["company", "customer", "supplier", "supplier_type", "campaign", "sales_partner"]:
-		if args.get(field):
-			conditions += " and ifnull("+field+", '') in (%("+field+")s, '')"
-			values[field] = args.get(field)
-		else:
-			conditions += " and ifnull("+field+", '') = ''"
+	for rule in frappe.db.sql("""select * from `tabPricing Rule`
+		where docstatus < 2 and disable = 0""", as_dict=1):
+			index.rules[rule.name] = rule
+			for fieldname in ("item_code", "item_group", "brand"):
+				if rule.get(fieldname):
+					index[fieldname].setdefault(rule.get(fieldname), []).append(rule.name)
 
-	for parenttype in ["Customer Group", "Territory"]:
-		group_condition = _get_tree_conditions(parenttype)
-		if group_condition:
-			conditions += " and " + group_condition
+	for doctype in ("Item Group", "Customer Group", "Territory"):
+		index.ancestors[doctype] = get_ancestors_map(doctype)
 
-	if not args.price_list: args.price_list = None
-	conditions += " and ifnull(for_price_list, '') in (%(price_list)s, '')"
-	values["price_list"] = args.get("price_list")
+	return index
 
-	if args.get("transaction_date"):
-		conditions += """ and %(transaction_date)s between ifnull(valid_from, '2000-01-01')
-			and ifnull(valid_upto, '2500-12-31')"""
-		values['transaction_date'] = args.get('transaction_date')
+def get_ancestors_map(doctype):
+	"""Returns map of every node in the tree to the list of itself and its parents"""
+	ancestors, parents = {}, []
+	for name, lft, rgt in frappe.db.sql("""select name, lft, rgt from `tab{0}`
+		order by lft""".format(doctype)):
+			while parents and parents[-1][1] < lft:
+				parents.pop()
 
-	item_group_condition = _get_tree_conditions("Item Group", False)
-	if item_group_condition:
-		item_group_condition = " or " + item_group_condition
+			parents.append((name, rgt))
+			ancestors[name] = [d[0] for d in parents]
 
-	# load variant of if not defined
-	if "variant_of" not in args:
-		args.variant_of = frappe.db.get_value("Item", args.item_code, "variant_of")
+	return ancestors
 
-	if args.variant_of:
-		item_variant_condition = ' or item_code=%(variant_of)s '
-		values['variant_of'] = args.variant_of
-
-	return frappe.db.sql("""select * from `tabPricing Rule`
-		where (item_code=%(item_code)s {item_variant_condition} {item_group_condition} or brand=%(brand)s)
-			and docstatus < 2 and disable = 0
-			and {transaction_type} = 1 {conditions}
-		order by priority desc, name desc""".format(
-			item_group_condition = item_group_condition,
-			item_variant_condition = item_variant_condition,
-			transaction_type = args.transaction_type,
-			conditions = conditions), values, as_dict=1)
+def clear_pricing_rule_cache():
+	frappe.local.pricing_rule_index = None
+	frappe.cache().delete_value("pricing_rule_index")
 
 def filter_pricing_rules(args, pricing_rules):
 	# filter for qty
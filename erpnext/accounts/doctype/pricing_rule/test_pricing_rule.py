@@ -5,6 +5,7 @@
 from __future__ import unicode_literals
 import unittest
 import frappe
+from erpnext.accounts.doctype.pricing_rule.pricing_rule import clear_pricing_rule_cache
 
 class TestPricingRule(unittest.TestCase):
 	def test_pricing_rule_for_discount(self):
@@ -77,6 +78,7 @@ class TestPricingRule(unittest.TestCase):
 		self.assertEquals(details.get("discount_percentage"), 5)
 
 		frappe.db.sql("update `tabPricing Rule` set priority=NULL where campaign='_Test Campaign'")
+		clear_pricing_rule_cache()
 		from erpnext.accounts.doctype.pricing_rule.pricing_rule	import MultiplePricingRuleConflict
 		self.assertRaises(MultiplePricingRuleConflict, get_item_details, args)
 
@@ -203,3 +205,35 @@ class TestPricingRule(unittest.TestCase):
 
 		details = get_item_details(args)
 		self.assertEquals(details.get("discount_percentage"), 17.5)
+
+	def test_apply_pricing_rule_for_multiple_items(self):
+		from erpnext.accounts.doctype.pricing_rule.pricing_rule import apply_pricing_rule
+
+		frappe.db.sql("delete from `tabPricing Rule`")
+
+		for item_code, discount in (("_Test Item", 10), ("_Test Item 2", 12)):
+			frappe.get_doc({
+				"doctype": "Pricing Rule",
+				"title": "_Test Pricing Rule for " + item_code,
+				"apply_on": "Item Code",
+				"item_code": item_code,
+				"selling": 1,
+				"price_or_discount": "Discount Percentage",
+				"price": 0,
+				"discount_percentage": discount,
+				"company": "_Test Company"
+			}).insert()
+
+		details = apply_pricing_rule({
+			"company": "_Test Company",
+			"price_list": "_Test Price List",
+			"doctype": "Sales Order",
+			"transaction_type": "selling",
+			"customer": "_Test Customer",
+			"items": [{"doctype": "Sales Order Item", "name": str(i), "item_code": item_code, "qty": 1}
+				for i, item_code in enumerate(["_Test Item", "_Test Item 2", "_Test Item Home Desktop 100"])]
+		})
+
+		self.assertEquals([d.get("discount_percentage") for d in details], [10, 12, None])
+
+		frappe.db.sql("delete from `tabPricing Rule`")
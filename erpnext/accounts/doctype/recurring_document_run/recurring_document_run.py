@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint, flt, now_datetime, time_diff_in_seconds
+from frappe.model.document import Document
+
+class RecurringDocumentRun(Document):
+	pass
+
+def make_run(reference_doctype, next_date, total_documents):
+	run = frappe.get_doc({
+		"doctype": "Recurring Document Run",
+		"reference_doctype": reference_doctype,
+		"next_date": next_date,
+		"total_documents": total_documents,
+		"status": "In Progress",
+		"started_at": now_datetime()
+	})
+	run.flags.ignore_permissions = True
+	run.insert()
+
+	return run
+
+def get_run_in_progress(reference_doctype, next_date, timeout=3600):
+	"""Returns the run in progress for the doctype and date, a run that is not updated
+	within `timeout` seconds is marked as Interrupted, as its jobs are lost"""
+	for name, modified in frappe.db.sql("""select name, modified from `tabRecurring Document Run`
+		where reference_doctype=%s and next_date=%s and status='In Progress'""", (reference_doctype, next_date)):
+		if time_diff_in_seconds(now_datetime(), modified) < timeout:
+			return name
+
+		frappe.db.set_value("Recurring Document Run", name, "status", "Interrupted")
+
+def update_run(run, created=0, skipped=0, failed=0, error_log=None):
+	"""Add the outcome of one job to the run, and close the run when all its documents are done"""
+	frappe.db.sql("""update `tabRecurring Document Run`
+		set created = created + %s, skipped = skipped + %s, failed = failed + %s,
+			error_log = concat(ifnull(error_log, ''), %s), modified = %s
+		where name = %s""", (created, skipped, failed, error_log or "", now_datetime(), run))
+
+	# row is locked by the update above, so only the last job closes the run
+	run = frappe.db.get_value("Recurring Document Run", run, ["name", "total_documents", "created",
+		"skipped", "failed", "started_at"], as_dict=1)
+
+	if cint(run.created) + cint(run.skipped) + cint(run.failed) >= cint(run.total_documents):
+		finished_at = now_datetime()
+		seconds = time_diff_in_seconds(finished_at, run.started_at)
+
+		frappe.db.set_value("Recurring Document Run", run.name, {
+			"status": "Completed with Errors" if run.failed else "Completed",
+			"finished_at": finished_at,
+			"documents_per_minute": flt(run.created * 60.0 / seconds, 2) if seconds > 0 else flt(run.created)
+		})
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import get_first_day, get_last_day, getdate, nowdate
+from erpnext.controllers.recurring_document import make_recurring_documents, get_next_date
+from erpnext.accounts.doctype.recurring_document_run.recurring_document_run import make_run
+
+class TestRecurringDocumentRun(unittest.TestCase):
+	def test_recurring_documents_made_once(self):
+		today = nowdate()
+		si = frappe.copy_doc(frappe.get_test_records("Sales Invoice")[0])
+		si.update({
+			"is_recurring": 1,
+			"recurring_type": "Monthly",
+			"notify_by_email": 0,
+			"repeat_on_day_of_month": getdate(today).day,
+			"posting_date": today,
+			"due_date": None,
+			"from_date": get_first_day(today),
+			"to_date": get_last_day(today)
+		})
+		si.insert()
+		si.submit()
+
+		next_date = get_next_date(today, 1, si.repeat_on_day_of_month)
+		run = make_run("Sales Invoice", next_date, 2)
+
+		# the second job finds the document already made for the date
+		for i in xrange(2):
+			make_recurring_documents("Sales Invoice", [si.name], next_date, run=run.name, commit=False)
+
+		self.assertEqual(frappe.db.sql("""select count(*) from `tabSales Invoice`
+			where recurring_id=%s and posting_date=%s and docstatus < 2""", (si.recurring_id, next_date))[0][0], 1)
+
+		run.load_from_db()
+		self.assertEqual((run.created, run.skipped, run.failed), (1, 1, 0))
+		self.assertEqual(run.status, "Completed")
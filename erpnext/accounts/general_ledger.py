@@ -3,7 +3,7 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import flt, cstr, cint
+from frappe.utils import flt, cstr, cint, getdate, now
 from frappe import _
 from frappe.model.meta import get_field_precision
 from erpnext.accounts.utils import validate_expense_against_budget
@@ -11,12 +11,19 @@ from erpnext.accounts.utils import validate_expense_against_budget
 
 class StockAccountInvalidTransaction(frappe.ValidationError): pass
 
-def make_gl_entries(gl_map, cancel=False, adv_adj=False, merge_entries=True, update_outstanding='Yes'):
+def make_gl_entries(gl_map, cancel=False, adv_adj=False, merge_entries=True, update_outstanding='Yes',
+		bulk=False):
+	"""Post the GL Entries of a voucher. With `bulk`, GL Entry validations are run for all entries
+	against masters loaded once, and all entries are inserted with a single multi-row insert,
+	without running the GL Entry document hooks"""
 	if gl_map:
 		if not cancel:
 			gl_map = process_gl_map(gl_map, merge_entries)
 			if gl_map and len(gl_map) > 1:
-				save_entries(gl_map, adv_adj, update_outstanding)
+				if bulk:
+					save_entries_in_bulk(gl_map, adv_adj, update_outstanding)
+				else:
+					save_entries(gl_map, adv_adj, update_outstanding)
 			else:
 				frappe.throw(_("Incorrect number of General Ledger Entries found. You might have selected a wrong Account in the transaction."))
 		else:
@@ -50,10 +57,12 @@ def process_gl_map(gl_map, merge_entries=True):
 
 def merge_similar_entries(gl_map):
 	merged_gl_map = []
+	merged_entries = {}
 	for entry in gl_map:
 		# if there is already an entry in this account then just add it
 		# to that entry
-		same_head = check_if_in_list(entry, merged_gl_map)
+		key = get_merge_key(entry)
+		same_head = merged_entries.get(key)
 		if same_head:
 			same_head.debit	= flt(same_head.debit) + flt(entry.debit)
 			same_head.debit_in_account_currency	= \
@@ -62,21 +71,18 @@ def merge_similar_entries(gl_map):
 			same_head.credit_in_account_currency = \
 				flt(same_head.credit_in_account_currency) + flt(entry.credit_in_account_currency)
 		else:
+			merged_entries[key] = entry
 			merged_gl_map.append(entry)
 
 	# filter zero debit and credit entries
 	merged_gl_map = filter(lambda x: flt(x.debit, 9)!=0 or flt(x.credit, 9)!=0, merged_gl_map)
 	return merged_gl_map
 
-def check_if_in_list(gle, gl_map):
-	for e in gl_map:
-		if e.account == gle.account \
-			and cstr(e.get('party_type'))==cstr(gle.get('party_type')) \
-			and cstr(e.get('party'))==cstr(gle.get('party')) \
-			and cstr(e.get('against_voucher'))==cstr(gle.get('against_voucher')) \
-			and cstr(e.get('against_voucher_type')) == cstr(gle.get('against_voucher_type')) \
-			and cstr(e.get('cost_center')) == cstr(gle.get('cost_center')):
-				return e
+def get_merge_key(gle):
+	"""entries with the same key are merged into a single entry"""
+	return (gle.account, cstr(gle.get('party_type')), cstr(gle.get('party')),
+		cstr(gle.get('against_voucher')), cstr(gle.get('against_voucher_type')),
+		cstr(gle.get('cost_center')))
 
 def save_entries(gl_map, adv_adj, update_outstanding):
 	validate_account_for_auto_accounting_for_stock(gl_map)
@@ -87,6 +93,8 @@ def save_entries(gl_map, adv_adj, update_outstanding):
 		# check against budget
 		validate_expense_against_budget(entry)
 
+	update_gl_aggregates(gl_map)
+
 def make_entry(args, adv_adj, update_outstanding):
 	args.update({"doctype": "GL Entry"})
 	gle = frappe.get_doc(args)
@@ -95,6 +103,223 @@ def make_entry(args, adv_adj, update_outstanding):
 	gle.run_method("on_update_with_args", adv_adj, update_outstanding)
 	gle.submit()
 
+def save_entries_in_bulk(gl_map, adv_adj, update_outstanding):
+	"""Validate the whole gl_map against preloaded masters and insert all entries with
+	a single query, instead of a GL Entry document per entry"""
+	from erpnext.accounts.doctype.gl_entry.gl_entry import validate_balance_type, \
+		check_freezing_date, update_outstanding_amt
+
+	validate_account_for_auto_accounting_for_stock(gl_map)
+	round_off_debit_credit(gl_map)
+
+	accounts = validate_gl_map(gl_map, adv_adj)
+
+	for posting_date in set(getdate(entry.posting_date) for entry in gl_map):
+		check_freezing_date(posting_date, adv_adj)
+
+	insert_gl_entries(gl_map)
+	update_gl_aggregates(gl_map)
+
+	for account in set(entry.account for entry in gl_map):
+		if accounts[account].balance_must_be:
+			validate_balance_type(account, adv_adj)
+
+	if update_outstanding == 'Yes':
+		against_vouchers = set()
+		for entry in gl_map:
+			if entry.get("against_voucher_type") in ['Journal Entry', 'Sales Invoice', 'Purchase Invoice'] \
+				and entry.get("against_voucher"):
+					against_vouchers.add((entry.account, entry.get("party_type"), entry.get("party"),
+						entry.against_voucher_type, entry.against_voucher))
+
+		for args in sorted(against_vouchers):
+			update_outstanding_amt(*args)
+
+	# check against budget, once per expense account and cost center
+	budget_checked = set()
+	for entry in gl_map:
+		key = (entry.account, entry.get("cost_center"), entry.fiscal_year, getdate(entry.posting_date))
+		if accounts[entry.account].root_type == "Expense" and key not in budget_checked:
+			budget_checked.add(key)
+			validate_expense_against_budget(entry)
+
+def validate_gl_map(gl_map, adv_adj):
+	"""Validations of GL Entry, run for all entries against masters loaded once,
+	returns map of account details"""
+	from erpnext.accounts.party import validate_party_frozen_disabled, validate_party_gle_currency
+	from erpnext.accounts.utils import get_fiscal_year, validate_fiscal_year
+	from erpnext.setup.doctype.company.company import get_company_currency
+	from erpnext.exceptions import InvalidAccountCurrency
+
+	accounts = get_details_map("Account", [entry.account for entry in gl_map],
+		["name", "is_group", "docstatus", "company", "report_type", "root_type", "account_type",
+			"account_currency", "freeze_account", "balance_must_be"])
+	cost_center_company = dict((d.name, d.company) for d in get_details_map("Cost Center",
+		[entry.get("cost_center") for entry in gl_map], ["name", "company"]).values())
+
+	company_currency = get_company_currency(gl_map[0].company)
+	frozen_accounts_modifier = frappe.db.get_value('Accounts Settings', None, 'frozen_accounts_modifier')
+
+	parties, fiscal_years, validated_fiscal_years = set(), {}, set()
+	for entry in gl_map:
+		for k in ('account', 'remarks', 'voucher_type', 'voucher_no', 'company'):
+			if not entry.get(k):
+				frappe.throw(_("{0} is required").format(_(frappe.get_meta("GL Entry").get_label(k))))
+
+		account = accounts.get(entry.account)
+		if not account:
+			frappe.throw(_("Account {0} does not exist").format(entry.account))
+
+		if account.account_type in ["Receivable", "Payable"] and not (entry.get("party_type") and entry.get("party")):
+			frappe.throw(_("Party Type and Party is required for Receivable / Payable account {0}").format(entry.account))
+
+		if not (flt(entry.debit) or flt(entry.credit)):
+			frappe.throw(_("Either debit or credit amount is required for {0}").format(entry.account))
+
+		if account.report_type == "Profit and Loss":
+			if not entry.get("cost_center") and entry.voucher_type != 'Period Closing Voucher':
+				frappe.throw(_("Cost Center is required for 'Profit and Loss' account {0}").format(entry.account))
+
+			if entry.get("is_opening") == 'Yes':
+				frappe.throw(_("'Profit and Loss' type account {0} not allowed in Opening Entry").format(entry.account))
+
+		elif entry.get("cost_center"):
+			entry.cost_center = None
+
+		if entry.get("cost_center") and cost_center_company.get(entry.cost_center) != entry.company:
+			frappe.throw(_("Cost Center {0} does not belong to Company {1}").format(entry.cost_center, entry.company))
+
+		if account.is_group == 1:
+			frappe.throw(_("Account {0} cannot be a Group").format(entry.account))
+
+		if account.docstatus == 2:
+			frappe.throw(_("Account {0} is inactive").format(entry.account))
+
+		if account.company != entry.company:
+			frappe.throw(_("Account {0} does not belong to Company {1}").format(entry.account, entry.company))
+
+		if account.freeze_account == 'Yes' and not adv_adj:
+			if not frozen_accounts_modifier:
+				frappe.throw(_("Account {0} is frozen").format(entry.account))
+			elif frozen_accounts_modifier not in frappe.get_roles():
+				frappe.throw(_("Not authorized to edit frozen Account {0}").format(entry.account))
+
+		if not entry.get("account_currency"):
+			entry.account_currency = company_currency
+
+		if (account.account_currency or company_currency) != entry.account_currency:
+			frappe.throw(_("Accounting Entry for {0} can only be made in currency: {1}")
+				.format(entry.account, (account.account_currency or company_currency)), InvalidAccountCurrency)
+
+		if entry.get("party_type") and entry.get("party"):
+			parties.add((entry.party_type, entry.party, entry.company, entry.account_currency))
+
+		posting_date = getdate(entry.posting_date)
+		if not entry.get("fiscal_year"):
+			if posting_date not in fiscal_years:
+				fiscal_years[posting_date] = get_fiscal_year(posting_date, company=entry.company)[0]
+			entry.fiscal_year = fiscal_years[posting_date]
+
+		elif (posting_date, entry.fiscal_year) not in validated_fiscal_years:
+			validate_fiscal_year(posting_date, entry.fiscal_year, _("Posting Date"))
+			validated_fiscal_years.add((posting_date, entry.fiscal_year))
+
+	validate_links(gl_map)
+
+	for party_type, party in set((d[0], d[1]) for d in parties):
+		validate_party_frozen_disabled(party_type, party)
+
+	for party_type, party, company, account_currency in parties:
+		validate_party_gle_currency(party_type, party, company, account_currency)
+
+	return accounts
+
+def validate_links(gl_map):
+	"""Link and Dynamic Link values of all entries must exist, checked with a query per linked doctype"""
+	fields = [df for df in frappe.get_meta("GL Entry").fields if df.fieldtype in ("Link", "Dynamic Link")]
+
+	links = {}
+	for entry in gl_map:
+		for df in fields:
+			doctype = df.options if df.fieldtype == "Link" else entry.get(df.options)
+			if doctype and entry.get(df.fieldname):
+				links.setdefault(doctype, {}).setdefault(entry.get(df.fieldname), df)
+
+	for doctype, values in links.items():
+		existing = set(d.lower() for d in get_details_map(doctype, values.keys(), ["name"]))
+		for value, df in values.items():
+			if value.lower() not in existing:
+				frappe.throw(_("Could not find {0}: {1}").format(_(df.label), value), frappe.LinkValidationError)
+
+def get_details_map(doctype, names, fields):
+	names = list(set(filter(None, names)))
+	if not names:
+		return {}
+
+	return dict((d.name, d) for d in frappe.db.sql("""select {0} from `tab{1}` where name in ({2})"""
+		.format(", ".join(fields), doctype, ", ".join(["%s"] * len(names))), tuple(names), as_dict=1))
+
+def insert_gl_entries(gl_map, chunk_size=500):
+	"""Insert submitted GL Entries, `chunk_size` rows per query"""
+	meta = frappe.get_meta("GL Entry")
+	columns = [c for c in meta.get_valid_columns()
+		if c not in ("name", "owner", "creation", "modified", "modified_by", "docstatus", "idx")]
+	amount_fields = [df.fieldname for df in meta.fields if df.fieldtype in ("Currency", "Float")]
+
+	timestamp, user = now(), frappe.session.user
+	names = get_gl_entry_names(len(gl_map))
+
+	for start in xrange(0, len(gl_map), chunk_size):
+		values = []
+		for name, entry in zip(names[start:start + chunk_size], gl_map[start:start + chunk_size]):
+			entry.setdefault("is_opening", "No")
+			entry.setdefault("is_advance", "No")
+			entry.name = name
+			for fieldname in amount_fields:
+				entry[fieldname] = flt(entry.get(fieldname))
+
+			values.append([name, user, timestamp, timestamp, user, 1, 0] + [entry.get(c) for c in columns])
+
+		frappe.db.sql("""insert into `tabGL Entry` (`name`, `owner`, `creation`, `modified`,
+			`modified_by`, `docstatus`, `idx`, {0}) values {1}""".format(
+				", ".join("`{0}`".format(c) for c in columns),
+				", ".join(["({0})".format(", ".join(["%s"] * (len(columns) + 7)))] * len(values))),
+			tuple(v for row in values for v in row))
+
+def get_gl_entry_names(count):
+	"""Reserve `count` names of the GL Entry naming series (GL.#######) at once"""
+	current = frappe.db.sql("select `current` from `tabSeries` where name='GL' for update")
+	if current and current[0][0] is not None:
+		current = cint(current[0][0])
+		frappe.db.sql("update `tabSeries` set `current` = `current` + %s where name='GL'", count)
+	else:
+		current = 0
+		frappe.db.sql("insert into `tabSeries` (name, `current`) values ('GL', %s)", count)
+
+	return ["GL{0:07d}".format(current + i) for i in xrange(1, count + 1)]
+
+def update_gl_aggregates(gl_entries, cancel=False):
+	"""Keep balances maintained from GL Entries in sync with posted or cancelled entries"""
+	from erpnext.accounts.doctype.account_balance_snapshot.account_balance_snapshot \
+		import update_balance_snapshots
+	from erpnext.accounts.doctype.open_item.open_item import update_open_items
+	from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+		import update_account_period_balances
+
+	update_balance_snapshots(gl_entries, cancel)
+	update_account_period_balances(gl_entries, cancel)
+	update_open_items(gl_entries)
+
+def delete_voucher_gl_entries(voucher_type, voucher_no):
+	"""Delete GL Entries of a voucher, without validations"""
+	gl_entries = frappe.db.sql("""select * from `tabGL Entry`
+		where voucher_type=%s and voucher_no=%s""", (voucher_type, voucher_no), as_dict=True)
+
+	frappe.db.sql("""delete from `tabGL Entry` where voucher_type=%s and voucher_no=%s""",
+		(voucher_type, voucher_no))
+
+	update_gl_aggregates(gl_entries, cancel=True)
+
 def validate_account_for_auto_accounting_for_stock(gl_map):
 	if cint(frappe.db.get_single_value("Accounts Settings", "auto_accounting_for_stock")) \
 		and gl_map[0].voucher_type=="Journal Entry":
@@ -173,8 +398,8 @@ def delete_gl_entries(gl_entries=None, voucher_type=None, voucher_no=None,
 	if gl_entries:
 		check_freezing_date(gl_entries[0]["posting_date"], adv_adj)
 
-	frappe.db.sql("""delete from `tabGL Entry` where voucher_type=%s and voucher_no=%s""",
-		(voucher_type or gl_entries[0]["voucher_type"], voucher_no or gl_entries[0]["voucher_no"]))
+	delete_voucher_gl_entries(voucher_type or gl_entries[0]["voucher_type"],
+		voucher_no or gl_entries[0]["voucher_no"])
 
 	for entry in gl_entries:
 		validate_frozen_account(entry["account"], adv_adj)
@@ -7,6 +7,9 @@ from frappe import _, scrub
 from frappe.utils import getdate, nowdate, flt, cint
 
 class ReceivablePayableReport(object):
+	# party GL Entries are read in chunks of these many rows
+	chunk_size = 10000
+
 	def __init__(self, filters=None):
 		self.filters = frappe._dict(filters or {})
 		self.filters.report_date = getdate(self.filters.report_date or nowdate())
@@ -80,71 +83,78 @@ class ReceivablePayableReport(object):
 		currency_precision = get_currency_precision() or 2
 		dr_or_cr = "debit" if args.get("party_type") == "Customer" else "credit"
 
-		voucher_details = self.get_voucher_details(args.get("party_type"))
-
 		future_vouchers = self.get_entries_after(self.filters.report_date, args.get("party_type"))
 
 		company_currency = frappe.db.get_value("Company", self.filters.get("company"), "default_currency")
 
-		data = []
+		outstanding_entries = []
 		for gle in self.get_entries_till(self.filters.report_date, args.get("party_type")):
 			if self.is_receivable_or_payable(gle, dr_or_cr, future_vouchers):
 				outstanding_amount = self.get_outstanding_amount(gle, self.filters.report_date, dr_or_cr)
 				if abs(outstanding_amount) > 0.1/10**currency_precision:
+					outstanding_entries.append((gle, outstanding_amount))
 
-					row = [gle.posting_date, gle.party]
-
-					# customer / supplier name
-					if party_naming_by == "Naming Series":
-						row += [self.get_party_name(gle.party_type, gle.party)]
-
-					# get due date
-					due_date = voucher_details.get(gle.voucher_no, {}).get("due_date", "")
-
-					row += [gle.voucher_type, gle.voucher_no, due_date]
-
-					# get supplier bill details
-					if args.get("party_type") == "Supplier":
-						row += [
-							voucher_details.get(gle.voucher_no, {}).get("bill_no", ""),
-							voucher_details.get(gle.voucher_no, {}).get("bill_date", "")
-						]
+		voucher_details = self.get_voucher_details(args.get("party_type"),
+			list(set([gle.voucher_no for gle, outstanding_amount in outstanding_entries])))
 
-					# invoiced and paid amounts
-					invoiced_amount = gle.get(dr_or_cr) if (gle.get(dr_or_cr) > 0) else 0
-					paid_amt = invoiced_amount - outstanding_amount
-					row += [invoiced_amount, paid_amt, outstanding_amount]
-
-					# ageing data
-					entry_date = due_date if self.filters.ageing_based_on == "Due Date" else gle.posting_date
-					row += get_ageing_data(cint(self.filters.range1), cint(self.filters.range2),
-						cint(self.filters.range3), self.age_as_on, entry_date, outstanding_amount)
-
-					# customer territory / supplier type
-					if args.get("party_type") == "Customer":
-						row += [self.get_territory(gle.party)]
-					if args.get("party_type") == "Supplier":
-						row += [self.get_supplier_type(gle.party)]
-
-					if self.filters.get(scrub(args.get("party_type"))):
-						row.append(gle.account_currency)
-					else:
-						row.append(company_currency)
+		data = []
+		for gle, outstanding_amount in outstanding_entries:
+			row = [gle.posting_date, gle.party]
+
+			# customer / supplier name
+			if party_naming_by == "Naming Series":
+				row += [self.get_party_name(gle.party_type, gle.party)]
+
+			# get due date
+			due_date = voucher_details.get(gle.voucher_no, {}).get("due_date", "")
+
+			row += [gle.voucher_type, gle.voucher_no, due_date]
+
+			# get supplier bill details
+			if args.get("party_type") == "Supplier":
+				row += [
+					voucher_details.get(gle.voucher_no, {}).get("bill_no", ""),
+					voucher_details.get(gle.voucher_no, {}).get("bill_date", "")
+				]
+
+			# invoiced and paid amounts
+			invoiced_amount = gle.get(dr_or_cr) if (gle.get(dr_or_cr) > 0) else 0
+			paid_amt = invoiced_amount - outstanding_amount
+			row += [invoiced_amount, paid_amt, outstanding_amount]
+
+			# ageing data
+			entry_date = due_date if self.filters.ageing_based_on == "Due Date" else gle.posting_date
+			row += get_ageing_data(cint(self.filters.range1), cint(self.filters.range2),
+				cint(self.filters.range3), self.age_as_on, entry_date, outstanding_amount)
+
+			# customer territory / supplier type
+			if args.get("party_type") == "Customer":
+				row += [self.get_territory(gle.party)]
+			if args.get("party_type") == "Supplier":
+				row += [self.get_supplier_type(gle.party)]
+
+			if self.filters.get(scrub(args.get("party_type"))):
+				row.append(gle.account_currency)
+			else:
+				row.append(company_currency)
 
-					row.append(gle.remarks)
-					data.append(row)
+			row.append(gle.remarks)
+			data.append(row)
 
 		return data
 
 	def get_entries_after(self, report_date, party_type):
-		# returns a distinct list
-		return list(set([(e.voucher_type, e.voucher_no) for e in self.get_gl_entries(party_type)
-			if getdate(e.posting_date) > report_date]))
+		# returns a distinct set
+		conditions, values = self.prepare_conditions(party_type)
+
+		return set(frappe.db.sql("""select distinct voucher_type, voucher_no
+			from `tabGL Entry`
+			where docstatus < 2 and party_type=%s and (party is not null and party != '') {0}
+				and posting_date > %s""".format(conditions), values + [report_date]))
 
 	def get_entries_till(self, report_date, party_type):
 		# returns a generator
-		return (e for e in self.get_gl_entries(party_type)
-			if getdate(e.posting_date) <= report_date)
+		return self.get_gl_entries(party_type, report_date)
 
 	def is_receivable_or_payable(self, gle, dr_or_cr, future_vouchers):
 		return (
@@ -162,10 +172,12 @@ class ReceivablePayableReport(object):
 		)
 
 	def get_outstanding_amount(self, gle, report_date, dr_or_cr):
-		payment_amount = 0.0
-		for e in self.get_gl_entries_for(gle.party, gle.party_type, gle.voucher_type, gle.voucher_no):
-			if getdate(e.posting_date) <= report_date and e.name!=gle.name:
-				payment_amount += (flt(e.credit if gle.party_type == "Customer" else e.debit) - flt(e.get(dr_or_cr)))
+		payment_amount = self.get_payment_amount(gle.party, gle.party_type,
+			gle.voucher_type, gle.voucher_no, report_date, dr_or_cr)
+
+		# exclude the entry itself, if it is booked against its own voucher
+		if gle.against_voucher_type==gle.voucher_type and gle.against_voucher==gle.voucher_no:
+			payment_amount -= (flt(gle.credit if gle.party_type == "Customer" else gle.debit) - flt(gle.get(dr_or_cr)))
 
 		return flt(gle.get(dr_or_cr)) - flt(gle.credit if gle.party_type == "Customer" else gle.debit) - payment_amount
 
@@ -190,38 +202,63 @@ class ReceivablePayableReport(object):
 
 		return self.party_map
 
-	def get_voucher_details(self, party_type):
+	def get_voucher_details(self, party_type, voucher_nos):
 		voucher_details = frappe._dict()
+		if not voucher_nos:
+			return voucher_details
+
+		condition = "name in ({0})".format(", ".join(["%s"] * len(voucher_nos)))
 
 		if party_type == "Customer":
 			for si in frappe.db.sql("""select name, due_date
-				from `tabSales Invoice` where docstatus=1""", as_dict=1):
+				from `tabSales Invoice` where docstatus=1 and {0}""".format(condition),
+				tuple(voucher_nos), as_dict=1):
 					voucher_details.setdefault(si.name, si)
 
 		if party_type == "Supplier":
 			for pi in frappe.db.sql("""select name, due_date, bill_no, bill_date
-				from `tabPurchase Invoice` where docstatus=1""", as_dict=1):
+				from `tabPurchase Invoice` where docstatus=1 and {0}""".format(condition),
+				tuple(voucher_nos), as_dict=1):
 					voucher_details.setdefault(pi.name, pi)
 
 		return voucher_details
 
-	def get_gl_entries(self, party_type):
-		if not hasattr(self, "gl_entries"):
-			conditions, values = self.prepare_conditions(party_type)
-
-			if self.filters.get(scrub(party_type)):
-				select_fields = "debit_in_account_currency as debit, credit_in_account_currency as credit"
-			else:
-				select_fields = "debit, credit"
-
-			self.gl_entries = frappe.db.sql("""select name, posting_date, account, party_type, party,
+	def get_gl_entries(self, party_type, report_date):
+		"""Yields party GL Entries till report date ordered by posting date and party,
+		reading `chunk_size` rows at a time"""
+		conditions, values = self.prepare_conditions(party_type)
+
+		if self.filters.get(scrub(party_type)):
+			select_fields = "debit_in_account_currency as debit, credit_in_account_currency as credit"
+		else:
+			select_fields = "debit, credit"
+
+		last_gle = None
+		while True:
+			chunk_condition, chunk_values = "", []
+			if last_gle:
+				chunk_condition = """and (posting_date > %s or (posting_date = %s
+					and (party > %s or (party = %s and name > %s))))"""
+				chunk_values = [last_gle.posting_date, last_gle.posting_date,
+					last_gle.party, last_gle.party, last_gle.name]
+
+			gl_entries = frappe.db.sql("""select name, posting_date, account, party_type, party,
 				voucher_type, voucher_no, against_voucher_type, against_voucher, account_currency, remarks, {0}
 				from `tabGL Entry`
 				where docstatus < 2 and party_type=%s and (party is not null and party != '') {1}
-				order by posting_date, party"""
-				.format(select_fields, conditions), values, as_dict=True)
+					and posting_date <= %s {2}
+				order by posting_date, party, name
+				limit %s"""
+				.format(select_fields, conditions, chunk_condition),
+				values + [report_date] + chunk_values + [self.chunk_size], as_dict=True)
+
+			for gle in gl_entries:
+				yield gle
 
-		return self.gl_entries
+			if len(gl_entries) < self.chunk_size:
+				break
+
+			last_gle = gl_entries[-1]
 
 	def prepare_conditions(self, party_type):
 		conditions = [""]
@@ -239,19 +276,31 @@ class ReceivablePayableReport(object):
 
 		return " and ".join(conditions), values
 
-	def get_gl_entries_for(self, party, party_type, against_voucher_type, against_voucher):
-		if not hasattr(self, "gl_entries_map"):
-			self.gl_entries_map = {}
-			for gle in self.get_gl_entries(party_type):
-				if gle.against_voucher_type and gle.against_voucher:
-					self.gl_entries_map.setdefault(gle.party, {})\
-						.setdefault(gle.against_voucher_type, {})\
-						.setdefault(gle.against_voucher, [])\
-						.append(gle)
-
-		return self.gl_entries_map.get(party, {})\
-			.get(against_voucher_type, {})\
-			.get(against_voucher, [])
+	def get_payment_amount(self, party, party_type, against_voucher_type, against_voucher,
+		report_date, dr_or_cr):
+		"""Returns the amount adjusted against the voucher till report date, from a map
+		of payments per (party, against voucher type, against voucher) aggregated in the database"""
+		if not hasattr(self, "payment_amount_map"):
+			conditions, values = self.prepare_conditions(party_type)
+
+			payment_field, invoice_field = ("credit", "debit") if dr_or_cr == "debit" else ("debit", "credit")
+			if self.filters.get(scrub(party_type)):
+				payment_field += "_in_account_currency"
+				invoice_field += "_in_account_currency"
+
+			self.payment_amount_map = {}
+			for d in frappe.db.sql("""select party, against_voucher_type, against_voucher,
+					sum({0}) - sum({1}) as payment_amount
+				from `tabGL Entry`
+				where docstatus < 2 and party_type=%s and (party is not null and party != '') {2}
+					and posting_date <= %s
+					and ifnull(against_voucher_type, '') != '' and ifnull(against_voucher, '') != ''
+				group by party, against_voucher_type, against_voucher"""
+				.format(payment_field, invoice_field, conditions), values + [report_date], as_dict=True):
+					self.payment_amount_map[(d.party, d.against_voucher_type, d.against_voucher)] = \
+						flt(d.payment_amount)
+
+		return self.payment_amount_map.get((party, against_voucher_type, against_voucher), 0.0)
 
 def execute(filters=None):
 	args = {
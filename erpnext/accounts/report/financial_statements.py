@@ -96,17 +96,16 @@ def get_data(company, root_type, balance_must_be, period_list,
 	
 	company_currency = frappe.db.get_value("Company", company, "default_currency")
 
-	gl_entries_by_account = {}
+	balances_by_account = {}
 	for root in frappe.db.sql("""select lft, rgt from tabAccount
 			where root_type=%s and ifnull(parent_account, '') = ''""", root_type, as_dict=1):
-			
-		set_gl_entries_by_account(company, 
+
+		set_period_balances_by_account(company,
 			period_list[0]["year_start_date"] if only_current_fiscal_year else None,
-			period_list[-1]["to_date"], 
-			root.lft, root.rgt, 
-			gl_entries_by_account, ignore_closing_entries=ignore_closing_entries)
+			period_list, root.lft, root.rgt,
+			balances_by_account, ignore_closing_entries=ignore_closing_entries)
 
-	calculate_values(accounts_by_name, gl_entries_by_account, period_list, accumulated_values)
+	calculate_values(accounts_by_name, balances_by_account, period_list, accumulated_values)
 	accumulate_values_into_parents(accounts, accounts_by_name, period_list, accumulated_values)
 	out = prepare_data(accounts, balance_must_be, period_list, company_currency)
 	out = filter_out_zero_value_rows(out, parent_children_map)
@@ -116,18 +115,19 @@ def get_data(company, root_type, balance_must_be, period_list,
 
 	return out
 
-def calculate_values(accounts_by_name, gl_entries_by_account, period_list, accumulated_values):
-	for entries in gl_entries_by_account.values():
-		for entry in entries:
-			d = accounts_by_name.get(entry.account)
-			for period in period_list:
-				# check if posting date is within the period
-				if entry.posting_date <= period.to_date:
-					if accumulated_values or entry.posting_date >= period.from_date:
-						d[period.key] = d.get(period.key, 0.0) + flt(entry.debit) - flt(entry.credit)
-						
-			if entry.posting_date < period_list[0].year_start_date:
-				d["opening_balance"] = d.get("opening_balance", 0.0) + flt(entry.debit) - flt(entry.credit)
+def calculate_values(accounts_by_name, balances_by_account, period_list, accumulated_values):
+	for account, balances in balances_by_account.items():
+		d = accounts_by_name.get(account)
+
+		# balance before the first period
+		balance = balances.get("opening", 0.0)
+		if balance:
+			d["opening_balance"] = d.get("opening_balance", 0.0) + balance
+
+		for period in period_list:
+			balance += balances.get(period.key, 0.0)
+			d[period.key] = d.get(period.key, 0.0) + \
+				(balance if accumulated_values else balances.get(period.key, 0.0))
 
 def accumulate_values_into_parents(accounts, accounts_by_name, period_list, accumulated_values):
 	"""accumulate children's values in parent accounts"""
@@ -293,6 +293,67 @@ def set_gl_entries_by_account(company, from_date, to_date, root_lft, root_rgt, g
 
 	return gl_entries_by_account
 
+def set_period_balances_by_account(company, from_date, period_list, root_lft, root_rgt,
+		balances_by_account, ignore_closing_entries=False):
+	"""Sets debit - credit of the accounts under the root, summed per period, in a dict like
+	{ "account": { "opening": amount, "period key": amount, ... }, ... }
+
+	Entries before the first period are summed as "opening". Balances are read from
+	Account Period Balances if they are maintained and the periods cover whole months."""
+	from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+		import use_account_period_balances, is_month_aligned
+
+	if use_account_period_balances(company) and is_month_aligned(from_date) \
+		and all(is_month_aligned(period.from_date, period.to_date) for period in period_list):
+			table, date_field = "`tabAccount Period Balance`", "period_start"
+			closing_condition = "and is_period_closing=0"
+	else:
+		table, date_field = "`tabGL Entry`", "posting_date"
+		closing_condition = "and ifnull(voucher_type, '')!='Period Closing Voucher'"
+
+	additional_conditions = []
+
+	if ignore_closing_entries:
+		additional_conditions.append(closing_condition)
+
+	if from_date:
+		additional_conditions.append("and {0} >= %(from_date)s".format(date_field))
+
+	values = {
+		"company": company,
+		"from_date": from_date,
+		"to_date": period_list[-1].to_date,
+		"first_period_start": period_list[0].from_date,
+		"lft": root_lft,
+		"rgt": root_rgt
+	}
+
+	period_conditions = []
+	for i, period in enumerate(period_list):
+		period_conditions.append("when {0} <= %(period_end_{1})s then %(period_key_{1})s".format(date_field, i))
+		values.update({
+			"period_end_{0}".format(i): period.to_date,
+			"period_key_{0}".format(i): period.key
+		})
+
+	for d in frappe.db.sql("""select account,
+			case when {date_field} < %(first_period_start)s then 'opening'
+				{period_conditions} end as period,
+			sum(debit) - sum(credit) as balance
+		from {table}
+		where company=%(company)s
+		{additional_conditions}
+		and {date_field} <= %(to_date)s
+		and account in (select name from `tabAccount`
+			where lft >= %(lft)s and rgt <= %(rgt)s)
+		group by account, period""".format(table=table, date_field=date_field,
+			period_conditions="\n\t\t\t\t".join(period_conditions),
+			additional_conditions="\n".join(additional_conditions)), values, as_dict=True):
+
+		balances_by_account.setdefault(d.account, {})[d.period] = flt(d.balance)
+
+	return balances_by_account
+
 def get_columns(periodicity, period_list, accumulated_values=1, company=None):
 	columns = [{
 		"fieldname": "account",
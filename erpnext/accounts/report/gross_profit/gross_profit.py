@@ -99,6 +99,7 @@ class GrossProfitGenerator(object):
 		self.load_stock_ledger_entries()
 		self.load_product_bundle()
 		self.load_non_stock_items()
+		self.load_average_buying_rates()
 		self.process()
 
 	def process(self):
@@ -182,46 +183,24 @@ class GrossProfitGenerator(object):
 		return buying_amount
 
 	def get_buying_amount(self, row, item_code):
-		# IMP NOTE
-		# stock_ledger_entries should already be filtered by item_code and warehouse and
-		# sorted by posting_date desc, posting_time desc
 		if item_code in self.non_stock_items:
 			# average purchasing rate for non-stock items
 			item_rate = self.get_average_buying_rate(item_code)
 			return flt(row.qty) * item_rate
 
-		else:
-			my_sle = self.sle.get((item_code, row.warehouse))
-			if (row.update_stock or row.dn_detail) and my_sle:
-				parenttype, parent = row.parenttype, row.parent
-				if row.dn_detail:
-					parenttype, parent = "Delivery Note", row.delivery_note
-
-				for i, sle in enumerate(my_sle):
-					# find the stock valution rate from stock ledger entry
-					if sle.voucher_type == parenttype and parent == sle.voucher_no and \
-						sle.voucher_detail_no == row.item_row:
-							previous_stock_value = len(my_sle) > i+1 and \
-								flt(my_sle[i+1].stock_value) or 0.0
-							return  previous_stock_value - flt(sle.stock_value)
-			else:
-				return flt(row.qty) * self.get_average_buying_rate(item_code)
+		elif row.update_stock or row.dn_detail:
+			parenttype, parent = row.parenttype, row.parent
+			if row.dn_detail:
+				parenttype, parent = "Delivery Note", row.delivery_note
 
+			# stock value reduced by the delivery is the buying amount
+			return -1 * flt(self.sle.get((parenttype, parent, row.item_row, item_code, row.warehouse)))
 
-		return 0.0
+		else:
+			return flt(row.qty) * self.get_average_buying_rate(item_code)
 
 	def get_average_buying_rate(self, item_code):
-		if not item_code in self.average_buying_rate:
-			if item_code in self.non_stock_items:
-				self.average_buying_rate[item_code] = flt(frappe.db.sql("""select sum(base_net_amount) / sum(qty)
-					from `tabPurchase Invoice Item`
-					where item_code = %s and docstatus=1""", item_code)[0][0])
-			else:
-				self.average_buying_rate[item_code] = flt(frappe.db.sql("""select avg(valuation_rate)
-					from `tabStock Ledger Entry`
-					where item_code = %s and qty_after_transaction > 0""", item_code)[0][0])
-
-		return self.average_buying_rate[item_code]
+		return flt(self.average_buying_rate.get(item_code))
 
 	def load_invoice_items(self):
 		conditions = ""
@@ -247,30 +226,76 @@ class GrossProfitGenerator(object):
 			order by
 				si.posting_date desc, si.posting_time desc""" % (conditions,), self.filters, as_dict=1)
 
+	def get_stock_vouchers(self):
+		"""Returns Sales Invoices (updating stock) and Delivery Notes of the selected invoice items"""
+		vouchers = {"Sales Invoice": set(), "Delivery Note": set()}
+		for row in self.si_list:
+			if row.update_stock:
+				vouchers[row.parenttype].add(row.parent)
+			elif row.dn_detail:
+				vouchers["Delivery Note"].add(row.delivery_note)
+
+		return vouchers
+
 	def load_stock_ledger_entries(self):
-		res = frappe.db.sql("""select item_code, voucher_type, voucher_no,
-				voucher_detail_no, stock_value, warehouse, actual_qty as qty
-			from `tabStock Ledger Entry`
-			where company=%(company)s
-			order by
-				item_code desc, warehouse desc, posting_date desc,
-				posting_time desc, name desc""", self.filters, as_dict=True)
+		"""Stock value difference of the stock ledger entries of the selected vouchers,
+		keyed by voucher type, voucher no, voucher detail no, item code and warehouse"""
 		self.sle = {}
-		for r in res:
-			if (r.item_code, r.warehouse) not in self.sle:
-				self.sle[(r.item_code, r.warehouse)] = []
-
-			self.sle[(r.item_code, r.warehouse)].append(r)
+		for voucher_type, voucher_nos in self.get_stock_vouchers().items():
+			voucher_nos = list(voucher_nos)
+			for i in xrange(0, len(voucher_nos), 1000):
+				for d in frappe.db.sql("""select voucher_type, voucher_no, voucher_detail_no,
+						item_code, warehouse, stock_value_difference
+					from `tabStock Ledger Entry`
+					where voucher_type=%s and voucher_no in ({0})
+					order by posting_date desc, posting_time desc, name desc""".format(
+					", ".join(["%s"] * len(voucher_nos[i:i + 1000]))),
+					tuple([voucher_type] + voucher_nos[i:i + 1000]), as_dict=True):
+						self.sle.setdefault((d.voucher_type, d.voucher_no, d.voucher_detail_no,
+							d.item_code, d.warehouse), d.stock_value_difference)
 
 	def load_product_bundle(self):
 		self.product_bundles = {}
 
-		for d in frappe.db.sql("""select parenttype, parent, parent_item,
-			item_code, warehouse, -1*qty as total_qty, parent_detail_docname
-			from `tabPacked Item` where docstatus=1""", as_dict=True):
-			self.product_bundles.setdefault(d.parenttype, frappe._dict()).setdefault(d.parent,
-				frappe._dict()).setdefault(d.parent_item, []).append(d)
+		for parenttype, parents in self.get_stock_vouchers().items():
+			parents = list(parents)
+			for i in xrange(0, len(parents), 1000):
+				for d in frappe.db.sql("""select parenttype, parent, parent_item,
+					item_code, warehouse, -1*qty as total_qty, parent_detail_docname
+					from `tabPacked Item` where docstatus=1 and parenttype=%s and parent in ({0})""".format(
+					", ".join(["%s"] * len(parents[i:i + 1000]))),
+					tuple([parenttype] + parents[i:i + 1000]), as_dict=True):
+					self.product_bundles.setdefault(d.parenttype, frappe._dict()).setdefault(d.parent,
+						frappe._dict()).setdefault(d.parent_item, []).append(d)
 
 	def load_non_stock_items(self):
-		self.non_stock_items = frappe.db.sql_list("""select name from tabItem
-			where is_stock_item=0""")
+		self.non_stock_items = set(frappe.db.sql_list("""select name from tabItem
+			where is_stock_item=0"""))
+
+	def load_average_buying_rates(self):
+		"""Average buying rate of non-stock items and of items not delivered through stock
+		ledger, from one grouped query each"""
+		items = set()
+		for row in self.si_list:
+			if row.item_code in self.non_stock_items or not (row.update_stock or row.dn_detail):
+				items.add(row.item_code)
+
+		for bundles in self.product_bundles.values():
+			for bundle_items in bundles.values():
+				for packed_items in bundle_items.values():
+					items.update([d.item_code for d in packed_items if d.item_code in self.non_stock_items])
+
+		non_stock_items = [d for d in items if d in self.non_stock_items]
+		stock_items = [d for d in items if d not in self.non_stock_items]
+
+		if non_stock_items:
+			self.average_buying_rate.update(frappe.db.sql("""select item_code, sum(base_net_amount) / sum(qty)
+				from `tabPurchase Invoice Item`
+				where item_code in ({0}) and docstatus=1
+				group by item_code""".format(", ".join(["%s"] * len(non_stock_items))), tuple(non_stock_items)))
+
+		if stock_items:
+			self.average_buying_rate.update(frappe.db.sql("""select item_code, avg(valuation_rate)
+				from `tabStock Ledger Entry`
+				where item_code in ({0}) and qty_after_transaction > 0
+				group by item_code""".format(", ".join(["%s"] * len(stock_items))), tuple(stock_items)))
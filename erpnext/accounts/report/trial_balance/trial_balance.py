@@ -4,9 +4,9 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import flt, getdate, formatdate, cstr
+from frappe.utils import flt, getdate, formatdate
 from erpnext.accounts.report.financial_statements \
-	import filter_accounts, set_gl_entries_by_account, filter_out_zero_value_rows
+	import filter_accounts, filter_out_zero_value_rows
 
 value_fields = ("opening_debit", "opening_credit", "debit", "credit", "closing_debit", "closing_credit")
 
@@ -59,17 +59,10 @@ def get_data(filters):
 
 	accounts, accounts_by_name, parent_children_map = filter_accounts(accounts)
 
-	min_lft, max_rgt = frappe.db.sql("""select min(lft), max(rgt) from `tabAccount`
-		where company=%s""", (filters.company,))[0]
-
-	gl_entries_by_account = {}
-
-	set_gl_entries_by_account(filters.company, filters.from_date,
-		filters.to_date, min_lft, max_rgt, gl_entries_by_account, ignore_closing_entries=not flt(filters.with_period_closing_entry))
-
+	balances = get_balances(filters)
 	opening_balances = get_opening_balances(filters)
 
-	total_row = calculate_values(accounts, gl_entries_by_account, opening_balances, filters)
+	total_row = calculate_values(accounts, balances, opening_balances, filters)
 	accumulate_values_into_parents(accounts, accounts_by_name)
 
 	data = prepare_data(accounts, filters, total_row, parent_children_map)
@@ -78,46 +71,86 @@ def get_data(filters):
 		
 	return data
 
-def get_opening_balances(filters):
-	balance_sheet_opening = get_rootwise_opening_balances(filters, "Balance Sheet")
-	pl_opening = get_rootwise_opening_balances(filters, "Profit and Loss")
+def get_source(filters):
+	"""Returns the table to sum debit and credit from, its date field and the condition
+	to exclude period closing entries. Account Period Balances are used if they are maintained
+	and the dates cover whole months"""
+	from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+		import use_account_period_balances, is_month_aligned
+
+	if use_account_period_balances(filters.company) and is_month_aligned(filters.from_date, filters.to_date) \
+		and is_month_aligned(filters.year_start_date):
+			return frappe._dict({
+				"table": "`tabAccount Period Balance`",
+				"date_field": "period_start",
+				"closing_condition": " and gle.is_period_closing=0"
+			})
+
+	return frappe._dict({
+		"table": "`tabGL Entry`",
+		"date_field": "posting_date",
+		"closing_condition": " and ifnull(gle.voucher_type, '')!='Period Closing Voucher'"
+	})
+
+def get_balances(filters):
+	"""Returns debit and credit of the accounts in the period, excluding opening entries"""
+	source = get_source(filters)
+
+	additional_conditions = ""
+	if not flt(filters.with_period_closing_entry):
+		additional_conditions += source.closing_condition
 
-	balance_sheet_opening.update(pl_opening)
-	return balance_sheet_opening
+	gle = frappe.db.sql("""
+		select
+			gle.account, sum(gle.debit) as debit, sum(gle.credit) as credit
+		from {table} gle
+		where
+			gle.company=%(company)s
+			{additional_conditions}
+			and gle.{date_field} between %(from_date)s and %(to_date)s
+			and ifnull(gle.is_opening, 'No') != 'Yes'
+		group by gle.account""".format(table=source.table, date_field=source.date_field,
+			additional_conditions=additional_conditions),
+		{
+			"company": filters.company,
+			"from_date": filters.from_date,
+			"to_date": filters.to_date
+		},
+		as_dict=True)
 
+	return frappe._dict((d.account, d) for d in gle)
 
-def get_rootwise_opening_balances(filters, report_type):
-	additional_conditions = " and posting_date >= %(year_start_date)s" \
-		if report_type == "Profit and Loss" else ""
+def get_opening_balances(filters):
+	"""Returns opening debit and credit of the accounts. Profit and Loss accounts
+	open from the start of the fiscal year"""
+	source = get_source(filters)
 
+	additional_conditions = ""
 	if not flt(filters.with_period_closing_entry):
-		additional_conditions += " and ifnull(voucher_type, '')!='Period Closing Voucher'"
+		additional_conditions += source.closing_condition
 
 	gle = frappe.db.sql("""
 		select
-			account, sum(debit) as opening_debit, sum(credit) as opening_credit
-		from `tabGL Entry`
+			gle.account, sum(gle.debit) as opening_debit, sum(gle.credit) as opening_credit
+		from {table} gle, `tabAccount` acc
 		where
-			company=%(company)s
+			gle.company=%(company)s
+			and gle.account = acc.name
 			{additional_conditions}
-			and (posting_date < %(from_date)s or ifnull(is_opening, 'No') = 'Yes')
-			and account in (select name from `tabAccount` where report_type=%(report_type)s)
-		group by account""".format(additional_conditions=additional_conditions),
+			and (gle.{date_field} < %(from_date)s or ifnull(gle.is_opening, 'No') = 'Yes')
+			and (acc.report_type = 'Balance Sheet' or gle.{date_field} >= %(year_start_date)s)
+		group by gle.account""".format(table=source.table, date_field=source.date_field,
+			additional_conditions=additional_conditions),
 		{
 			"company": filters.company,
 			"from_date": filters.from_date,
-			"report_type": report_type,
 			"year_start_date": filters.year_start_date
 		},
 		as_dict=True)
 
-	opening = frappe._dict()
-	for d in gle:
-		opening.setdefault(d.account, d)
-
-	return opening
+	return frappe._dict((d.account, d) for d in gle)
 
-def calculate_values(accounts, gl_entries_by_account, opening_balances, filters):
+def calculate_values(accounts, balances, opening_balances, filters):
 	init = {
 		"opening_debit": 0.0,
 		"opening_credit": 0.0,
@@ -142,10 +175,8 @@ def calculate_values(accounts, gl_entries_by_account, opening_balances, filters)
 		d["opening_debit"] = opening_balances.get(d.name, {}).get("opening_debit", 0)
 		d["opening_credit"] = opening_balances.get(d.name, {}).get("opening_credit", 0)
 
-		for entry in gl_entries_by_account.get(d.name, []):
-			if cstr(entry.is_opening) != "Yes":
-				d["debit"] += flt(entry.debit)
-				d["credit"] += flt(entry.credit)
+		d["debit"] = flt(balances.get(d.name, {}).get("debit"))
+		d["credit"] = flt(balances.get(d.name, {}).get("credit"))
 
 		total_row["debit"] += d["debit"]
 		total_row["credit"] += d["credit"]
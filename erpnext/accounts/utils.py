@@ -4,6 +4,7 @@
 from __future__ import unicode_literals
 
 import frappe
+import bisect
 from frappe.utils import nowdate, cstr, flt, now, getdate, add_months
 from frappe import throw, _
 from frappe.utils import formatdate
@@ -21,28 +22,84 @@ def get_fiscal_year(date=None, fiscal_year=None, label="Date", verbose=1, compan
 
 def get_fiscal_years(transaction_date=None, fiscal_year=None, label="Date", verbose=1, company=None, as_dict=False):
 	# if year start date is 2012-04-01, year end date should be 2013-03-31 (hence subdate)
-	cond = " disabled = 0"
+	index = get_fiscal_year_index()
+
 	if fiscal_year:
-		cond += " and fy.name = %(fiscal_year)s"
+		fiscal_years = [d for d in index.fiscal_years if d.name == fiscal_year]
+	elif transaction_date:
+		fiscal_years = find_fiscal_years(index, getdate(transaction_date))
 	else:
-		cond += " and %(transaction_date)s >= fy.year_start_date and %(transaction_date)s <= fy.year_end_date"
+		fiscal_years = []
 
 	if company:
-		cond += """ and (not exists(select name from `tabFiscal Year Company` fyc where fyc.parent = fy.name)
-			or exists(select company from `tabFiscal Year Company` fyc where fyc.parent = fy.name and fyc.company=%(company)s ))"""
-
-	fy = frappe.db.sql("""select fy.name, fy.year_start_date, fy.year_end_date from `tabFiscal Year` fy
-		where %s order by fy.year_start_date desc""" % cond, {
-			"fiscal_year": fiscal_year,
-			"transaction_date": transaction_date,
-			"company": company
-		}, as_dict=as_dict)
+		fiscal_years = [d for d in fiscal_years if not d.companies or company in d.companies]
 
-	if not fy:
+	if not fiscal_years:
 		error_msg = _("""{0} {1} not in any active Fiscal Year. For more details check {2}.""").format(label, formatdate(transaction_date), "https://frappe.github.io/erpnext/user/manual/en/accounts/articles/fiscal-year-error")
 		if verbose==1: frappe.msgprint(error_msg)
 		raise FiscalYearError, error_msg
-	return fy
+
+	if as_dict:
+		return [frappe._dict({"name": d.name, "year_start_date": d.year_start_date,
+			"year_end_date": d.year_end_date}) for d in fiscal_years]
+	else:
+		return [(d.name, d.year_start_date, d.year_end_date) for d in fiscal_years]
+
+def find_fiscal_years(index, date):
+	"""Returns active fiscal years containing the date, latest first"""
+	fiscal_years = []
+
+	# fiscal years starting on or before the date
+	i = bisect.bisect_right(index.year_start_dates, date) - 1
+	while i >= 0:
+		fy = index.fiscal_years[i]
+		if (date - fy.year_start_date).days > index.max_days:
+			# no earlier fiscal year can end on or after the date
+			break
+
+		if fy.year_end_date >= date:
+			fiscal_years.append(fy)
+		i -= 1
+
+	return fiscal_years
+
+def get_fiscal_year_index():
+	"""Active fiscal years with their companies sorted by start date, cached
+	for the request and in redis"""
+	if not getattr(frappe.local, "fiscal_year_index", None):
+		index = frappe.cache().get_value("fiscal_year_index")
+		if not index:
+			index = build_fiscal_year_index()
+			frappe.cache().set_value("fiscal_year_index", index)
+
+		frappe.local.fiscal_year_index = index
+
+	return frappe.local.fiscal_year_index
+
+def build_fiscal_year_index():
+	companies = {}
+	for parent, company in frappe.db.sql("""select parent, company from `tabFiscal Year Company`"""):
+		companies.setdefault(parent, []).append(company)
+
+	fiscal_years = []
+	for name, year_start_date, year_end_date in frappe.db.sql("""select name, year_start_date, year_end_date
+		from `tabFiscal Year` where disabled = 0 order by year_start_date, name"""):
+			fiscal_years.append(frappe._dict({
+				"name": name,
+				"year_start_date": getdate(year_start_date),
+				"year_end_date": getdate(year_end_date),
+				"companies": companies.get(name, [])
+			}))
+
+	return frappe._dict({
+		"fiscal_years": fiscal_years,
+		"year_start_dates": [d.year_start_date for d in fiscal_years],
+		"max_days": max([(d.year_end_date - d.year_start_date).days for d in fiscal_years] or [0])
+	})
+
+def clear_fiscal_year_cache():
+	frappe.local.fiscal_year_index = None
+	frappe.cache().delete_value("fiscal_year_index")
 
 def validate_fiscal_year(date, fiscal_year, label=_("Date"), doc=None):
 	years = [f[0] for f in get_fiscal_years(date, label=label)]
@@ -66,9 +123,11 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, in_acco
 	cond = []
 	if date:
 		cond.append("posting_date <= '%s'" % frappe.db.escape(cstr(date)))
+		upto_date = date
 	else:
 		# get balance of all entries that exist
 		date = nowdate()
+		upto_date = None
 
 	try:
 		year_start_date = get_fiscal_year(date, verbose=0)[1]
@@ -112,6 +171,13 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, in_acco
 			(frappe.db.escape(party_type), frappe.db.escape(party, percent=False)))
 
 	if account or (party_type and party):
+		from erpnext.accounts.doctype.account_balance_snapshot.account_balance_snapshot \
+			import use_balance_snapshots, get_balance_from_snapshots
+
+		if use_balance_snapshots():
+			return get_balance_from_snapshots(acc if account else None,
+				upto_date, party_type, party, in_account_currency, year_start_date)
+
 		if in_account_currency:
 			select_field = "sum(debit_in_account_currency) - sum(credit_in_account_currency)"
 		else:
@@ -254,6 +320,10 @@ def remove_against_link_from_jv(ref_type, ref_no):
 		where reference_type=%s and reference_name=%s and docstatus < 2""", (ref_type, ref_no))
 
 	if linked_jv:
+		unlinked_gl_entries = frappe.db.sql("""select * from `tabGL Entry`
+			where against_voucher_type=%s and against_voucher=%s
+			and voucher_no != ifnull(against_voucher, '')""", (ref_type, ref_no), as_dict=True)
+
 		frappe.db.sql("""update `tabJournal Entry Account`
 			set reference_type=null, reference_name = null,
 			modified=%s, modified_by=%s
@@ -267,6 +337,9 @@ def remove_against_link_from_jv(ref_type, ref_no):
 			and voucher_no != ifnull(against_voucher, '')""",
 			(now(), frappe.session.user, ref_type, ref_no))
 
+		from erpnext.accounts.doctype.open_item.open_item import update_open_items
+		update_open_items(unlinked_gl_entries)
+
 		frappe.msgprint(_("Journal Entries {0} are un-linked".format("\n".join(linked_jv))))
 
 
@@ -286,14 +359,28 @@ def fix_total_debit_credit():
 		group by voucher_type, voucher_no
 		having sum(debit) != sum(credit)""", as_dict=1)
 
+	from erpnext.accounts.general_ledger import update_gl_aggregates
+
 	for d in vouchers:
 		if abs(d.diff) > 0:
 			dr_or_cr = d.voucher_type == "Sales Invoice" and "credit" or "debit"
 
-			frappe.db.sql("""update `tabGL Entry` set %s = %s + %s
-				where voucher_type = %s and voucher_no = %s and %s > 0 limit 1""" %
-				(dr_or_cr, dr_or_cr, '%s', '%s', '%s', dr_or_cr),
-				(d.diff, d.voucher_type, d.voucher_no))
+			gl_entry = frappe.db.sql("""select * from `tabGL Entry`
+				where voucher_type = %s and voucher_no = %s and {0} > 0 limit 1""".format(dr_or_cr),
+				(d.voucher_type, d.voucher_no), as_dict=1)
+
+			if not gl_entry:
+				continue
+
+			gl_entry = gl_entry[0]
+			frappe.db.sql("""update `tabGL Entry` set {0} = {0} + %s where name = %s""".format(dr_or_cr),
+				(d.diff, gl_entry.name))
+
+			# add only the correction to the balances maintained from GL Entries
+			gl_entry.update({"debit": 0, "credit": 0, "debit_in_account_currency": 0,
+				"credit_in_account_currency": 0})
+			gl_entry[dr_or_cr] = d.diff
+			update_gl_aggregates([gl_entry])
 
 def get_stock_and_account_difference(account_list=None, posting_date=None):
 	from erpnext.stock.utils import get_stock_value_on
@@ -418,6 +505,10 @@ def get_stock_rbnb_difference(posting_date, company):
 	return flt(stock_rbnb) + flt(sys_bal)
 
 def get_outstanding_invoices(party_type, party, account, condition=None):
+	from erpnext.accounts.doctype.open_item.open_item import use_open_items, get_open_invoices
+	if use_open_items():
+		return get_open_invoices(party_type, party, account, condition)
+
 	outstanding_invoices = []
 	precision = frappe.get_precision("Sales Invoice", "outstanding_amount")
 
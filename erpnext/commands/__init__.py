@@ -0,0 +1,122 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals, absolute_import
+import click
+import frappe
+from frappe.commands import pass_context, get_site
+
+@click.command('rebuild-balance-snapshots')
+@click.argument('company')
+@pass_context
+def rebuild_balance_snapshots(context, company):
+	"Regenerate Account Balance Snapshots of a company from GL Entries"
+	from erpnext.accounts.doctype.account_balance_snapshot.account_balance_snapshot \
+		import rebuild_balance_snapshots
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		rebuild_balance_snapshots(company)
+		frappe.db.commit()
+	finally:
+		frappe.destroy()
+
+@click.command('rebuild-open-items')
+@click.argument('company')
+@pass_context
+def rebuild_open_items(context, company):
+	"Regenerate Open Items of a company from GL Entries"
+	from erpnext.accounts.doctype.open_item.open_item import rebuild_open_items
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		rebuild_open_items(company)
+		frappe.db.commit()
+	finally:
+		frappe.destroy()
+
+@click.command('check-open-items')
+@click.argument('company')
+@pass_context
+def check_open_items(context, company):
+	"Compare Open Items of a company with GL Entries"
+	from erpnext.accounts.doctype.open_item.open_item import check_open_items
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		mismatches = check_open_items(company)
+		for d in mismatches:
+			print "{0} {1} ({2} {3}, {4}): {5} as per GL, {6} as per Open Item".format(d.voucher_type,
+				d.voucher_no, d.party_type, d.party, d.account, d.outstanding_as_per_gl,
+				d.outstanding_as_per_open_item)
+
+		print "{0} mismatched Open Items".format(len(mismatches))
+	finally:
+		frappe.destroy()
+
+@click.command('rebuild-stock-balance-snapshots')
+@click.argument('company')
+@pass_context
+def rebuild_stock_balance_snapshots(context, company):
+	"Regenerate Stock Balance Snapshots of a company from Stock Ledger Entries"
+	from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+		import rebuild_stock_balance_snapshots
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		rebuild_stock_balance_snapshots(company)
+		frappe.db.commit()
+	finally:
+		frappe.destroy()
+
+@click.command('check-stock-balance-snapshots')
+@click.argument('company')
+@pass_context
+def check_stock_balance_snapshots(context, company):
+	"Compare Stock Balance Snapshots of a company with Stock Ledger Entries"
+	from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+		import check_stock_balance_snapshots
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		mismatches = check_stock_balance_snapshots(company)
+		for d in mismatches:
+			print "{0} in {1} on {2}: qty {3} / value {4} as per Stock Ledger, qty {5} / value {6} as per snapshot"\
+				.format(d.item_code, d.warehouse, d.period_end, d.qty_as_per_sle, d.value_as_per_sle,
+					d.qty_as_per_snapshot, d.value_as_per_snapshot)
+
+		print "{0} mismatched Stock Balance Snapshots".format(len(mismatches))
+	finally:
+		frappe.destroy()
+
+@click.command('rebuild-account-period-balances')
+@click.argument('company')
+@click.option('--from-date', help='Rebuild the months from this date')
+@click.option('--to-date', help='Rebuild the months upto this date')
+@pass_context
+def rebuild_account_period_balances(context, company, from_date=None, to_date=None):
+	"Regenerate Account Period Balances of a company from GL Entries"
+	from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+		import rebuild_account_period_balances
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		rebuild_account_period_balances(company, from_date, to_date)
+		frappe.db.commit()
+	finally:
+		frappe.destroy()
+
+commands = [
+	rebuild_balance_snapshots,
+	rebuild_open_items,
+	check_open_items,
+	rebuild_stock_balance_snapshots,
+	check_stock_balance_snapshots,
+	rebuild_account_period_balances
+]
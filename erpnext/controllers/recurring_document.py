@@ -16,11 +16,40 @@ date_field_map = {
 	"Purchase Invoice": "posting_date"
 }
 
+recurring_doctypes = ("Sales Order", "Sales Invoice", "Purchase Order", "Purchase Invoice")
+
+# number of recurring documents made by one background job
+documents_per_job = 100
+
 def create_recurring_documents():
-	manage_recurring_documents("Sales Order")
-	manage_recurring_documents("Sales Invoice")
-	manage_recurring_documents("Purchase Order")
-	manage_recurring_documents("Purchase Invoice")
+	for doctype in recurring_doctypes:
+		enqueue_recurring_documents(doctype)
+
+def enqueue_recurring_documents(doctype, next_date=None):
+	"""Partition the recurring documents due on the date and make them in background jobs.
+	Documents already made for the date are left out, so an interrupted run is resumed
+	by the next one. Progress is tracked in a Recurring Document Run"""
+	import erpnext.tasks
+	from erpnext.accounts.doctype.recurring_document_run.recurring_document_run \
+		import make_run, get_run_in_progress
+
+	next_date = next_date or nowdate()
+
+	if get_run_in_progress(doctype, next_date):
+		return
+
+	recurring_documents = get_due_recurring_documents(doctype, next_date)
+	if not recurring_documents:
+		frappe.db.commit()
+		return
+
+	run = make_run(doctype, next_date, len(recurring_documents))
+	frappe.db.commit()
+
+	for i in xrange(0, len(recurring_documents), documents_per_job):
+		# event="bulk_long" to queue in longjob queue
+		erpnext.tasks.make_recurring_documents.delay(frappe.local.site, doctype,
+			recurring_documents[i:i + documents_per_job], cstr(next_date), run.name, event="bulk_long")
 
 def manage_recurring_documents(doctype, next_date=None, commit=True):
 	"""
@@ -29,6 +58,16 @@ def manage_recurring_documents(doctype, next_date=None, commit=True):
 	"""
 	next_date = next_date or nowdate()
 
+	exception_list = make_recurring_documents(doctype, get_due_recurring_documents(doctype, next_date),
+		next_date, commit=commit)
+
+	if exception_list:
+		exception_message = "\n\n".join([cstr(d) for d in exception_list])
+		frappe.throw(exception_message)
+
+def get_due_recurring_documents(doctype, next_date):
+	"""Returns names of recurring documents to be copied on the date, leaving out the ones
+	whose copy for the date already exists"""
 	date_field = date_field_map[doctype]
 
 	condition = " and ifnull(status, '') != 'Closed'" if doctype in ("Sales Order", "Purchase Order") else ""
@@ -38,38 +77,97 @@ def manage_recurring_documents(doctype, next_date=None, commit=True):
 		and (docstatus=1 or docstatus=0) and next_date=%s
 		and next_date <= ifnull(end_date, '2199-12-31') {1}""".format(doctype, condition), next_date)
 
-	exception_list = []
-	for ref_document, recurring_id in recurring_documents:
-		if not frappe.db.sql("""select name from `tab%s`
-				where %s=%s and recurring_id=%s and (docstatus=1 or docstatus=0)"""
-				% (doctype, date_field, '%s', '%s'), (next_date, recurring_id)):
-			try:
-				reference_doc = frappe.get_doc(doctype, ref_document)
-				new_doc = make_new_document(reference_doc, date_field, next_date)
-				if reference_doc.notify_by_email:
-					send_notification(new_doc)
-				if commit:
-					frappe.db.commit()
-			except:
-				if commit:
-					frappe.db.rollback()
-
-					frappe.db.begin()
-					frappe.db.sql("update `tab%s` \
-						set is_recurring = 0 where name = %s" % (doctype, '%s'),
-						(ref_document))
-					notify_errors(ref_document, doctype, reference_doc.get("customer") or reference_doc.get("supplier"),
-						reference_doc.owner)
-					frappe.db.commit()
-
-				exception_list.append(frappe.get_traceback())
-			finally:
-				if commit:
-					frappe.db.begin()
+	existing = set(frappe.db.sql_list("""select distinct recurring_id from `tab{0}`
+		where `{1}`=%s and ifnull(recurring_id, '') != ''
+		and (docstatus=1 or docstatus=0)""".format(doctype, date_field), next_date))
 
-	if exception_list:
-		exception_message = "\n\n".join([cstr(d) for d in exception_list])
-		frappe.throw(exception_message)
+	return [name for name, recurring_id in recurring_documents if recurring_id not in existing]
+
+def make_recurring_documents(doctype, recurring_documents, next_date, run=None, commit=True):
+	"""Make copies of the recurring documents for the date, one transaction each.
+	Returns list of tracebacks of the failed ones. If `run` is set, its counters are updated
+	and notifications are sent in background"""
+	from erpnext.accounts.doctype.recurring_document_run.recurring_document_run import update_run
+
+	date_field = date_field_map[doctype]
+	created, skipped, exception_list, notification_errors = 0, 0, [], []
+
+	for ref_document in recurring_documents:
+		reference_doc = None
+		try:
+			new_doc = make_recurring_document(doctype, ref_document, date_field, next_date)
+			if not new_doc:
+				skipped += 1
+				continue
+
+			reference_doc = new_doc.flags.reference_doc
+			if commit:
+				frappe.db.commit()
+
+			created += 1
+
+		except:
+			if commit:
+				frappe.db.rollback()
+
+				frappe.db.begin()
+				frappe.db.sql("update `tab%s` \
+					set is_recurring = 0 where name = %s" % (doctype, '%s'),
+					(ref_document))
+				reference_doc = reference_doc or frappe.get_doc(doctype, ref_document)
+				notify_errors(ref_document, doctype, reference_doc.get("customer") or reference_doc.get("supplier"),
+					reference_doc.owner)
+				frappe.db.commit()
+
+			exception_list.append(frappe.get_traceback())
+
+		else:
+			if reference_doc.notify_by_email:
+				# the copy is already made, failing to notify does not stop the recurrence
+				try:
+					if run:
+						import erpnext.tasks
+						erpnext.tasks.send_recurring_document_notification.delay(frappe.local.site,
+							doctype, new_doc.name)
+					else:
+						send_notification(new_doc)
+				except Exception:
+					notification_errors.append(_("Could not send notification for {0} {1}").format(doctype,
+						new_doc.name) + "\n" + frappe.get_traceback())
+
+		finally:
+			if commit:
+				frappe.db.begin()
+
+	if run:
+		# notification errors are logged in the run, without counting the documents as failed
+		update_run(run, created, skipped, len(exception_list),
+			"\n\n".join([cstr(d) for d in exception_list + notification_errors]))
+		if commit:
+			frappe.db.commit()
+
+	elif notification_errors:
+		msgprint("\n\n".join(notification_errors))
+
+	return exception_list
+
+def make_recurring_document(doctype, ref_document, date_field, next_date):
+	"""Make copy of the recurring document for the date, unless it already exists.
+	(recurring_id, next_date) identifies the copy"""
+	# lock the reference document so that parallel jobs wait for each other's copy
+	recurring_id = frappe.db.sql("""select recurring_id from `tab{0}` where name=%s
+		for update""".format(doctype), ref_document)[0][0]
+
+	if frappe.db.sql("""select name from `tab{0}`
+		where `{1}`=%s and recurring_id=%s and (docstatus=1 or docstatus=0)""".format(doctype, date_field),
+		(next_date, recurring_id)):
+		return None
+
+	reference_doc = frappe.get_doc(doctype, ref_document)
+	new_doc = make_new_document(reference_doc, date_field, next_date)
+	new_doc.flags.reference_doc = reference_doc
+
+	return new_doc
 
 def make_new_document(reference_doc, date_field, posting_date):
 	new_document = frappe.copy_doc(reference_doc, ignore_no_copy=False)
@@ -2,7 +2,7 @@
 # License: GNU General Public License v3. See license.txt
 
 from __future__ import unicode_literals
-import frappe
+import frappe, re
 from frappe.utils import flt, comma_or
 from frappe import msgprint, _, throw
 from frappe.model.document import Document
@@ -185,77 +185,82 @@ class StatusUpdater(Document):
 				self._update_percent_field_in_targets(args, update_modified)
 
 	def _update_children(self, args, update_modified):
-		"""Update quantities or amount in child table"""
-		for d in self.get_all_children():
-			if d.doctype != args['source_dt']:
-				continue
+		"""Update quantities or amount in child table, for all rows of the target at once"""
+		detail_ids = list(set([d.get(args['join_field']) for d in self.get_all_children(args['source_dt'])
+			if d.get(args['join_field'])]))
+
+		if not detail_ids:
+			return
+
+		self._update_modified(args, update_modified)
 
-			self._update_modified(args, update_modified)
+		if not args.get("extra_cond"): args["extra_cond"] = ""
+		if not args.get("second_source_extra_cond"): args["second_source_extra_cond"] = ""
 
-			# updates qty in the child table
-			args['detail_id'] = d.get(args['join_field'])
+		for i in xrange(0, len(detail_ids), 500):
+			names = detail_ids[i:i + 500]
+			args['detail_ids'] = ", ".join(['"{0}"'.format(frappe.db.escape(name)) for name in names])
+
+			totals = dict(frappe.db.sql("""select `%(join_field)s`, ifnull(sum(%(source_field)s), 0)
+				from `tab%(source_dt)s` where `%(join_field)s` in (%(detail_ids)s)
+				and (docstatus=1 %(cond)s) %(extra_cond)s
+				group by `%(join_field)s`""" % args))
 
-			args['second_source_condition'] = ""
 			if args.get('second_source_dt') and args.get('second_source_field') \
 					and args.get('second_join_field'):
-				if not args.get("second_source_extra_cond"):
-					args["second_source_extra_cond"] = ""
-
-				args['second_source_condition'] = """ + ifnull((select sum(%(second_source_field)s)
-					from `tab%(second_source_dt)s`
-					where `%(second_join_field)s`="%(detail_id)s"
-					and (`tab%(second_source_dt)s`.docstatus=1) %(second_source_extra_cond)s), 0) """ % args
-
-			if args['detail_id']:
-				if not args.get("extra_cond"): args["extra_cond"] = ""
-
-				frappe.db.sql("""update `tab%(target_dt)s`
-					set %(target_field)s = (
-						(select ifnull(sum(%(source_field)s), 0)
-							from `tab%(source_dt)s` where `%(join_field)s`="%(detail_id)s"
-							and (docstatus=1 %(cond)s) %(extra_cond)s)
-						%(second_source_condition)s
-					)
-					%(update_modified)s
-					where name='%(detail_id)s'""" % args)
+				for name, value in frappe.db.sql("""select `%(second_join_field)s`,
+						ifnull(sum(%(second_source_field)s), 0)
+					from `tab%(second_source_dt)s` where `%(second_join_field)s` in (%(detail_ids)s)
+					and (`tab%(second_source_dt)s`.docstatus=1) %(second_source_extra_cond)s
+					group by `%(second_join_field)s`""" % args):
+						totals[name] = totals.get(name, 0) + value
+
+			set_values_by_name(args['target_dt'], args['target_field'],
+				dict((name, totals.get(name, 0)) for name in names), args['update_modified'])
 
 	def _update_percent_field_in_targets(self, args, update_modified=True):
 		"""Update percent field in parent transaction"""
 		distinct_transactions = set([d.get(args['percent_join_field'])
 			for d in self.get_all_children(args['source_dt'])])
 
-		for name in distinct_transactions:
-			if name:
-				args['name'] = name
-				self._update_percent_field(args, update_modified)
+		self._update_percent_fields(args, [name for name in distinct_transactions if name],
+			update_modified)
 
 	def _update_percent_field(self, args, update_modified=True):
 		"""Update percent field in parent transaction"""
+		self._update_percent_fields(args, [args['name']], update_modified)
+
+	def _update_percent_fields(self, args, names, update_modified=True):
+		"""Update percent field, status field and status of many parent transactions,
+		from one grouped query on their items"""
+		if not names:
+			return
 
 		self._update_modified(args, update_modified)
 
 		if args.get('target_parent_field'):
-			frappe.db.sql("""update `tab%(target_parent_dt)s`
-				set %(target_parent_field)s = round(
-					ifnull((select
-						ifnull(sum(if(%(target_ref_field)s > %(target_field)s, %(target_field)s, %(target_ref_field)s)), 0)
-						/ sum(%(target_ref_field)s) * 100
-					from `tab%(target_dt)s` where parent="%(name)s"), 0), 2)
-					%(update_modified)s
-				where name='%(name)s'""" % args)
-
-		# update field
-		if args.get('status_field'):
-			frappe.db.sql("""update `tab%(target_parent_dt)s`
-				set %(status_field)s = if(%(target_parent_field)s<0.001,
-					'Not %(keyword)s', if(%(target_parent_field)s>=99.99,
-					'Fully %(keyword)s', 'Partly %(keyword)s'))
-				where name='%(name)s'""" % args)
+			percent = {}
+			for i in xrange(0, len(names), 500):
+				args['names'] = ", ".join(['"{0}"'.format(frappe.db.escape(name)) for name in names[i:i + 500]])
+				percent.update(dict(frappe.db.sql("""select parent,
+						round(ifnull(ifnull(sum(if(%(target_ref_field)s > %(target_field)s,
+							%(target_field)s, %(target_ref_field)s)), 0) / sum(%(target_ref_field)s) * 100, 0), 2)
+					from `tab%(target_dt)s` where parent in (%(names)s)
+					group by parent""" % args)))
+
+			percent = dict((name, flt(percent.get(name))) for name in names)
+			set_values_by_name(args['target_parent_dt'], args['target_parent_field'], percent,
+				args['update_modified'])
+
+			# update field
+			if args.get('status_field'):
+				set_values_by_name(args['target_parent_dt'], args['status_field'],
+					dict((name, get_status_for_percent(percent[name], args['keyword'])) for name in names))
 
 		if update_modified:
-			target = frappe.get_doc(args["target_parent_dt"], args["name"])
-			target.set_status(update=True)
-			target.notify_update()
+			for target in get_docs_for_status(args["target_parent_dt"], names):
+				target.set_status(update=True)
+				target.notify_update()
 
 	def _update_modified(self, args, update_modified):
 		args['update_modified'] = ''
@@ -298,6 +303,46 @@ class StatusUpdater(Document):
 
 				frappe.db.set_value(ref_dt, ref_dn, "billing_status", billing_status)
 
+def set_values_by_name(doctype, fieldname, values, update_modified=""):
+	"""Set `fieldname` of many records in one query per chunk. `values` is a dict of name and value"""
+	names = values.keys()
+	for i in xrange(0, len(names), 500):
+		chunk = names[i:i + 500]
+		frappe.db.sql("""update `tab{0}` set `{1}` = case name {2} end {3} where name in ({4})""".format(
+			doctype, fieldname, " ".join(["when %s then %s"] * len(chunk)), update_modified.replace("%", "%%"),
+			", ".join(["%s"] * len(chunk))), tuple([v for name in chunk for v in (name, values[name])] + chunk))
+
+def get_status_for_percent(percent, keyword):
+	if percent < 0.001:
+		return "Not " + keyword
+	elif percent >= 99.99:
+		return "Fully " + keyword
+	else:
+		return "Partly " + keyword
+
+def get_status_fields(doctype):
+	"""Fields used by the status conditions of the doctype,
+	None if any status depends on a method of the document"""
+	fields = set(["name", "docstatus", "status", "modified"])
+	for status, condition in status_map.get(doctype, []):
+		if not condition:
+			continue
+		elif not condition.startswith("eval:"):
+			return None
+
+		fields.update(re.findall(r"self\.(\w+)", condition))
+
+	return list(fields)
+
+def get_docs_for_status(doctype, names):
+	"""Documents loaded with only the fields needed to set their status, without child tables"""
+	fields = get_status_fields(doctype)
+	if fields is None:
+		return [frappe.get_doc(doctype, name) for name in names]
+
+	return [frappe.get_doc(dict(values, doctype=doctype)) for values in frappe.get_all(doctype,
+		fields=fields, filters={"name": ("in", names)})]
+
 def get_tolerance_for(item_code, item_tolerance={}, global_tolerance=None):
 	"""
 		Returns the tolerance for the item, if not set, returns global tolerance
@@ -64,51 +64,41 @@ def get_data(filters, conditions):
 		elif filters.get("group_by") == 'Supplier':
 			sel_col = 't1.supplier'
 
-		if filters.get('based_on') in ['Item','Customer','Supplier']:
-			inc = 2
-		else :
-			inc = 1
-		data1 = frappe.db.sql(""" select %s from `tab%s` t1, `tab%s Item` t2 %s
+		# totals per based on value, with the based on key as the last column
+		data1 = frappe.db.sql(""" select %s, %s from `tab%s` t1, `tab%s Item` t2 %s
 					where t2.parent = t1.name and t1.company = %s and %s between %s and %s and
 					t1.docstatus = 1 %s %s
 					group by %s
-				""" % (query_details,  conditions["trans"],  conditions["trans"], conditions["addl_tables"], "%s",
-					posting_date, "%s", "%s", conditions.get("addl_tables_relational_cond"), cond, conditions["group_by"]), (filters.get("company"),
-					year_start_date, year_end_date),as_list=1)
+				""" % (query_details, conditions["group_by"], conditions["trans"], conditions["trans"],
+					conditions["addl_tables"], "%s", posting_date, "%s", "%s",
+					conditions.get("addl_tables_relational_cond"), cond, conditions["group_by"]),
+				(filters.get("company"), year_start_date, year_end_date), as_list=1)
 
-		for d in range(len(data1)):
-			#to add blanck column
-			dt = data1[d]
+		# totals per based on value and group by value, in one query
+		group_wise_data = {}
+		for d in frappe.db.sql(""" select %s, %s, %s from `tab%s` t1, `tab%s Item` t2 %s
+					where t2.parent = t1.name and t1.company = %s and %s between %s and %s and
+					t1.docstatus = 1 %s %s
+					group by %s, %s
+					order by %s
+				""" % (conditions["group_by"], sel_col, conditions["period_wise_select"],
+					conditions["trans"], conditions["trans"], conditions["addl_tables"], "%s",
+					posting_date, "%s", "%s", conditions.get("addl_tables_relational_cond"), cond,
+					conditions["group_by"], sel_col, sel_col),
+				(filters.get("company"), year_start_date, year_end_date), as_list=1):
+			group_wise_data.setdefault(d[0], []).append(d[1:])
+
+		for dt in data1:
+			based_on_key = dt.pop()
+
+			#to add blank column
 			dt.insert(ind,'')
 			data.append(dt)
 
-			#to get distinct value of col specified by group_by in filter
-			row = frappe.db.sql("""select DISTINCT(%s) from `tab%s` t1, `tab%s Item` t2 %s
-						where t2.parent = t1.name and t1.company = %s and %s between %s and %s
-						and t1.docstatus = 1 and %s = %s %s
-					""" %
-					(sel_col,  conditions["trans"],  conditions["trans"], conditions["addl_tables"],
-						"%s", posting_date, "%s", "%s", conditions["group_by"], "%s", conditions.get("addl_tables_relational_cond")),
-					(filters.get("company"), year_start_date, year_end_date, data1[d][0]), as_list=1)
-
-			for i in range(len(row)):
+			for group_row in group_wise_data.get(based_on_key, []):
 				des = ['' for q in range(len(conditions["columns"]))]
-
-				#get data for group_by filter
-				row1 = frappe.db.sql(""" select %s , %s from `tab%s` t1, `tab%s Item` t2 %s
-							where t2.parent = t1.name and t1.company = %s and %s between %s and %s
-							and t1.docstatus = 1 and %s = %s and %s = %s %s
-						""" %
-						(sel_col, conditions["period_wise_select"], conditions["trans"],
-							conditions["trans"], conditions["addl_tables"], "%s", posting_date, "%s","%s", sel_col,
-							"%s", conditions["group_by"], "%s", conditions.get("addl_tables_relational_cond")),
-						(filters.get("company"), year_start_date, year_end_date, row[i][0],
-							data1[d][0]), as_list=1)
-
-				des[ind] = row[i][0]
-
-				for j in range(1,len(conditions["columns"])-inc):
-					des[j+inc] = row1[0][j]
+				des[ind] = group_row[0]
+				des[ind+1:] = group_row[1:]
 
 				data.append(des)
 	else:
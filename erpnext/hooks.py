@@ -128,6 +128,9 @@ doc_events = {
 }
 
 scheduler_events = {
+	"all": [
+		"erpnext.stock.doctype.stock_repost_request.stock_repost_request.repost_entries"
+	],
 	"hourly": [
 		"erpnext.controllers.recurring_document.create_recurring_documents"
 	],
@@ -2,12 +2,15 @@
 # License: GNU General Public License v3. See license.txt
 
 from __future__ import unicode_literals
-import frappe
-from frappe.utils import cint, flt, nowdate
+import frappe, time
+from frappe.utils import cint, cstr, flt, getdate, nowdate
 from frappe import _
 
 from frappe.model.document import Document
 
+# number of salary slips made or submitted per transaction, and per background job
+payroll_chunk_size = 500
+
 class ProcessPayroll(Document):
 
 	def get_emp_list(self):
@@ -20,7 +23,7 @@ class ProcessPayroll(Document):
 		cond += self.get_joining_releiving_condition()
 
 		emp_list = frappe.db.sql("""
-			select t1.name
+			select distinct t1.name
 			from `tabEmployee` t1, `tabSalary Structure` t2
 			where t1.docstatus!=2 and t2.docstatus != 2
 			and t1.name = t2.employee
@@ -59,25 +62,17 @@ class ProcessPayroll(Document):
 			Creates salary slip for selected employees if already not created
 		"""
 
-		emp_list = self.get_emp_list()
-		ss_list = []
-		for emp in emp_list:
-			if not frappe.db.sql("""select name from `tabSalary Slip`
-					where docstatus!= 2 and employee = %s and month = %s and fiscal_year = %s and company = %s
-					""", (emp[0], self.month, self.fiscal_year, self.company)):
-				ss = frappe.get_doc({
-					"doctype": "Salary Slip",
-					"fiscal_year": self.fiscal_year,
-					"employee": emp[0],
-					"month": self.month,
-					"email_check": self.send_email,
-					"company": self.company,
-				})
-				ss.insert()
-				ss_list.append(ss.name)
+		emp_list = [d[0] for d in self.get_emp_list()]
+
+		if process_payroll_in_background() and emp_list:
+			enqueue_payroll("make_salary_slips", emp_list, self.fiscal_year, self.month, self.company,
+				self.send_email)
+			return "<p>" + _("Queued {0} employees for creating Salary Slips").format(len(emp_list)) + "</p>"
 
-		return self.create_log(ss_list)
+		ss_list, timings = make_salary_slips(emp_list, self.fiscal_year, self.month, self.company,
+			self.send_email)
 
+		return self.create_log(ss_list) + format_timings(timings)
 
 	def create_log(self, ss_list):
 		log = "<p>" + _("No employee for the above selected criteria OR salary slip already created") + "</p>"
@@ -105,19 +100,14 @@ class ProcessPayroll(Document):
 			Submit all salary slips based on selected criteria
 		"""
 		ss_list = self.get_sal_slip_list()
-		not_submitted_ss = []
-		for ss in ss_list:
-			ss_obj = frappe.get_doc("Salary Slip",ss[0])
-			try:
-				ss_obj.email_check = self.send_email
-				ss_obj.submit()
-			except Exception,e:
-				not_submitted_ss.append(ss[0])
-				frappe.msgprint(e)
-				continue
 
-		return self.create_submit_log(ss_list, not_submitted_ss)
+		if process_payroll_in_background() and ss_list:
+			enqueue_payroll("submit_salary_slips", [d[0] for d in ss_list], self.send_email)
+			return "<p>" + _("Queued {0} Salary Slips for submission").format(len(ss_list)) + "</p>"
+
+		not_submitted_ss, timings = submit_salary_slips([d[0] for d in ss_list], self.send_email)
 
+		return self.create_submit_log(ss_list, not_submitted_ss) + format_timings(timings)
 
 	def create_submit_log(self, all_ss, not_submitted_ss):
 		log = ''
@@ -206,3 +196,229 @@ def get_month_details(year, month):
 			'month_end_date': med,
 			'month_days': month_days
 		})
+
+def process_payroll_in_background():
+	return cint(frappe.db.get_single_value("HR Settings", "process_payroll_in_background"))
+
+def enqueue_payroll(method, names, *args):
+	"""Split employees or salary slips in chunks, processed by background workers"""
+	import erpnext.tasks
+	for i in xrange(0, len(names), payroll_chunk_size):
+		# event="bulk_long" to queue in longjob queue
+		erpnext.tasks.process_payroll.delay(frappe.local.site, method, [names[i:i + payroll_chunk_size]] + list(args),
+			event="bulk_long")
+
+def make_salary_slips(employees, fiscal_year, month, company, send_email=0):
+	"""Make Salary Slips of the employees for the month, if not already made.
+	Structures, holidays and leave without pay are fetched for all employees of a chunk at once,
+	and slips of a chunk are committed together. Returns names and timings"""
+	# an employee with multiple Salary Structures may be listed more than once
+	seen = set()
+	employees = [e for e in employees if not (e in seen or seen.add(e))]
+
+	timings = frappe._dict({"employees": len(employees), "prefetch": 0.0, "insert": 0.0})
+	ss_list = []
+
+	for i in xrange(0, len(employees), payroll_chunk_size):
+		start = time.time()
+		details = get_payroll_details(employees[i:i + payroll_chunk_size], fiscal_year, month, company)
+		timings.prefetch += time.time() - start
+
+		start = time.time()
+		for employee in employees[i:i + payroll_chunk_size]:
+			if employee in details.existing or employee not in details.employees:
+				continue
+
+			ss = make_salary_slip_from_details(details, employee, fiscal_year, month, company, send_email)
+			if ss:
+				ss.insert()
+				ss_list.append(ss.name)
+				details.existing.add(employee)
+
+		if not frappe.flags.in_test:
+			frappe.db.commit()
+
+		timings.insert += time.time() - start
+
+	timings.salary_slips = len(ss_list)
+
+	return ss_list, timings
+
+def submit_salary_slips(salary_slips, send_email=0):
+	"""Submit Salary Slips in chunks, with payroll details prefetched for each chunk.
+	Returns names of the ones not submitted, and timings"""
+	timings = frappe._dict({"salary_slips": len(salary_slips), "prefetch": 0.0, "submit": 0.0})
+	not_submitted_ss = []
+
+	for i in xrange(0, len(salary_slips), payroll_chunk_size):
+		start = time.time()
+		docs = [frappe.get_doc("Salary Slip", name) for name in salary_slips[i:i + payroll_chunk_size]]
+
+		details_by_period = {}
+		for ss in docs:
+			key = (ss.fiscal_year, ss.month, ss.company)
+			details_by_period.setdefault(key, []).append(ss.employee)
+
+		for key in details_by_period:
+			details_by_period[key] = get_payroll_details(details_by_period[key], *key)
+
+		timings.prefetch += time.time() - start
+
+		start = time.time()
+		for ss in docs:
+			details = details_by_period[(ss.fiscal_year, ss.month, ss.company)]
+			try:
+				ss.flags.payroll = details.employees.get(ss.employee)
+				ss.email_check = send_email
+				ss.submit()
+			except Exception, e:
+				not_submitted_ss.append(ss.name)
+				frappe.msgprint(e)
+				continue
+
+		if not frappe.flags.in_test:
+			frappe.db.commit()
+
+		timings.submit += time.time() - start
+
+	return not_submitted_ss, timings
+
+def get_payroll_details(employees, fiscal_year, month, company):
+	"""Returns salary structure, holidays and leave without pay of the month for every employee,
+	and the employees whose Salary Slip for the month already exists"""
+	from erpnext.hr.doctype.salary_slip.salary_slip import get_lwp_leaves
+
+	m = get_month_details(fiscal_year, month)
+	condition = ", ".join(["%s"] * len(employees))
+
+	existing = set(frappe.db.sql_list("""select employee from `tabSalary Slip`
+		where docstatus!= 2 and month = %s and fiscal_year = %s and company = %s
+		and employee in ({0})""".format(condition), tuple([month, fiscal_year, company] + list(employees))))
+
+	employee_details = frappe.db.sql("""select name, company, holiday_list, date_of_joining, relieving_date,
+			bank_name, bank_ac_no
+		from `tabEmployee` where name in ({0})""".format(condition), tuple(employees), as_dict=1)
+
+	default_holiday_lists = dict(frappe.db.sql("""select name, default_holiday_list from `tabCompany`"""))
+	for d in employee_details:
+		d.holiday_list = d.holiday_list or default_holiday_lists.get(d.company)
+		if not d.holiday_list:
+			frappe.throw(_("Please set a Holiday List for either the Employee or the Company"))
+
+	holidays = {}
+	holiday_lists = list(set([d.holiday_list for d in employee_details]))
+	if holiday_lists:
+		for holiday_list, holiday_date in frappe.db.sql("""select parent, holiday_date from `tabHoliday`
+			where parent in ({0}) and holiday_date >= %s and holiday_date <= %s""".format(
+				", ".join(["%s"] * len(holiday_lists))),
+			tuple(holiday_lists + [m.month_start_date, m.month_end_date])):
+				holidays.setdefault(holiday_list, []).append(cstr(holiday_date))
+
+	structures = get_salary_structures(employee_details, m)
+	lwp_leaves = get_lwp_leaves(list(employees), m.month_start_date, m.month_end_date)
+
+	include_holidays_in_total_working_days = cint(frappe.db.get_value("HR Settings", None,
+		"include_holidays_in_total_working_days"))
+	disable_rounded_total = cint(frappe.db.get_value("Global Defaults", None, "disable_rounded_total"))
+
+	details = frappe._dict({"existing": existing, "employees": {}})
+	for d in employee_details:
+		d.update({
+			"month_details": m,
+			"structure": structures.get(d.name),
+			"holidays": holidays.get(d.holiday_list, []),
+			"lwp_leaves": lwp_leaves.get(d.name, []),
+			"include_holidays_in_total_working_days": include_holidays_in_total_working_days,
+			"disable_rounded_total": disable_rounded_total
+		})
+		details.employees[d.name] = d
+
+	return details
+
+def get_salary_structures(employees, m):
+	"""Returns active Salary Structure of every employee for the month, with its earnings and deductions"""
+	if not employees:
+		return {}
+
+	employees = dict((d.name, d) for d in employees)
+	structures = {}
+	for d in frappe.db.sql("""select name, employee, employee_name, company, branch, designation, department,
+			letter_head, from_date, to_date
+		from `tabSalary Structure`
+		where is_active = 'Yes' and employee in ({0})""".format(", ".join(["%s"] * len(employees))),
+		tuple(employees.keys()), as_dict=1):
+			if d.employee in structures:
+				continue
+
+			employee = employees[d.employee]
+			if d.from_date and (d.from_date <= m.month_start_date
+					or (employee.date_of_joining and d.from_date <= employee.date_of_joining)) \
+				and (not d.to_date or d.to_date >= m.month_end_date
+					or (employee.relieving_date and d.to_date >= employee.relieving_date)):
+				d.earnings, d.deductions = [], []
+				structures[d.employee] = d
+
+	if structures:
+		by_name = dict((d.name, d) for d in structures.values())
+		condition = ", ".join(["%s"] * len(by_name))
+
+		for d in frappe.db.sql("""select parent, e_type, modified_value, depend_on_lwp
+			from `tabSalary Structure Earning` where parent in ({0})
+			order by parent, idx""".format(condition), tuple(by_name.keys()), as_dict=1):
+				by_name[d.parent].earnings.append(d)
+
+		for d in frappe.db.sql("""select parent, d_type, d_modified_amt, depend_on_lwp
+			from `tabSalary Structure Deduction` where parent in ({0})
+			order by parent, idx""".format(condition), tuple(by_name.keys()), as_dict=1):
+				by_name[d.parent].deductions.append(d)
+
+	return structures
+
+def make_salary_slip_from_details(details, employee, fiscal_year, month, company, send_email=0):
+	"""Salary Slip computed in memory from prefetched payroll details, as mapped from
+	the Salary Structure"""
+	payroll = details.employees[employee]
+	structure = payroll.structure
+	if not structure:
+		frappe.msgprint(_("No active Salary Structure found for employee {0} and the month")
+			.format(employee))
+		return
+
+	ss = frappe.get_doc({
+		"doctype": "Salary Slip",
+		"fiscal_year": fiscal_year,
+		"month": month,
+		"email_check": send_email,
+		"employee": employee,
+		"employee_name": structure.employee_name,
+		"company": structure.company or company,
+		"branch": structure.branch,
+		"designation": structure.designation,
+		"department": structure.department,
+		"letter_head": structure.letter_head,
+		"bank_name": payroll.bank_name,
+		"bank_account_no": payroll.bank_ac_no,
+		"earnings": [{
+			"e_type": d.e_type,
+			"e_amount": d.modified_value,
+			"e_modified_amount": d.modified_value,
+			"e_depends_on_lwp": d.depend_on_lwp
+		} for d in structure.earnings],
+		"deductions": [{
+			"d_type": d.d_type,
+			"d_amount": d.d_modified_amt,
+			"d_modified_amount": d.d_modified_amt,
+			"d_depends_on_lwp": d.depend_on_lwp
+		} for d in structure.deductions]
+	})
+
+	ss.flags.payroll = payroll
+	ss.get_leave_details(payroll.date_of_joining, payroll.relieving_date)
+	ss.calculate_net_pay()
+
+	return ss
+
+def format_timings(timings):
+	return "<p>" + ", ".join(["{0}: {1}".format(_(key.replace("_", " ").title()),
+		"{0}s".format(round(value, 2)) if isinstance(value, float) else value)
+		for key, value in sorted(timings.items())]) + "</p>"
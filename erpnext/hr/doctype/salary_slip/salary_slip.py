@@ -64,14 +64,19 @@ class SalarySlip(TransactionBase):
 			self.month = "%02d" % getdate(nowdate()).month
 
 		if not joining_date:
-			joining_date, relieving_date = frappe.db.get_value("Employee", self.employee,
-				["date_of_joining", "relieving_date"])
-
-		m = get_month_details(self.fiscal_year, self.month)
+			if self.flags.payroll:
+				joining_date = self.flags.payroll.date_of_joining
+				relieving_date = self.flags.payroll.relieving_date
+			else:
+				joining_date, relieving_date = frappe.db.get_value("Employee", self.employee,
+					["date_of_joining", "relieving_date"])
+
+		m = self.flags.payroll.month_details if self.flags.payroll else \
+			get_month_details(self.fiscal_year, self.month)
 		holidays = self.get_holidays_for_employee(m['month_start_date'], m['month_end_date'])
 
 		working_days = m["month_days"]
-		if not cint(frappe.db.get_value("HR Settings", None, "include_holidays_in_total_working_days")):
+		if not self.include_holidays_in_total_working_days():
 			working_days -= len(holidays)
 			if working_days < 0:
 				frappe.throw(_("There are more holidays than working days this month."))
@@ -101,13 +106,24 @@ class SalarySlip(TransactionBase):
 
 		payment_days = date_diff(end_date, start_date) + 1
 
-		if not cint(frappe.db.get_value("HR Settings", None, "include_holidays_in_total_working_days")):
+		if not self.include_holidays_in_total_working_days():
 			holidays = self.get_holidays_for_employee(start_date, end_date)
 			payment_days -= len(holidays)
 
 		return payment_days
 
+	def include_holidays_in_total_working_days(self):
+		if self.flags.payroll:
+			return self.flags.payroll.include_holidays_in_total_working_days
+
+		return cint(frappe.db.get_value("HR Settings", None, "include_holidays_in_total_working_days"))
+
 	def get_holidays_for_employee(self, start_date, end_date):
+		if self.flags.payroll:
+			# holidays of the month, prefetched by payroll
+			return [d for d in self.flags.payroll.holidays
+				if getdate(start_date) <= getdate(d) <= getdate(end_date)]
+
 		holiday_list = get_holiday_list_for_employee(self.employee)
 		holidays = frappe.db.sql_list('''select holiday_date from `tabHoliday`
 			where
@@ -124,21 +140,20 @@ class SalarySlip(TransactionBase):
 		return holidays
 
 	def calculate_lwp(self, holidays, m):
+		if self.flags.payroll:
+			leaves = self.flags.payroll.lwp_leaves
+		else:
+			leaves = get_lwp_leaves([self.employee], m['month_start_date'],
+				m['month_end_date']).get(self.employee, [])
+
 		lwp = 0
 		for d in range(m['month_days']):
 			dt = add_days(cstr(m['month_start_date']), d)
 			if dt not in holidays:
-				leave = frappe.db.sql("""
-					select t1.name, t1.half_day
-					from `tabLeave Application` t1, `tabLeave Type` t2
-					where t2.name = t1.leave_type
-					and t2.is_lwp = 1
-					and t1.docstatus = 1
-					and t1.employee = %s
-					and %s between from_date and to_date
-				""", (self.employee, dt))
-				if leave:
-					lwp = cint(leave[0][1]) and (lwp + 0.5) or (lwp + 1)
+				for leave in leaves:
+					if leave.from_date <= getdate(dt) <= leave.to_date:
+						lwp = cint(leave.half_day) and (lwp + 0.5) or (lwp + 1)
+						break
 		return lwp
 
 	def check_existing(self):
@@ -193,7 +208,10 @@ class SalarySlip(TransactionBase):
 			self.total_deduction += flt(d.d_modified_amount)
 
 	def calculate_net_pay(self):
-		disable_rounded_total = cint(frappe.db.get_value("Global Defaults", None, "disable_rounded_total"))
+		if self.flags.payroll:
+			disable_rounded_total = self.flags.payroll.disable_rounded_total
+		else:
+			disable_rounded_total = cint(frappe.db.get_value("Global Defaults", None, "disable_rounded_total"))
 
 		self.calculate_earning_total()
 		self.calculate_ded_total()
@@ -214,3 +232,20 @@ class SalarySlip(TransactionBase):
 				attachments=[frappe.attach_print(self.doctype, self.name, file_name=self.name)])
 		else:
 			msgprint(_("Company Email ID not found, hence mail not sent"))
+
+def get_lwp_leaves(employees, start_date, end_date):
+	"""Returns approved leave without pay of the employees overlapping the period, by employee"""
+	leaves = {}
+	for i in xrange(0, len(employees), 1000):
+		for d in frappe.db.sql("""select t1.employee, t1.from_date, t1.to_date, t1.half_day
+			from `tabLeave Application` t1, `tabLeave Type` t2
+			where t2.name = t1.leave_type
+			and t2.is_lwp = 1
+			and t1.docstatus = 1
+			and t1.employee in ({0})
+			and t1.from_date <= %s and t1.to_date >= %s
+			order by t1.from_date""".format(", ".join(["%s"] * len(employees[i:i + 1000]))),
+			tuple(employees[i:i + 1000]) + (end_date, start_date), as_dict=1):
+				leaves.setdefault(d.employee, []).append(d)
+
+	return leaves
@@ -4,7 +4,7 @@ from __future__ import unicode_literals
 
 import unittest
 import frappe
-from frappe.utils import today
+from frappe.utils import today, get_first_day
 from erpnext.hr.doctype.employee.employee import make_salary_structure
 from erpnext.hr.doctype.salary_structure.salary_structure import make_salary_slip
 from erpnext.hr.doctype.leave_application.test_leave_application import make_allocation_record
@@ -97,6 +97,37 @@ class TestSalarySlip(unittest.TestCase):
 		frappe.set_user("test_employee@example.com")
 		self.assertTrue(salary_slip_test_employee.has_permission("read"))
 
+	def test_salary_slips_made_in_bulk(self):
+		from erpnext.hr.doctype.process_payroll.process_payroll import make_salary_slips
+
+		self.make_employee("test_employee@example.com")
+		employee = frappe.db.get_value("Employee", {"user_id": "test_employee@example.com"})
+
+		for name in frappe.db.sql_list("select name from `tabSalary Structure` where employee=%s", employee):
+			frappe.delete_doc("Salary Structure", name)
+
+		salary_structure = make_salary_structure(employee)
+		salary_structure.from_date = get_first_day(today())
+		salary_structure.insert()
+
+		expected = make_salary_slip(salary_structure.name)
+
+		ss_list, timings = make_salary_slips([employee], expected.fiscal_year, expected.month, "_Test Company")
+		self.assertEqual(len(ss_list), 1)
+		self.assertEqual(timings.salary_slips, 1)
+
+		ss = frappe.get_doc("Salary Slip", ss_list[0])
+		for fieldname in ("total_days_in_month", "leave_without_pay", "payment_days", "gross_pay",
+			"total_deduction", "net_pay", "rounded_total"):
+			self.assertEqual(ss.get(fieldname), expected.get(fieldname))
+
+		self.assertEqual([(d.e_type, d.e_modified_amount) for d in ss.earnings],
+			[(d.e_type, d.e_modified_amount) for d in expected.earnings])
+
+		# not made again for the month
+		self.assertEqual(make_salary_slips([employee], expected.fiscal_year, expected.month,
+			"_Test Company")[0], [])
+
 	def make_employee(self, user):
 		if not frappe.db.get_value("User", user):
 			frappe.get_doc({
@@ -2,16 +2,17 @@
 # License: GNU General Public License v3. See license.txt
 
 from __future__ import unicode_literals
-import frappe
+import frappe, json
 
-from frappe.utils import flt, get_datetime, getdate, date_diff, cint, nowdate
+from frappe.utils import flt, get_datetime, getdate, cint, nowdate, now_datetime
 from frappe import _
 from frappe.model.document import Document
 from erpnext.manufacturing.doctype.bom.bom import validate_bom_no
 from dateutil.relativedelta import relativedelta
 from erpnext.stock.doctype.item.item import validate_end_of_life
-from erpnext.manufacturing.doctype.workstation.workstation import WorkstationHolidayError, NotInWorkingHoursError
-from erpnext.projects.doctype.time_log.time_log import OverlapError
+from erpnext.manufacturing.doctype.workstation.workstation import NotInWorkingHoursError, get_capacity_calendars
+from erpnext.projects.doctype.time_log.time_log import validate_time_log_overlaps
+from datetime import timedelta
 from erpnext.stock.doctype.stock_entry.stock_entry import get_additional_costs
 from erpnext.manufacturing.doctype.manufacturing_settings.manufacturing_settings import get_mins_between_operations
 from erpnext.stock.stock_balance import get_planned_qty, update_bin_qty
@@ -223,10 +224,12 @@ class ProductionOrder(Document):
 
 		return holidays[holiday_list]
 
-	def make_time_logs(self):
+	def make_time_logs(self, calendars=None):
 		"""Capacity Planning. Plan time logs based on earliest availablity of workstation after
 			Planned Start Date. Time logs will be created and remain in Draft mode and must be submitted
-			before manufacturing entry can be made."""
+			before manufacturing entry can be made.
+
+			:param calendars: Capacity calendars by workstation, shared by orders planned together."""
 
 		if not self.operations:
 			return
@@ -234,54 +237,60 @@ class ProductionOrder(Document):
 		time_logs = []
 		plan_days = frappe.db.get_single_value("Manufacturing Settings", "capacity_planning_for_days") or 30
 
+		if calendars is None:
+			calendars = get_capacity_calendars([d.workstation for d in self.operations if d.workstation],
+				self.planned_start_date or now_datetime())
+
 		for i, d in enumerate(self.operations):
 			self.set_operation_start_end_time(i, d)
 
-			time_log = make_time_log(self.name, d.operation, d.planned_start_time, d.planned_end_time,
-				flt(self.qty) - flt(d.completed_qty), self.project, d.workstation, operation_id=d.name)
-
-			if d.workstation:
+			slot_found, capacity_planned = True, False
+			calendar = calendars.get(d.workstation) if d.workstation else None
+			if calendar and d.planned_start_time:
 				# validate operating hours if workstation [not mandatory] is specified
-				self.check_operation_fits_in_working_hours(d)
-
-			original_start_time = time_log.from_time
-			while True:
-				_from_time = time_log.from_time
-
-				try:
-					time_log.save()
-					break
-				except WorkstationHolidayError:
-					time_log.move_to_next_day()
-				except NotInWorkingHoursError:
-					time_log.move_to_next_working_slot()
-				except OverlapError:
-					time_log.move_to_next_non_overlapping_slot()
-
-				# reset end time
-				time_log.to_time = get_datetime(time_log.from_time) + relativedelta(minutes=d.time_in_mins)
-
-				if date_diff(time_log.from_time, original_start_time) > plan_days:
+				self.check_operation_fits_in_calendar(d, calendar)
+
+				slot = calendar.find_slot(d.planned_start_time, d.time_in_mins, plan_days)
+				if slot:
+					d.planned_start_time, d.planned_end_time = slot
+					capacity_planned = True
+				else:
+					slot_found = False
 					frappe.msgprint(_("Unable to find Time Slot in the next {0} days for Operation {1}").format(plan_days, d.operation))
-					break
 
-				# if time log needs to be moved, make sure that the from time is not the same
-				if _from_time == time_log.from_time:
-					frappe.throw(_("Capacity Planning Error"))
+			if slot_found:
+				time_log = make_time_log(self.name, d.operation, d.planned_start_time, d.planned_end_time,
+					flt(self.qty) - flt(d.completed_qty), self.project, d.workstation, operation_id=d.name)
 
-			d.planned_start_time = time_log.from_time
-			d.planned_end_time = time_log.to_time
-			d.db_update()
+				# workstation timings are already checked against the calendar
+				time_log.flags.capacity_planned = capacity_planned
+				time_logs.append(time_log)
+
+				if capacity_planned:
+					calendar.reserve(time_log.from_time, time_log.to_time)
 
-			if time_log.name:
-				time_logs.append(time_log.name)
+			d.db_update()
 
 		self.planned_end_date = self.operations[-1].planned_end_time
 
+		# check overlaps of all the Time Logs together, instead of a query for each
+		validate_time_log_overlaps(time_logs)
+		for time_log in time_logs:
+			time_log.save()
+
+		time_logs = [time_log.name for time_log in time_logs]
 		if time_logs:
 			frappe.local.message_log = []
 			frappe.msgprint(_("Time Logs created:") + "\n" + "\n".join(time_logs))
 
+		return time_logs
+
+	def check_operation_fits_in_calendar(self, d, calendar):
+		"""Raises expection if operation is longer than working hours in the given workstation."""
+		longest_slot = calendar.get_longest_slot()
+		if longest_slot is not None and timedelta(minutes=flt(d.time_in_mins)) > longest_slot:
+			frappe.throw(_("Operation {0} longer than any available working hours in workstation {1}, break down the operation into multiple operations").format(d.operation, d.workstation), NotInWorkingHoursError)
+
 	def set_operation_start_end_time(self, i, d):
 		"""Set start and end time for given operation. If first operation, set start as
 		`planned_start_date`, else add time diff to end time of earlier operation."""
@@ -416,6 +425,47 @@ def get_events(start, end, filters=None):
 		}, as_dict=True, update={"allDay": 0})
 	return data
 
+@frappe.whitelist()
+def plan_time_logs(names):
+	"""Plan Time Logs of submitted Production Orders together, see `plan_production_orders`.
+
+	:param names: JSON list of Production Order names."""
+	frappe.has_permission("Production Order", "write", throw=True)
+	frappe.has_permission("Time Log", "create", throw=True)
+
+	if isinstance(names, basestring):
+		names = json.loads(names)
+
+	return plan_production_orders(names)
+
+def plan_production_orders(production_orders):
+	"""Plan Time Logs of many submitted Production Orders in one pass, in order of planned start,
+	sharing the capacity calendars of their workstations. Operations that already have
+	a Time Log are skipped. Returns the Time Logs created"""
+	orders = [frappe.get_doc("Production Order", name) for name in production_orders]
+	orders = [d for d in orders if d.docstatus == 1 and d.operations]
+	if not orders:
+		return []
+
+	orders.sort(key=lambda d: get_datetime(d.planned_start_date or now_datetime()))
+
+	planned = set(frappe.db.sql_list("""select operation_id from `tabTime Log`
+		where docstatus < 2 and production_order in ({0})""".format(", ".join(["%s"] * len(orders))),
+		tuple([d.name for d in orders])))
+
+	calendars = get_capacity_calendars([d.workstation for pro in orders for d in pro.operations if d.workstation],
+		orders[0].planned_start_date or now_datetime())
+
+	time_logs = []
+	for pro in orders:
+		if any(d.name in planned for d in pro.operations):
+			continue
+
+		time_logs += pro.make_time_logs(calendars) or []
+		pro.db_set("planned_end_date", pro.planned_end_date)
+
+	return time_logs
+
 @frappe.whitelist()
 def make_time_log(name, operation, from_time=None, to_time=None, qty=None,  project=None, workstation=None, operation_id=None):
 	time_log =  frappe.new_doc("Time Log")
@@ -14,5 +14,11 @@ frappe.listview_settings['Production Order'] = {
 				"Cancelled": "darkgrey"
 			}[doc.status], "status,=," + doc.status];
 		}
+	},
+	onload: function(listview) {
+		listview.page.add_menu_item(__("Plan Time Logs"), function() {
+			listview.call_for_selected_items(
+				"erpnext.manufacturing.doctype.production_order.production_order.plan_time_logs");
+		});
 	}
 };
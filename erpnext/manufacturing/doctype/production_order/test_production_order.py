@@ -145,6 +145,59 @@ class TestProductionOrder(unittest.TestCase):
 		prod_order = make_prod_order_test_record(item="_Test Variant Item", qty=1, do_not_save=True)
 		self.assertRaises(ItemHasVariantError, prod_order.save)
 
+	def test_time_logs_do_not_overlap_on_workstation(self):
+		planned_start_date = add_days(now(), 1)
+		orders = []
+		for i in xrange(3):
+			prod_order = make_prod_order_test_record(item="_Test FG Item 2",
+				planned_start_date=planned_start_date, qty=1, do_not_save=True)
+			prod_order.set_production_order_operations()
+			prod_order.insert()
+			prod_order.submit()
+			orders.append(prod_order.name)
+
+		time_logs = frappe.db.sql("""select from_time, to_time from `tabTime Log`
+			where production_order in ({0}) and workstation='_Test Workstation 1' and docstatus < 2
+			order by from_time""".format(", ".join(["%s"] * len(orders))), tuple(orders))
+
+		self.assertEqual(len(time_logs), 3)
+		for (from_time, to_time), (next_from_time, next_to_time) in zip(time_logs, time_logs[1:]):
+			self.assertTrue(to_time <= next_from_time)
+
+	def test_plan_production_orders(self):
+		from erpnext.manufacturing.doctype.production_order.production_order import plan_production_orders
+
+		planned_start_date = add_days(now(), 1)
+		orders = []
+		for i in xrange(3):
+			prod_order = make_prod_order_test_record(item="_Test FG Item 2",
+				planned_start_date=planned_start_date, qty=1, do_not_save=True)
+			prod_order.set_production_order_operations()
+			prod_order.insert()
+			prod_order.submit()
+			orders.append(prod_order.name)
+
+		# Time Logs of the first order are kept, the others are planned again together
+		kept = frappe.db.sql_list("""select name from `tabTime Log`
+			where production_order=%s and docstatus < 2""", orders[0])
+		for name in frappe.db.sql_list("""select name from `tabTime Log`
+			where production_order in (%s, %s) and docstatus < 2""", tuple(orders[1:])):
+				frappe.delete_doc("Time Log", name)
+
+		time_logs = plan_production_orders(orders)
+
+		self.assertEqual(len(time_logs), 2)
+		self.assertEqual(frappe.db.sql_list("""select name from `tabTime Log`
+			where production_order=%s and docstatus < 2""", orders[0]), kept)
+
+		time_logs = frappe.db.sql("""select from_time, to_time from `tabTime Log`
+			where production_order in ({0}) and workstation='_Test Workstation 1' and docstatus < 2
+			order by from_time""".format(", ".join(["%s"] * len(orders))), tuple(orders))
+
+		self.assertEqual(len(time_logs), 3)
+		for (from_time, to_time), (next_from_time, next_to_time) in zip(time_logs, time_logs[1:]):
+			self.assertTrue(to_time <= next_from_time)
+
 def make_prod_order_test_record(**args):
 	args = frappe._dict(args)
 
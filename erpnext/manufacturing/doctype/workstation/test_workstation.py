@@ -4,7 +4,9 @@ from __future__ import unicode_literals
 
 import frappe
 import unittest
+from datetime import datetime, timedelta
 from erpnext.manufacturing.doctype.workstation.workstation import check_if_within_operating_hours, NotInWorkingHoursError, WorkstationHolidayError
+from erpnext.manufacturing.doctype.workstation.workstation import CapacityCalendar
 
 test_dependencies = ["Warehouse"]
 test_records = frappe.get_test_records('Workstation')
@@ -20,3 +22,80 @@ class TestWorkstation(unittest.TestCase):
 			"_Test Workstation 1", "Operation 1", "2013-02-02 05:00:00", "2013-02-02 20:00:00")
 		self.assertRaises(WorkstationHolidayError, check_if_within_operating_hours,
 			"_Test Workstation 1", "Operation 1", "2013-02-01 10:00:00", "2013-02-02 20:00:00")
+
+	def get_calendar(self):
+		# 10:00 to 14:00 and 15:00 to 20:00, closed on Sundays, with a planned operation
+		start = datetime(2013, 2, 4, 10, 0)
+		return CapacityCalendar(working_hours=[(timedelta(hours=10), timedelta(hours=14)),
+				(timedelta(hours=15), timedelta(hours=20))],
+			holidays=[datetime(2013, 2, 10).date() + timedelta(days=7 * i) for i in xrange(100)],
+			busy=[(start, start + timedelta(hours=1))], gap=timedelta(minutes=10))
+
+	def test_capacity_calendar(self):
+		calendar = self.get_calendar()
+
+		# after the planned operation and the time between operations
+		self.assertEqual(calendar.find_slot("2013-02-04 10:00:00", 60),
+			(datetime(2013, 2, 4, 11, 10), datetime(2013, 2, 4, 12, 10)))
+
+		# does not fit before the break
+		self.assertEqual(calendar.find_slot("2013-02-04 13:30:00", 60)[0], datetime(2013, 2, 4, 15, 0))
+
+		# not on Sunday
+		self.assertEqual(calendar.find_slot("2013-02-09 19:30:00", 60)[0], datetime(2013, 2, 11, 10, 0))
+
+		# longer than any working slot
+		self.assertEqual(calendar.find_slot("2013-02-04 10:00:00", 360, plan_days=5), None)
+
+	def plan_orders(self, calendar, orders=1000, search_from_start=False):
+		planned = []
+		for i in xrange(orders):
+			from_time = datetime(2013, 2, 4, 10, 0) + timedelta(hours=i % 24)
+			for minutes in (30, 45, 60, 20, 90):
+				if search_from_start:
+					calendar.searched = {}
+
+				slot = calendar.find_slot(from_time, minutes, plan_days=1000)
+				calendar.reserve(*slot)
+				planned.append(slot)
+				from_time = slot[1] + calendar.gap
+
+		return planned
+
+	def count_overlap_checks(self, calendar):
+		checks = [0]
+		get_overlap = calendar.get_overlap
+
+		def _get_overlap(from_time, to_time):
+			checks[0] += 1
+			return get_overlap(from_time, to_time)
+
+		calendar.get_overlap = _get_overlap
+		return checks
+
+	def test_capacity_calendar_benchmark(self):
+		"""Plan 1000 orders of 5 operations each on one workstation"""
+		calendar = self.get_calendar()
+		checks = self.count_overlap_checks(calendar)
+		planned = self.plan_orders(calendar)
+
+		calendar = self.get_calendar()
+		checks_from_start = self.count_overlap_checks(calendar)
+		expected = self.plan_orders(calendar, search_from_start=True)
+
+		self.assertEqual(planned, expected)
+
+		# time already searched is skipped, instead of checking every busy period again
+		self.assertTrue(checks[0] <= 2 * len(planned))
+		self.assertTrue(checks[0] * 10 < checks_from_start[0])
+
+		calendar = self.get_calendar()
+		planned.sort()
+		for (from_time, to_time), (next_from_time, next_to_time) in zip(planned, planned[1:]):
+			self.assertTrue(to_time + calendar.gap <= next_from_time)
+
+		for from_time, to_time in planned:
+			midnight = datetime.combine(from_time.date(), datetime.min.time())
+			self.assertTrue(from_time.date() not in calendar.holidays)
+			self.assertTrue(any(from_time >= midnight + start and to_time <= midnight + end
+				for start, end in calendar.working_hours))
@@ -4,9 +4,11 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import flt, cint, getdate, formatdate, comma_and, time_diff_in_seconds, to_timedelta
+from frappe.utils import flt, cint, getdate, formatdate, comma_and, time_diff_in_seconds, to_timedelta, get_datetime
 from frappe.model.document import Document
 from dateutil.parser import parse
+from bisect import bisect_left, bisect_right
+from datetime import datetime, time, timedelta
 
 class WorkstationHolidayError(frappe.ValidationError): pass
 class NotInWorkingHoursError(frappe.ValidationError): pass
@@ -78,3 +80,150 @@ def check_workstation_for_holiday(workstation, from_datetime, to_datetime):
 		if applicable_holidays:
 			frappe.throw(_("Workstation is closed on the following dates as per Holiday List: {0}")
 				.format(holiday_list) + "\n" + "\n".join(applicable_holidays), WorkstationHolidayError)
+
+class CapacityCalendar(object):
+	"""Free time of a Workstation as per its working hours, holidays and planned Time Logs.
+	Finds the earliest slot for an operation in memory, instead of saving a Time Log
+	and moving it forward on every error"""
+	def __init__(self, working_hours=None, holidays=None, busy=None, gap=None):
+		# (start, end) as timedelta from midnight, operations are not restricted if empty
+		self.working_hours = sorted([d for d in (working_hours or []) if d[1] > d[0]])
+		self.holidays = set(holidays or [])
+		self.gap = gap or timedelta(0)
+
+		# duration: (from_time, slot_start) of the last search, there is no free slot of
+		# that duration in between as busy periods are only ever added
+		self.searched = {}
+
+		# busy periods followed by the time between operations, merged and sorted,
+		# so that both lists are in ascending order
+		self.starts, self.ends = [], []
+		for from_time, to_time in sorted(busy or []):
+			self.reserve(from_time, to_time)
+
+	def reserve(self, from_time, to_time):
+		"""Mark the period busy, merging it with the busy periods it overlaps or touches"""
+		from_time, to_time = get_datetime(from_time), get_datetime(to_time) + self.gap
+		i = bisect_left(self.ends, from_time)
+		j = bisect_right(self.starts, to_time)
+
+		if i < j:
+			from_time = min(from_time, self.starts[i])
+			to_time = max(to_time, self.ends[j - 1])
+
+		self.starts[i:j] = [from_time]
+		self.ends[i:j] = [to_time]
+
+	def get_overlap(self, from_time, to_time):
+		"""Returns end of the busy period overlapping the given period, if any"""
+		i = bisect_right(self.ends, from_time)
+		if i < len(self.starts) and self.starts[i] < to_time + self.gap:
+			return self.ends[i]
+
+	def get_holiday(self, from_time, to_time):
+		"""Returns the last holiday between the dates of the period, if any"""
+		if self.holidays:
+			day = to_time.date()
+			while day >= from_time.date():
+				if day in self.holidays:
+					return day
+				day -= timedelta(days=1)
+
+	def get_longest_slot(self):
+		return max([end - start for start, end in self.working_hours]) if self.working_hours else None
+
+	def get_working_slot(self, from_time, duration):
+		"""Returns earliest start on the day of `from_time` at which the operation fits
+		in a working slot"""
+		if not self.working_hours:
+			return from_time
+
+		midnight = datetime.combine(from_time.date(), time())
+		for start, end in self.working_hours:
+			start_time = max(from_time, midnight + start)
+			if start_time + duration <= midnight + end:
+				return start_time
+
+	def find_slot(self, from_time, minutes, plan_days=30):
+		"""Returns (from_time, to_time) of the earliest free slot for an operation of `minutes`,
+		at or after `from_time`. None if not found within `plan_days`"""
+		from_time = get_datetime(from_time)
+		duration = timedelta(minutes=flt(minutes))
+		last_day = from_time.date() + timedelta(days=cint(plan_days))
+		search_from = from_time
+
+		# skip the time already searched for operations of the same or shorter duration
+		for searched_duration, (searched_from, slot_start) in self.searched.items():
+			if searched_duration <= duration and searched_from <= from_time < slot_start:
+				from_time = slot_start
+
+		while from_time.date() <= last_day:
+			start_time = self.get_working_slot(from_time, duration)
+			if not start_time:
+				from_time = datetime.combine(from_time.date() + timedelta(days=1), time())
+				continue
+
+			from_time, to_time = start_time, start_time + duration
+
+			holiday = self.get_holiday(from_time, to_time)
+			if holiday:
+				from_time = datetime.combine(holiday + timedelta(days=1), time())
+				continue
+
+			busy_until = self.get_overlap(from_time, to_time)
+			if busy_until:
+				from_time = busy_until
+				continue
+
+			searched_from, slot_start = self.searched.get(duration, (None, None))
+			if not searched_from or not (searched_from <= search_from <= slot_start):
+				searched_from = search_from
+			self.searched[duration] = (searched_from, from_time)
+
+			return from_time, to_time
+
+def get_capacity_calendars(workstations, from_time):
+	"""Returns capacity calendar of every Workstation, with Time Logs ending after `from_time`"""
+	from erpnext.manufacturing.doctype.manufacturing_settings.manufacturing_settings \
+		import get_mins_between_operations
+
+	calendars = {}
+	workstations = list(set(workstations))
+	if not workstations:
+		return calendars
+
+	condition = ", ".join(["%s"] * len(workstations))
+	from_time = get_datetime(from_time)
+
+	working_hours = {}
+	if not cint(frappe.db.get_value("Manufacturing Settings", None, "allow_overtime")):
+		for d in frappe.db.sql("""select parent, start_time, end_time from `tabWorkstation Working Hour`
+			where parent in ({0}) and ifnull(start_time, '') != '' and ifnull(end_time, '') != ''""".format(condition),
+			tuple(workstations), as_dict=1):
+				working_hours.setdefault(d.parent, []).append((to_timedelta(d.start_time),
+					to_timedelta(d.end_time)))
+
+	holiday_lists = dict(frappe.db.sql("""select name, holiday_list from `tabWorkstation`
+		where name in ({0})""".format(condition), tuple(workstations)))
+
+	holidays = {}
+	if not cint(frappe.db.get_value("Manufacturing Settings", None, "allow_production_on_holidays")):
+		lists = list(set([d for d in holiday_lists.values() if d]))
+		if lists:
+			for holiday_list, holiday_date in frappe.db.sql("""select parent, holiday_date from `tabHoliday`
+				where parent in ({0}) and holiday_date >= %s""".format(", ".join(["%s"] * len(lists))),
+				tuple(lists + [from_time.date()])):
+					holidays.setdefault(holiday_list, []).append(getdate(holiday_date))
+
+	busy = {}
+	for workstation, start_time, end_time in frappe.db.sql("""select workstation, from_time, to_time
+		from `tabTime Log` where workstation in ({0}) and docstatus < 2 and to_time > %s""".format(condition),
+		tuple(workstations + [from_time])):
+			busy.setdefault(workstation, []).append((get_datetime(start_time), get_datetime(end_time)))
+
+	gap = get_mins_between_operations()
+	for workstation in workstations:
+		calendars[workstation] = CapacityCalendar(working_hours.get(workstation),
+			holidays.get(holiday_lists.get(workstation)), busy.get(workstation), gap)
+
+	return calendars
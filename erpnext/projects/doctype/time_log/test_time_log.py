@@ -8,6 +8,8 @@ import unittest
 import datetime
 from frappe.utils import now_datetime, now
 from erpnext.projects.doctype.time_log.time_log import OverlapError, NotSubmittedError, NegativeHoursError
+from erpnext.projects.doctype.time_log.time_log import (get_time_log_overlaps,
+	validate_time_log_overlaps, get_overlapping_time_logs)
 from erpnext.manufacturing.doctype.workstation.workstation import WorkstationHolidayError, NotInWorkingHoursError
 from erpnext.manufacturing.doctype.production_order.test_production_order import make_prod_order_test_record
 
@@ -37,6 +39,39 @@ class TestTimeLog(unittest.TestCase):
 			from_time= tl1.to_time, 
 			to_time= tl1.to_time + datetime.timedelta(hours=1))
 
+	def test_overlaps_in_batch(self):
+		tl1 = make_time_log_test_record(employee= "_T-Employee-0002", simulate= True)
+		from_time = tl1.to_time + datetime.timedelta(hours=1)
+
+		batch = [
+			# overlaps the saved Time Log
+			{"employee": "_T-Employee-0002", "from_time": tl1.from_time + datetime.timedelta(minutes=30),
+				"to_time": tl1.to_time + datetime.timedelta(minutes=30)},
+			# overlap each other
+			{"employee": "_T-Employee-0002", "from_time": from_time, "to_time": from_time + datetime.timedelta(hours=2)},
+			{"employee": "_T-Employee-0002", "from_time": from_time + datetime.timedelta(hours=1),
+				"to_time": from_time + datetime.timedelta(hours=3)},
+			# starts when the previous one ends
+			{"employee": "_T-Employee-0002", "from_time": from_time + datetime.timedelta(hours=3),
+				"to_time": from_time + datetime.timedelta(hours=4)}
+		]
+
+		overlaps = get_time_log_overlaps(batch)
+		self.assertEqual([d.idx for d in overlaps], [0, 1, 2])
+		self.assertEqual(overlaps[0].overlapping.name, tl1.name)
+		self.assertEqual(overlaps[0].fieldname, "employee")
+		self.assertEqual(overlaps[1].overlapping.idx, 2)
+
+		time_logs = [make_time_log_test_record(employee= "_T-Employee-0002", from_time= d["from_time"],
+			to_time= d["to_time"], do_not_save= 1) for d in batch[1:]]
+		self.assertRaises(OverlapError, validate_time_log_overlaps, time_logs)
+
+		validate_time_log_overlaps(time_logs[2:])
+		time_logs[2].insert()
+
+		self.assertEqual(get_overlapping_time_logs("[]", '["employee"]'), [])
+		self.assertRaises(frappe.ValidationError, get_overlapping_time_logs, "[]", '["name"]')
+
 	def test_production_order_status(self):
 		prod_order = make_prod_order_test_record(item= "_Test FG Item 2", qty= 1, do_not_submit= True)
 		prod_order.set_production_order_operations()
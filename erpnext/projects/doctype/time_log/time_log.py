@@ -2,9 +2,9 @@
 # License: GNU General Public License v3. See license.txt
 
 from __future__ import unicode_literals
-import frappe
+import frappe, json
 from frappe import _
-from frappe.utils import flt, get_datetime, get_time, getdate
+from frappe.utils import cstr, flt, get_datetime, get_time, getdate
 from dateutil.relativedelta import relativedelta
 from erpnext.manufacturing.doctype.manufacturing_settings.manufacturing_settings import get_mins_between_operations
 
@@ -13,6 +13,9 @@ class OverProductionLoggedError(frappe.ValidationError): pass
 class NotSubmittedError(frappe.ValidationError): pass
 class NegativeHoursError(frappe.ValidationError): pass
 
+# a Time Log cannot overlap another one with the same value of these fields
+overlap_fields = ("user", "employee", "workstation")
+
 from frappe.model.document import Document
 
 class TimeLog(Document):
@@ -70,37 +73,19 @@ class TimeLog(Document):
 			self.title = self.task or self.project or get_fullname(frappe.session.user)
 
 	def validate_overlap(self):
-		"""Checks if 'Time Log' entries overlap for a user, workstation. """
-		self.validate_overlap_for("user")
-		self.validate_overlap_for("employee")
-		self.validate_overlap_for("workstation")
+		"""Checks if 'Time Log' entries overlap for a user, employee or workstation. """
+		if self.flags.overlap_validated:
+			# already checked with the other Time Logs of its batch
+			self.flags.overlap_validated = False
+		else:
+			check_time_log_overlaps([self])
 
 	def validate_overlap_for(self, fieldname):
-		existing = self.get_overlap_for(fieldname)
-		if existing:
-			frappe.throw(_("This Time Log conflicts with {0} for {1} {2}").format(existing.name,
-				self.meta.get_label(fieldname), self.get(fieldname)), OverlapError)
+		check_time_log_overlaps([self], [fieldname])
 
 	def get_overlap_for(self, fieldname):
-		if not self.get(fieldname):
-			return
-
-		existing = frappe.db.sql("""select name, from_time, to_time from `tabTime Log`
-			where `{0}`=%(val)s and
-			(
-				(%(from_time)s > from_time and %(from_time)s < to_time) or 
-				(%(to_time)s > from_time and %(to_time)s < to_time) or 
-				(%(from_time)s <= from_time and %(to_time)s >= to_time))
-			and name!=%(name)s
-			and docstatus < 2""".format(fieldname),
-			{
-				"val": self.get(fieldname),
-				"from_time": self.from_time,
-				"to_time": self.to_time,
-				"name": self.name or "No Name"
-			}, as_dict=True)
-
-		return existing[0] if existing else None
+		overlaps = get_time_log_overlaps([self], [fieldname])
+		return overlaps[0].overlapping if overlaps else None
 
 	def validate_timings(self):
 		if self.to_time and self.from_time and get_datetime(self.to_time) <= get_datetime(self.from_time):
@@ -125,7 +110,7 @@ class TimeLog(Document):
 
 	def check_workstation_timings(self):
 		"""Checks if **Time Log** is between operating hours of the **Workstation**."""
-		if self.workstation and self.from_time and self.to_time:
+		if self.workstation and self.from_time and self.to_time and not self.flags.capacity_planned:
 			from erpnext.manufacturing.doctype.workstation.workstation import check_if_within_operating_hours
 			check_if_within_operating_hours(self.workstation, self.operation, self.from_time, self.to_time)
 
@@ -249,6 +234,117 @@ class TimeLog(Document):
 			frappe.get_doc("Project", self.project).update_project()
 
 
+def validate_time_log_overlaps(time_logs):
+	"""Throws OverlapError if any of the Time Logs overlaps an existing Time Log or another one
+	of the batch. Marks the documents checked, so that they are not checked again when saved next"""
+	check_time_log_overlaps(time_logs)
+
+	for time_log in time_logs:
+		if isinstance(time_log, Document):
+			time_log.flags.overlap_validated = True
+
+def check_time_log_overlaps(time_logs, fieldnames=None):
+	overlaps = get_time_log_overlaps(time_logs, fieldnames)
+	if overlaps:
+		d = overlaps[0]
+		frappe.throw(_("This Time Log conflicts with {0} for {1} {2}").format(d.overlapping.name or _("another Time Log"),
+			frappe.get_meta("Time Log").get_label(d.fieldname), d.value), OverlapError)
+
+@frappe.whitelist()
+def get_overlapping_time_logs(time_logs, fieldnames=None):
+	"""Returns overlaps of Time Logs to be imported, see `get_time_log_overlaps`.
+
+	:param time_logs: JSON list of dicts with `from_time`, `to_time`, `name` if saved,
+		and the fields to check.
+	:param fieldnames: JSON list of fields to check, all if not set."""
+	frappe.has_permission("Time Log", throw=True)
+
+	if isinstance(time_logs, basestring):
+		time_logs = json.loads(time_logs)
+
+	if isinstance(fieldnames, basestring):
+		fieldnames = json.loads(fieldnames)
+
+	return get_time_log_overlaps(time_logs, fieldnames)
+
+def get_time_log_overlaps(time_logs, fieldnames=None):
+	"""Returns overlaps of the Time Logs by user, employee and workstation, with existing Time Logs
+	and with each other. Uses one query for each field for the whole batch.
+
+	:param time_logs: Time Log documents or dicts with `from_time`, `to_time`, `name` if saved,
+		and the fields to check.
+	:param fieldnames: Fields to check, all if not set."""
+	for fieldname in (fieldnames or []):
+		if fieldname not in overlap_fields:
+			frappe.throw(_("Cannot check overlaps of Time Logs by {0}").format(fieldname))
+
+	time_logs = [frappe._dict({
+		"idx": i,
+		"name": d.get("name"),
+		"from_time": get_datetime(d.get("from_time")),
+		"to_time": get_datetime(d.get("to_time")),
+		"fields": d
+	}) for i, d in enumerate(time_logs) if d.get("from_time") and d.get("to_time")]
+
+	if not time_logs:
+		return []
+
+	from_time = min([d.from_time for d in time_logs])
+	to_time = max([d.to_time for d in time_logs])
+	names = [d.name for d in time_logs if d.name] or ["No Name"]
+
+	overlaps = []
+	for fieldname in (fieldnames or overlap_fields):
+		# values are compared case insensitive, as in the database
+		buckets, values = {}, {}
+		for d in time_logs:
+			value = d.fields.get(fieldname)
+			if value:
+				buckets.setdefault(cstr(value).lower(), []).append(d)
+				values.setdefault(cstr(value).lower(), value)
+
+		if not buckets:
+			continue
+
+		for d in frappe.db.sql("""select name, `{0}` as value, from_time, to_time from `tabTime Log`
+			where `{0}` in ({1}) and from_time < %s and to_time > %s and name not in ({2})
+				and docstatus < 2""".format(fieldname, ", ".join(["%s"] * len(buckets)), ", ".join(["%s"] * len(names))),
+			tuple(values.values() + [to_time, from_time] + names), as_dict=True):
+				buckets[cstr(d.value).lower()].append(frappe._dict({"name": d.name, "from_time": get_datetime(d.from_time),
+					"to_time": get_datetime(d.to_time), "existing": True}))
+
+		for key, intervals in buckets.iteritems():
+			for time_log, overlapping in get_overlapping_intervals(intervals):
+				overlaps.append(frappe._dict({
+					"idx": time_log.idx,
+					"name": time_log.name,
+					"fieldname": fieldname,
+					"value": values[key],
+					"overlapping": frappe._dict({"idx": overlapping.idx, "name": overlapping.name,
+						"from_time": overlapping.from_time, "to_time": overlapping.to_time})
+				}))
+
+	return sorted(overlaps, key=lambda d: d.idx)
+
+def get_overlapping_intervals(intervals):
+	"""Returns (time_log, overlapping) for every Time Log of the batch that overlaps another interval.
+	In order of start, an interval overlaps one starting before it if it starts before the latest
+	end so far, and one starting after it if the next interval starts before it ends."""
+	intervals = sorted(intervals, key=lambda d: (d.from_time, d.to_time))
+	overlapping, last = [], None
+
+	for i, d in enumerate(intervals):
+		if not d.existing:
+			if last and d.from_time < last.to_time:
+				overlapping.append((d, last))
+			elif i + 1 < len(intervals) and intervals[i + 1].from_time < d.to_time:
+				overlapping.append((d, intervals[i + 1]))
+
+		if not last or d.to_time > last.to_time:
+			last = d
+
+	return overlapping
+
 @frappe.whitelist()
 def get_events(start, end, filters=None):
 	"""Returns events for Gantt / Calendar view rendering.
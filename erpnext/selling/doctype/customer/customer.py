@@ -188,11 +188,16 @@ def check_credit_limit(customer, company):
 				.format(" / " + credit_controller if credit_controller else ""))
 
 def get_customer_outstanding(customer, company):
+	from erpnext.accounts.doctype.open_item.open_item import use_open_items, get_party_outstanding
+
 	# Outstanding based on GL Entries
-	outstanding_based_on_gle = frappe.db.sql("""select sum(debit) - sum(credit)
-		from `tabGL Entry` where party_type = 'Customer' and party = %s and company=%s""", (customer, company))
+	if use_open_items():
+		outstanding_based_on_gle = get_party_outstanding("Customer", customer, company)
+	else:
+		outstanding_based_on_gle = frappe.db.sql("""select sum(debit) - sum(credit)
+			from `tabGL Entry` where party_type = 'Customer' and party = %s and company=%s""", (customer, company))
 
-	outstanding_based_on_gle = flt(outstanding_based_on_gle[0][0]) if outstanding_based_on_gle else 0
+		outstanding_based_on_gle = flt(outstanding_based_on_gle[0][0]) if outstanding_based_on_gle else 0
 
 	# Outstanding based on Sales Order
 	outstanding_based_on_so = frappe.db.sql("""
@@ -11,6 +11,8 @@ from dateutil.relativedelta import relativedelta
 from frappe.core.doctype.user.user import STANDARD_USERS
 import frappe.desk.notifications
 from erpnext.accounts.utils import get_balance_on
+from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+	import use_account_period_balances, is_month_aligned
 
 user_specific_content = ["calendar_events", "todo_list"]
 
@@ -247,16 +249,29 @@ class EmailDigest(Document):
 
 	def get_period_amounts(self, accounts):
 		"""Get amounts for current and past periods"""
-		balance = past_balance = 0.0
-		for account in accounts:
-			balance += (get_balance_on(account, date = self.future_to_date)
-				- get_balance_on(account, date = self.future_from_date))
-
-			past_balance += (get_balance_on(account, date = self.past_to_date)
-				- get_balance_on(account, date = self.past_from_date))
+		balance = self.get_period_balance(accounts, self.future_from_date, self.future_to_date)
+		past_balance = self.get_period_balance(accounts, self.past_from_date, self.past_to_date)
 
 		return balance, past_balance
 
+	def get_period_balance(self, accounts, from_date, to_date):
+		"""Debit - credit of the accounts between the dates, excluding period closing entries.
+		Read from Account Period Balances if they are maintained and the dates cover whole months"""
+		if not accounts:
+			return 0.0
+
+		if use_account_period_balances(self.company) and is_month_aligned(from_date, to_date):
+			table, date_field = "`tabAccount Period Balance`", "period_start"
+			closing_condition = "is_period_closing=0"
+		else:
+			table, date_field = "`tabGL Entry`", "posting_date"
+			closing_condition = "ifnull(voucher_type, '')!='Period Closing Voucher'"
+
+		return flt(frappe.db.sql("""select sum(debit) - sum(credit) from {0}
+			where company=%s and account in ({1}) and {2} between %s and %s and {3}""".format(table,
+				", ".join(["%s"] * len(accounts)), date_field, closing_condition),
+			tuple([self.company] + accounts + [from_date, to_date]))[0][0])
+
 	def get_type_balance(self, fieldname, account_type):
 		accounts = [d.name for d in \
 			frappe.db.get_all("Account", filters={"account_type": account_type,
@@ -3,7 +3,7 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import flt, nowdate
+from frappe.utils import flt, cstr, nowdate, get_datetime
 import frappe.defaults
 from frappe.model.document import Document
 
@@ -24,26 +24,65 @@ class Bin(Document):
 				self.set(f, 0.0)
 
 	def update_stock(self, args, allow_negative_stock=False, via_landed_cost_voucher=False):
-		self.update_qty(args)
+		self.update_stock_for_entries([args], allow_negative_stock, via_landed_cost_voucher)
 
-		if args.get("actual_qty") or args.get("voucher_type") == "Stock Reconciliation":
+	def update_stock_for_entries(self, entries, allow_negative_stock=False, via_landed_cost_voucher=False):
+		"""Update qty for the Stock Ledger Entries of a voucher, repost once from the earliest
+		entry and save"""
+		self.reload_for_update()
+
+		for args in entries:
+			self.set_qty(args)
+
+		to_repost = []
+		for args in entries:
+			if args.get("actual_qty") or args.get("voucher_type") == "Stock Reconciliation":
+				if not args.get("posting_date"):
+					args["posting_date"] = nowdate()
+
+				# update valuation and qty after transaction for post dated entry
+				if not (args.get("is_cancelled") == "Yes" and via_landed_cost_voucher):
+					to_repost.append(args)
+
+		if to_repost:
 			from erpnext.stock.stock_ledger import update_entries_after
+			from erpnext.stock.doctype.stock_repost_request.stock_repost_request import repost_in_background
 
-			if not args.get("posting_date"):
-				args["posting_date"] = nowdate()
+			args = min(to_repost, key=lambda args: get_datetime("{0} {1}".format(cstr(args.get("posting_date")),
+				cstr(args.get("posting_time") or "00:00"))))
 
-			# update valuation and qty after transaction for post dated entry
-			if args.get("is_cancelled") == "Yes" and via_landed_cost_voucher:
-				return
-			update_entries_after({
+			repost = update_entries_after({
 				"item_code": self.item_code,
 				"warehouse": self.warehouse,
 				"posting_date": args.get("posting_date"),
 				"posting_time": args.get("posting_time"),
 				"voucher_no": args.get("voucher_no")
-			}, allow_negative_stock=allow_negative_stock, via_landed_cost_voucher=via_landed_cost_voucher)
+			}, allow_negative_stock=allow_negative_stock, via_landed_cost_voucher=via_landed_cost_voucher,
+				stop_on_match=True, repost_future_in_background=repost_in_background(), save_bin=False)
+
+			# bin is updated once the queued reposting is complete
+			if not repost.repost_queued:
+				self.update({
+					"valuation_rate": repost.valuation_rate,
+					"actual_qty": repost.qty_after_transaction,
+					"stock_value": repost.stock_value
+				})
+				self.flags.via_stock_ledger_entry = True
+
+		self.save()
+
+	def reload_for_update(self):
+		"""Reload quantities with a locking read, the Bin may have been loaded from a snapshot
+		taken before another voucher posting the same item and warehouse was committed"""
+		values = frappe.db.sql("""select * from `tabBin` where name=%s for update""", self.name, as_dict=1)
+		if values:
+			self.update(values[0])
 
 	def update_qty(self, args):
+		self.set_qty(args)
+		self.save()
+
+	def set_qty(self, args):
 		# update the stock values (for current quantities)
 		if args.get("voucher_type")=="Stock Reconciliation":
 			if args.get('is_cancelled') == 'No':
@@ -68,8 +107,6 @@ class Bin(Document):
 		self.projected_qty = flt(self.actual_qty) + flt(self.ordered_qty) + \
 		 	flt(self.indented_qty) + flt(self.planned_qty) - flt(self.reserved_qty)
 
-		self.save()
-
 	def get_first_sle(self):
 		sle = frappe.db.sql("""
 			select * from `tabStock Ledger Entry`
@@ -513,6 +513,31 @@ class TestDeliveryNote(unittest.TestCase):
 		self.assertEqual(dn.per_billed, 100)
 		self.assertEqual(dn.status, "Completed")
 
+	def test_delivery_status_for_many_items(self):
+		from erpnext.selling.doctype.sales_order.sales_order import make_delivery_note
+
+		make_stock_entry(target="_Test Warehouse - _TC", qty=500, basic_rate=100)
+		so = make_sales_order(item_list=[{"item_code": "_Test Item", "warehouse": "_Test Warehouse - _TC",
+			"qty": 5, "rate": 100, "conversion_factor": 1.0} for i in xrange(40)])
+
+		dn = make_delivery_note(so.name)
+		for i, d in enumerate(dn.get("items")):
+			d.qty = 5 if i < 20 else 2
+		dn.insert()
+		dn.submit()
+
+		so.load_from_db()
+		self.assertEqual([d.delivered_qty for d in so.get("items")], [5] * 20 + [2] * 20)
+		self.assertEqual(so.per_delivered, 70)
+		self.assertEqual(so.delivery_status, "Partly Delivered")
+		self.assertEqual(so.status, "To Deliver and Bill")
+
+		dn.cancel()
+		so.load_from_db()
+		self.assertEqual([d.delivered_qty for d in so.get("items")], [0] * 40)
+		self.assertEqual(so.per_delivered, 0)
+		self.assertEqual(so.delivery_status, "Not Delivered")
+
 def create_delivery_note(**args):
 	dn = frappe.new_doc("Delivery Note")
 	args = frappe._dict(args)
@@ -316,8 +316,9 @@ class Item(WebsiteGenerator):
 
 		[self.remove(d) for d in to_remove]
 
-	def update_template_tables(self):
-		template = frappe.get_doc("Item", self.variant_of)
+	def update_template_tables(self, template=None):
+		if not template:
+			template = frappe.get_doc("Item", self.variant_of)
 
 		# add item taxes from template
 		for d in template.get("taxes"):
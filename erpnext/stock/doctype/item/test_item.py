@@ -86,6 +86,63 @@ class TestItem(unittest.TestCase):
 		for key, value in to_check.iteritems():
 			self.assertEquals(value, details.get(key))
 
+	def test_get_items_details(self):
+		from erpnext.stock.get_item_details import get_item_details, get_items_details
+
+		make_test_records("Item Price")
+
+		args = {
+			"company": "_Test Company",
+			"price_list": "_Test Price List",
+			"currency": "_Test Currency",
+			"doctype": "Sales Order",
+			"conversion_rate": 1,
+			"price_list_currency": "_Test Currency",
+			"plc_conversion_rate": 1,
+			"order_type": "Sales",
+			"customer": "_Test Customer"
+		}
+		items = [{"item_code": "_Test Item", "qty": 2}, {"item_code": "_Test Item 2"},
+			{"item_code": "_Test Item", "qty": 5}]
+
+		details = get_items_details(args.copy(), items)
+		self.assertEquals([d.item_code for d in details], ["_Test Item", "_Test Item 2", "_Test Item"])
+
+		for i, item in enumerate(items):
+			item_args = args.copy()
+			item_args.update(item)
+			self.assertEquals(details[i], get_item_details(item_args))
+
+	def test_get_items_details_inserts_price_once(self):
+		from erpnext.stock.get_item_details import get_items_details
+
+		make_item("_Test Item for Auto Price List", {"is_stock_item": 0, "is_pro_applicable": 0, "is_sales_item": 1})
+		frappe.db.set_value("Stock Settings", None, "auto_insert_price_list_rate_if_missing", 1)
+
+		for item_price in frappe.get_all("Item Price", filters={"price_list": "_Test Price List",
+			"item_code": "_Test Item for Auto Price List"}):
+				frappe.delete_doc("Item Price", item_price.name)
+
+		args = {
+			"company": "_Test Company",
+			"price_list": "_Test Price List",
+			"currency": "_Test Currency",
+			"doctype": "Sales Order",
+			"conversion_rate": 1,
+			"price_list_currency": "_Test Currency",
+			"plc_conversion_rate": 1,
+			"order_type": "Sales",
+			"customer": "_Test Customer"
+		}
+		items = [{"item_code": "_Test Item for Auto Price List", "qty": 2, "rate": 100},
+			{"item_code": "_Test Item for Auto Price List", "qty": 5, "rate": 100}]
+
+		details = get_items_details(args, items)
+
+		self.assertEquals(frappe.db.sql_list("""select price_list_rate from `tabItem Price`
+			where price_list='_Test Price List' and item_code='_Test Item for Auto Price List'"""), [100])
+		self.assertEquals(details[1].price_list_rate, 100)
+
 	def test_make_item_variant(self):
 		frappe.delete_doc_if_exists("Item", "_Test Variant Item-L", force=1)
 
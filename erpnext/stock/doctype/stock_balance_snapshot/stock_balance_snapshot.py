@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint, flt, get_first_day, get_last_day
+from frappe.model.document import Document
+from frappe.model.naming import set_new_name
+
+class StockBalanceSnapshot(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabStock Balance Snapshot`
+		where Key_name="item_warehouse_period_end" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabStock Balance Snapshot`
+			add unique index item_warehouse_period_end(item_code, warehouse, period_end)""")
+
+def use_stock_balance_snapshots():
+	return cint(frappe.db.get_single_value("Stock Settings", "maintain_stock_balance_snapshots"))
+
+def update_stock_balance_snapshots(item_code, warehouse, posting_date=None):
+	"""Regenerate closing stock of the item and warehouse for the months from posting date,
+	after its Stock Ledger is reposted"""
+	if not use_stock_balance_snapshots():
+		return
+
+	conditions = "item_code=%(item_code)s and warehouse=%(warehouse)s"
+	values = {"item_code": item_code, "warehouse": warehouse}
+
+	if posting_date:
+		values.update({"period_end": get_last_day(posting_date), "month_start": get_first_day(posting_date)})
+
+	frappe.db.sql("""delete from `tabStock Balance Snapshot` where {0} {1}""".format(conditions,
+		"and period_end >= %(period_end)s" if posting_date else ""), values)
+
+	for d in get_closing_stock_from_sle(conditions
+		+ (" and posting_date >= %(month_start)s" if posting_date else ""), values):
+			make_snapshot(d)
+
+def get_closing_stock_from_sle(conditions, values):
+	"""Returns the last Stock Ledger Entry of every item, warehouse and month"""
+	last_entries = frappe.db.sql_list("""select
+			max(concat(timestamp(posting_date, posting_time), '|', name))
+		from `tabStock Ledger Entry`
+		where ifnull(is_cancelled, 'No')='No' and {0}
+		group by item_code, warehouse, last_day(posting_date)""".format(conditions), values)
+
+	names = [d.split("|", 1)[1] for d in last_entries]
+
+	closing_stock = []
+	for i in xrange(0, len(names), 1000):
+		closing_stock += frappe.db.sql("""select company, item_code, warehouse,
+				last_day(posting_date) as period_end, qty_after_transaction, valuation_rate, stock_value
+			from `tabStock Ledger Entry` where name in ({0})""".format(
+			", ".join(["%s"] * len(names[i:i + 1000]))), tuple(names[i:i + 1000]), as_dict=1)
+
+	return closing_stock
+
+def make_snapshot(values):
+	snapshot = frappe.get_doc({
+		"doctype": "Stock Balance Snapshot",
+		"company": values.company,
+		"item_code": values.item_code,
+		"warehouse": values.warehouse,
+		"period_end": values.period_end,
+		"qty_after_transaction": flt(values.qty_after_transaction),
+		"valuation_rate": flt(values.valuation_rate),
+		"stock_value": flt(values.stock_value)
+	})
+	set_new_name(snapshot)
+	snapshot.db_insert()
+
+def get_opening_stock(date, item_code=None, warehouse=None):
+	"""Returns closing stock as per the latest snapshot before the month of `date`,
+	for every item and warehouse"""
+	conditions, values = "", {"month_start": get_first_day(date)}
+	if item_code:
+		conditions += " and item_code=%(item_code)s"
+		values["item_code"] = item_code
+
+	if warehouse:
+		conditions += " and warehouse=%(warehouse)s"
+		values["warehouse"] = warehouse
+
+	return frappe.db.sql("""select snapshot.company, snapshot.item_code, snapshot.warehouse,
+			snapshot.qty_after_transaction, snapshot.valuation_rate, snapshot.stock_value
+		from `tabStock Balance Snapshot` snapshot,
+			(select item_code, warehouse, max(period_end) as period_end
+				from `tabStock Balance Snapshot`
+				where period_end < %(month_start)s {0}
+				group by item_code, warehouse) latest
+		where snapshot.item_code = latest.item_code and snapshot.warehouse = latest.warehouse
+			and snapshot.period_end = latest.period_end""".format(conditions), values, as_dict=1)
+
+def rebuild_stock_balance_snapshots(company):
+	"""Regenerate stock balance snapshots of the company from Stock Ledger Entries"""
+	frappe.db.sql("delete from `tabStock Balance Snapshot` where company=%s", company)
+
+	for d in get_closing_stock_from_sle("company=%(company)s", {"company": company}):
+		make_snapshot(d)
+
+def check_stock_balance_snapshots(company):
+	"""Returns list of snapshots that do not match Stock Ledger Entries"""
+	fields = ("qty_after_transaction", "valuation_rate", "stock_value")
+
+	def get_key(d):
+		return (d.item_code, d.warehouse, str(d.period_end))
+
+	expected = dict((get_key(d), d) for d in
+		get_closing_stock_from_sle("company=%(company)s", {"company": company}))
+	actual = dict((get_key(d), d) for d in frappe.db.sql("""select item_code, warehouse, period_end, {0}
+		from `tabStock Balance Snapshot` where company=%s""".format(", ".join(fields)), company, as_dict=1))
+
+	mismatches = []
+	for key in sorted(set(expected.keys() + actual.keys())):
+		sle, snapshot = expected.get(key, {}), actual.get(key, {})
+		if any(flt(sle.get(f), 6) != flt(snapshot.get(f), 6) for f in fields):
+			mismatches.append(frappe._dict({
+				"item_code": key[0],
+				"warehouse": key[1],
+				"period_end": key[2],
+				"qty_as_per_sle": flt(sle.get("qty_after_transaction")),
+				"qty_as_per_snapshot": flt(snapshot.get("qty_after_transaction")),
+				"value_as_per_sle": flt(sle.get("stock_value")),
+				"value_as_per_snapshot": flt(snapshot.get("stock_value"))
+			}))
+
+	return mismatches
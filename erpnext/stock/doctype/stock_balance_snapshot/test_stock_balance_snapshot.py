@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import add_months, get_first_day, nowdate
+from erpnext.stock.doctype.stock_entry.test_stock_entry import make_stock_entry
+from erpnext.stock.report.stock_balance.stock_balance import execute
+from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+	import rebuild_stock_balance_snapshots, check_stock_balance_snapshots
+
+class TestStockBalanceSnapshot(unittest.TestCase):
+	def tearDown(self):
+		frappe.db.set_value("Stock Settings", None, "maintain_stock_balance_snapshots", 0)
+
+	def get_stock_balance(self):
+		return execute({
+			"from_date": get_first_day(nowdate()),
+			"to_date": nowdate(),
+			"item_code": "_Test Item 2",
+			"warehouse": "_Test Warehouse 1 - _TC"
+		})[1]
+
+	def test_stock_balance_from_snapshots(self):
+		for months in (-2, -1, 0):
+			make_stock_entry(item_code="_Test Item 2", target="_Test Warehouse 1 - _TC", qty=5,
+				basic_rate=100, posting_date=get_first_day(add_months(nowdate(), months)))
+
+		stock_balance = self.get_stock_balance()
+
+		frappe.db.set_value("Stock Settings", None, "maintain_stock_balance_snapshots", 1)
+		rebuild_stock_balance_snapshots("_Test Company")
+		self.assertEqual(self.get_stock_balance(), stock_balance)
+
+		# back-dated entry regenerates the later snapshots
+		se = make_stock_entry(item_code="_Test Item 2", target="_Test Warehouse 1 - _TC", qty=3,
+			basic_rate=200, posting_date=get_first_day(add_months(nowdate(), -2)))
+		self.assertEqual(check_stock_balance_snapshots("_Test Company"), [])
+
+		stock_balance_with_snapshots = self.get_stock_balance()
+		frappe.db.set_value("Stock Settings", None, "maintain_stock_balance_snapshots", 0)
+		self.assertEqual(self.get_stock_balance(), stock_balance_with_snapshots)
+
+		frappe.db.set_value("Stock Settings", None, "maintain_stock_balance_snapshots", 1)
+		se.cancel()
+		self.assertEqual(check_stock_balance_snapshots("_Test Company"), [])
+		self.assertEqual(self.get_stock_balance(), stock_balance)
@@ -4,7 +4,7 @@
 from __future__ import unicode_literals
 import frappe, unittest
 import frappe.defaults
-from frappe.utils import flt, nowdate, nowtime
+from frappe.utils import flt, nowdate, nowtime, add_days
 from erpnext.stock.doctype.serial_no.serial_no import *
 from erpnext.stock.doctype.purchase_receipt.test_purchase_receipt \
 	import set_perpetual_inventory
@@ -590,6 +590,158 @@ class TestStockEntry(unittest.TestCase):
 		s2.submit()
 		s2.cancel()
 
+	def test_back_dated_entry_reposting_in_chunks(self):
+		from erpnext.stock.stock_ledger import update_entries_after
+		item_code = "_Test Item 2"
+		warehouse = "_Test Warehouse 1 - _TC"
+
+		for i in xrange(5):
+			make_stock_entry(item_code=item_code, target=warehouse, qty=1, basic_rate=10,
+				posting_date=add_days(nowdate(), -5 + i))
+
+		qty_before = flt(get_sle(item_code=item_code, warehouse=warehouse)[0].qty_after_transaction)
+
+		chunk_size = update_entries_after.chunk_size
+		update_entries_after.chunk_size = 2
+		try:
+			make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=20,
+				posting_date=add_days(nowdate(), -8))
+		finally:
+			update_entries_after.chunk_size = chunk_size
+
+		qty_after = flt(get_sle(item_code=item_code, warehouse=warehouse)[0].qty_after_transaction)
+		self.assertEqual(qty_after, qty_before + 10)
+		self.assertEqual(flt(frappe.db.get_value("Bin", {"item_code": item_code,
+			"warehouse": warehouse}, "actual_qty")), qty_after)
+
+	def test_checkpoint_of_later_reposting_not_resumed(self):
+		from erpnext.stock.stock_ledger import update_entries_after
+		item_code = "_Test Item 2"
+		warehouse = "_Test Warehouse 1 - _TC"
+
+		for i in xrange(3):
+			make_stock_entry(item_code=item_code, target=warehouse, qty=1, basic_rate=10,
+				posting_date=add_days(nowdate(), -3 + i))
+
+		sle = get_sle(item_code=item_code, warehouse=warehouse)
+		qty_after = flt(sle[0].qty_after_transaction)
+
+		# interrupted reposting from yesterday left a checkpoint at the last entry
+		checkpoint_key = "stock_reposting_checkpoint:{0}:{1}".format(item_code, warehouse)
+		frappe.cache().set_value(checkpoint_key, {"start": add_days(nowdate(), -1) + " 00:00:00",
+			"sle": sle[0].name})
+		frappe.db.sql("""update `tabStock Ledger Entry` set qty_after_transaction=0
+			where name=%s""", sle[0].name)
+
+		update_entries_after({
+			"item_code": item_code,
+			"warehouse": warehouse,
+			"posting_date": add_days(nowdate(), -3),
+			"posting_time": "00:00"
+		}, verbose=0, checkpoint=True)
+
+		self.assertEqual(flt(frappe.db.get_value("Stock Ledger Entry", sle[0].name,
+			"qty_after_transaction")), qty_after)
+		self.assertFalse(frappe.cache().get_value(checkpoint_key))
+
+	def test_checkpoint_not_resumed_past_entries_made_since(self):
+		from frappe.utils import now
+		from erpnext.stock.stock_ledger import update_entries_after
+		item_code = "_Test Item 2"
+		warehouse = "_Test Warehouse 1 - _TC"
+
+		for i in xrange(4):
+			make_stock_entry(item_code=item_code, target=warehouse, qty=1, basic_rate=10,
+				posting_date=add_days(nowdate(), -4 + i))
+
+		sle = get_sle(item_code=item_code, warehouse=warehouse)
+
+		# interrupted reposting left a checkpoint at the last entry, then a back-dated entry was made
+		checkpoint_key = "stock_reposting_checkpoint:{0}:{1}".format(item_code, warehouse)
+		frappe.cache().set_value(checkpoint_key, {"start": add_days(nowdate(), -4) + " 00:00:00",
+			"created": now(), "sle": sle[0].name})
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=10,
+			posting_date=add_days(nowdate(), -3))
+
+		second_last = get_sle(item_code=item_code, warehouse=warehouse,
+			posting_date=add_days(nowdate(), -2))[0]
+		qty_after = flt(second_last.qty_after_transaction)
+		frappe.db.sql("""update `tabStock Ledger Entry` set qty_after_transaction=0
+			where name=%s""", second_last.name)
+
+		update_entries_after({
+			"item_code": item_code,
+			"warehouse": warehouse,
+			"posting_date": add_days(nowdate(), -4),
+			"posting_time": "00:00"
+		}, verbose=0, checkpoint=True)
+
+		self.assertEqual(flt(frappe.db.get_value("Stock Ledger Entry", second_last.name,
+			"qty_after_transaction")), qty_after)
+
+	def test_bin_updated_once_per_item_and_warehouse(self):
+		item_warehouses = [(item_code, warehouse) for item_code in ("_Test Item", "_Test Item 2")
+			for warehouse in ("_Test Warehouse - _TC", "_Test Warehouse 1 - _TC")]
+
+		def get_bin_qty():
+			return dict(((item_code, warehouse), flt(frappe.db.get_value("Bin", {"item_code": item_code,
+				"warehouse": warehouse}, "actual_qty"))) for item_code, warehouse in item_warehouses)
+
+		qty_before = get_bin_qty()
+
+		se = make_stock_entry(item_code="_Test Item", target="_Test Warehouse - _TC", qty=1,
+			basic_rate=100, do_not_save=True)
+		se.set("items", [])
+		for i in xrange(200):
+			item_code, warehouse = item_warehouses[i % len(item_warehouses)]
+			se.append("items", {
+				"item_code": item_code,
+				"t_warehouse": warehouse,
+				"qty": 1,
+				"basic_rate": 100,
+				"expense_account": "Stock Adjustment - _TC",
+				"conversion_factor": 1.0,
+				"cost_center": "_Test Cost Center - _TC"
+			})
+		se.insert()
+
+		queries = []
+		sql = frappe.db.sql
+		def count_sql(query, *args, **kwargs):
+			queries.append(query)
+			return sql(query, *args, **kwargs)
+
+		frappe.db.sql = count_sql
+		try:
+			se.submit()
+		finally:
+			frappe.db.sql = sql
+
+		def get_queries(start, contains=None):
+			return [q for q in queries if " ".join(q.lower().split()).startswith(start)
+				and (not contains or contains in " ".join(q.lower().split()))]
+
+		bin_updates = get_queries("update `tabbin`")
+		self.assertTrue(len(bin_updates) <= len(item_warehouses),
+			"{0} Bin updates for {1} items and warehouses".format(len(bin_updates), len(item_warehouses)))
+
+		# future entries are read and written back in one chunk per item and warehouse,
+		# reposting for every row would take hundreds of these. Entries are submitted
+		# with an update each, so only the batched updates of reposting are counted
+		repost_reads = get_queries("select", "from `tabstock ledger entry` where item_code = %(item_code)s")
+		repost_reads = [q for q in repost_reads if " asc" in q.lower()]
+		sle_updates = get_queries("update `tabstock ledger entry`", "case name")
+		self.assertTrue(len(repost_reads) <= len(item_warehouses),
+			"{0} reposting reads for {1} items and warehouses".format(len(repost_reads), len(item_warehouses)))
+		self.assertTrue(len(sle_updates) <= len(item_warehouses),
+			"{0} Stock Ledger Entry updates for {1} items and warehouses".format(len(sle_updates),
+				len(item_warehouses)))
+
+		qty_after = get_bin_qty()
+		for key in item_warehouses:
+			self.assertEqual(qty_after[key], qty_before[key] + 50)
+
 def make_serialized_item(item_code=None, serial_no=None, target_warehouse=None):
 	se = frappe.copy_doc(test_records[0])
 	se.get("items")[0].item_code = item_code or "_Test Serialized Item With Series"
@@ -5,8 +5,200 @@ from __future__ import unicode_literals
 
 import frappe
 import unittest
+import json, os
+from multiprocessing import Process, Queue
+from frappe.utils import flt, add_days, nowdate
+from erpnext.stock.stock_ledger import FifoQueue, update_entries_after
+from erpnext.stock.utils import retry_on_deadlock
+from erpnext.stock.doctype.stock_entry.test_stock_entry import make_stock_entry, get_sle
+from erpnext.stock.report.stock_ageing.stock_ageing import get_fifo_queue, replay_stock_ledger_entries
 
 # test_records = frappe.get_test_records('Stock Ledger Entry')
 
+@retry_on_deadlock
+def make_stock_entry_and_commit(**args):
+	se = make_stock_entry(**args)
+	frappe.db.commit()
+	return se.name
+
+def make_stock_entries_in_process(site, entries, results):
+	"""Submit Stock Entries from a forked process, on its own database connection.
+	Puts the names of the Stock Entries made and the traceback on error, if any, in `results`"""
+	# keep the parent's connection referenced so that it is not closed from this process
+	parent_db = frappe.local.db
+	names, error = [], None
+	try:
+		frappe.connect(site)
+		for args in entries:
+			names.append(make_stock_entry_and_commit(**args))
+	except Exception:
+		error = frappe.get_traceback()
+
+	results.put((names, error))
+	results.close()
+	results.join_thread()
+	os._exit(1 if error else 0)
+
 class TestStockLedgerEntry(unittest.TestCase):
-	pass
+	def setUp(self):
+		# Stock Entries committed by the test, cancelled in tearDown
+		self.committed_stock_entries = []
+
+	def tearDown(self):
+		if not self.committed_stock_entries:
+			return
+
+		# latest first, so that issues are cancelled before the receipts they consumed
+		for name in frappe.db.sql_list("""select name from `tabStock Entry` where name in ({0})
+			order by creation desc""".format(", ".join(["%s"] * len(self.committed_stock_entries))),
+			tuple(self.committed_stock_entries)):
+				frappe.get_doc("Stock Entry", name).cancel()
+
+		frappe.db.commit()
+
+	def get_movements(self, batches=1000):
+		"""Many small receipts followed by issues of one batch each"""
+		return [(1.0, 10.0 + (i % 7)) for i in xrange(batches)] \
+			+ [(-1.0, 0) for i in xrange(batches / 2)]
+
+	def process_as_list(self, movements):
+		stock_queue, out = [], []
+		for qty, rate in movements:
+			if qty > 0:
+				stock_queue.append([qty, rate])
+			else:
+				stock_queue.pop(0)
+
+			stock_value = sum((flt(batch[0]) * flt(batch[1]) for batch in stock_queue))
+			out.append((stock_value, json.dumps(stock_queue)))
+
+		return out
+
+	def process_as_fifo_queue(self, movements):
+		stock_queue, out = FifoQueue(), []
+		for qty, rate in movements:
+			if qty > 0:
+				stock_queue.append(qty, rate)
+			else:
+				stock_queue.remove(0)
+
+			out.append((stock_queue.value, stock_queue.serialize()))
+
+		return out
+
+	def test_fifo_queue(self):
+		stock_queue = FifoQueue([[10, 100], [5, 200]])
+		self.assertEqual(stock_queue.qty, 15)
+		self.assertEqual(stock_queue.value, 2000)
+
+		stock_queue.update_batch(stock_queue[0], 4)
+		stock_queue.remove(-1)
+		stock_queue.append(2, 300)
+
+		self.assertEqual(stock_queue.to_list(), [[4, 100], [2, 300]])
+		self.assertEqual(stock_queue.value, 1000)
+		self.assertEqual(stock_queue.serialize(), json.dumps([[4, 100], [2, 300]]))
+
+	def test_fifo_queue_same_as_list_of_batches(self):
+		movements = self.get_movements()
+
+		expected = self.process_as_list(movements)
+		result = self.process_as_fifo_queue(movements)
+
+		self.assertEqual([d[1] for d in result], [d[1] for d in expected])
+		for (value, _), (expected_value, _) in zip(result, expected):
+			self.assertAlmostEqual(value, expected_value, 6)
+
+	def test_stock_queue_posting_dates(self):
+		item_code, warehouse = "_Test Item", "_Test Warehouse 1 - _TC"
+		filters = frappe._dict({"company": "_Test Company", "to_date": nowdate(),
+			"item_code": item_code, "warehouse": warehouse})
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=100,
+			posting_date=add_days(nowdate(), -20))
+		make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=100,
+			posting_date=add_days(nowdate(), -10))
+		make_stock_entry(item_code=item_code, source=warehouse, qty=2)
+
+		sle = get_sle(item_code=item_code, warehouse=warehouse)[0]
+		posting_dates = json.loads(sle.stock_queue_dates)
+		self.assertEqual(len(posting_dates), len(json.loads(sle.stock_queue)))
+		self.assertEqual(posting_dates[-1], add_days(nowdate(), -10))
+
+		# ageing from the stored queue is the same as replaying the ledger
+		def get_qty_by_date(fifo_queue):
+			qty_by_date = {}
+			for qty, posting_date in fifo_queue:
+				qty_by_date[posting_date] = qty_by_date.get(posting_date, 0.0) + flt(qty)
+			return qty_by_date
+
+		self.assertEqual(get_qty_by_date(get_fifo_queue(filters)[item_code]["fifo_queue"]),
+			get_qty_by_date(replay_stock_ledger_entries(filters,
+				set([(item_code, warehouse)]))[(item_code, warehouse)]))
+
+	def test_stock_queue_without_posting_dates(self):
+		# queue stored before posting dates were kept
+		sle = frappe._dict({"actual_qty": 5, "incoming_rate": 100, "posting_date": "2016-01-10",
+			"qty_after_transaction": 10, "valuation_rate": 100, "stock_value": 1000,
+			"stock_value_difference": 500, "stock_queue": json.dumps([[10, 100]]), "stock_queue_dates": None})
+
+		reposting = update_entries_after.__new__(update_entries_after)
+		reposting.precision = 2
+		reposting.stock_queue = FifoQueue([[5, 100]])
+		reposting.get_fifo_values(sle)
+		reposting.qty_after_transaction, reposting.stock_value = 10, reposting.stock_queue.value
+
+		self.assertEqual(reposting.stock_queue.to_list(), [[10, 100]])
+		self.assertTrue(reposting.is_unchanged(sle, 500))
+
+	def test_concurrent_posting_on_same_item(self):
+		item_code, warehouse = "_Test Item", "_Test Warehouse 2 - _TC"
+		self.committed_stock_entries.append(make_stock_entry_and_commit(item_code=item_code,
+			target=warehouse, qty=100, basic_rate=100))
+		qty_before = flt(frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
+			"actual_qty"))
+
+		processes, vouchers_per_process = 6, 5
+		workers, results = [], Queue()
+		for i in xrange(processes):
+			if i % 2:
+				args = {"item_code": item_code, "source": warehouse, "qty": 1}
+			else:
+				args = {"item_code": item_code, "target": warehouse, "qty": 2, "basic_rate": 100}
+
+			workers.append(Process(target=make_stock_entries_in_process,
+				args=(frappe.local.site, [args] * vouchers_per_process, results)))
+
+		for worker in workers:
+			worker.start()
+
+		# read results before joining, a worker exits only once its result is read
+		errors = []
+		for worker in workers:
+			names, error = results.get(timeout=300)
+			self.committed_stock_entries += names
+			if error:
+				errors.append(error)
+
+		for worker in workers:
+			worker.join()
+
+		self.assertEqual(errors, [])
+		self.assertEqual([worker.exitcode for worker in workers], [0] * processes)
+
+		# start a new transaction to read what the workers committed
+		frappe.db.commit()
+
+		expected_qty = qty_before + (processes / 2) * vouchers_per_process * (2 - 1)
+		self.assertEqual(flt(frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
+			"actual_qty")), expected_qty)
+
+		# every entry carries forward the balance of the one before it
+		qty_after_transaction = 0.0
+		for sle in frappe.db.sql("""select actual_qty, qty_after_transaction from `tabStock Ledger Entry`
+			where item_code=%s and warehouse=%s and ifnull(is_cancelled, 'No')='No'
+			order by timestamp(posting_date, posting_time), name""", (item_code, warehouse), as_dict=1):
+			qty_after_transaction += flt(sle.actual_qty)
+			self.assertEqual(flt(sle.qty_after_transaction), qty_after_transaction)
+
+		self.assertEqual(qty_after_transaction, expected_qty)
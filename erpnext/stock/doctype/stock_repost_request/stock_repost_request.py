@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+import frappe.defaults
+from frappe.utils import cint, get_datetime, now_datetime, add_to_date
+from frappe.model.document import Document
+from erpnext.stock.utils import lock_item_warehouses, retry_on_deadlock
+
+# seconds after which an In Progress request is taken to be abandoned by its run
+repost_lease_timeout = 3600
+
+# failed requests are queued again till they have failed these many times
+max_repost_retries = 3
+
+class StockRepostRequest(Document):
+	pass
+
+def repost_in_background():
+	return cint(frappe.db.get_single_value("Stock Settings", "repost_in_background"))
+
+def make_repost_request(args):
+	"""Queue reposting of future Stock Ledger Entries and GL Entries for an Item and Warehouse.
+	An already queued request for the same Item and Warehouse is moved back to the earlier posting time"""
+	existing = frappe.db.get_value("Stock Repost Request", {"item_code": args.get("item_code"),
+		"warehouse": args.get("warehouse"), "status": "Queued"},
+		["name", "posting_date", "posting_time"], as_dict=1)
+
+	if existing:
+		if get_timestamp(args) < get_timestamp(existing):
+			frappe.db.set_value("Stock Repost Request", existing.name, {
+				"posting_date": args.get("posting_date"),
+				"posting_time": args.get("posting_time"),
+				"voucher_type": args.get("voucher_type"),
+				"voucher_no": args.get("voucher_no")
+			})
+		return existing.name
+
+	repost_request = frappe.get_doc({
+		"doctype": "Stock Repost Request",
+		"item_code": args.get("item_code"),
+		"warehouse": args.get("warehouse"),
+		"posting_date": args.get("posting_date"),
+		"posting_time": args.get("posting_time"),
+		"voucher_type": args.get("voucher_type"),
+		"voucher_no": args.get("voucher_no"),
+		"status": "Queued"
+	})
+	repost_request.flags.ignore_permissions = True
+	repost_request.insert()
+
+	return repost_request.name
+
+def get_timestamp(args):
+	return get_datetime("{0} {1}".format(args.get("posting_date"), args.get("posting_time") or "00:00"))
+
+@frappe.whitelist()
+def is_valuation_pending(item_code=None, warehouse=None):
+	"""Returns True if reposting of valuation is still pending for the Item and / or Warehouse"""
+	filters = {"status": ("in", ("Queued", "In Progress"))}
+	if item_code:
+		filters["item_code"] = item_code
+	if warehouse:
+		filters["warehouse"] = warehouse
+
+	return frappe.db.get_value("Stock Repost Request", filters) and True or False
+
+def get_valuation_pending_map():
+	"""Returns set of (item_code, warehouse) with reposting of valuation pending"""
+	return set(frappe.db.sql("""select item_code, warehouse from `tabStock Repost Request`
+		where status in ('Queued', 'In Progress')"""))
+
+def repost_entries():
+	"""Repost queued requests, merged per Item and Warehouse, in order of posting time.
+	Requests left In Progress by a run that did not finish are picked up again once their
+	lease has expired"""
+	from erpnext.stock.stock_ledger import clear_reposting_checkpoint
+
+	requests = claim_requests()
+	if not requests:
+		return
+
+	item_warehouse_map = {}
+	for d in requests:
+		key = (d.item_code, d.warehouse)
+		if key not in item_warehouse_map:
+			item_warehouse_map[key] = frappe._dict({"posting_date": d.posting_date,
+				"posting_time": d.posting_time, "requests": [], "idx": len(item_warehouse_map)})
+		item_warehouse_map[key].requests.append(d.name)
+
+	perpetual_inventory = cint(frappe.defaults.get_global_default("auto_accounting_for_stock"))
+
+	for (item_code, warehouse), args in sorted(item_warehouse_map.items(), key=lambda d: d[1].idx):
+		try:
+			# renew the lease for the Item and Warehouse being reposted
+			set_status(args.requests, "In Progress", started_at=now_datetime())
+			frappe.db.commit()
+
+			repost_item_warehouse(item_code, warehouse, args, perpetual_inventory)
+
+		except Exception:
+			# chunks already committed are reposted again from the start
+			frappe.db.rollback()
+			clear_reposting_checkpoint(item_code, warehouse)
+			set_failed(args.requests, frappe.get_traceback())
+			frappe.db.commit()
+
+@retry_on_deadlock
+def repost_item_warehouse(item_code, warehouse, args, perpetual_inventory):
+	from erpnext.stock.stock_ledger import update_entries_after
+	from erpnext.controllers.stock_controller import update_gl_entries_after
+
+	lock_item_warehouses([(item_code, warehouse)])
+
+	update_entries_after({
+		"item_code": item_code,
+		"warehouse": warehouse,
+		"posting_date": args.posting_date,
+		"posting_time": args.posting_time
+	}, verbose=0, stop_on_match=True, checkpoint=True)
+
+	if perpetual_inventory:
+		update_gl_entries_after(args.posting_date, args.posting_time, [warehouse], [item_code])
+
+	set_status(args.requests, "Completed")
+	frappe.db.commit()
+
+def claim_requests():
+	"""Mark queued and expired requests In Progress and return them. Requests of an Item and
+	Warehouse being reposted by another run are left for later"""
+	expired = add_to_date(now_datetime(), seconds=-repost_lease_timeout)
+
+	requests = frappe.db.sql("""select name, item_code, warehouse, posting_date, posting_time, status
+		from `tabStock Repost Request`
+		where status='Queued' or (status='In Progress' and ifnull(started_at, '1900-01-01') < %s)
+		order by posting_date, posting_time, creation
+		for update""", expired, as_dict=1)
+
+	in_progress = set(frappe.db.sql("""select item_code, warehouse from `tabStock Repost Request`
+		where status='In Progress' and started_at >= %s""", expired))
+
+	requests = [d for d in requests if (d.item_code, d.warehouse) not in in_progress]
+	if requests:
+		set_status([d.name for d in requests], "In Progress", started_at=now_datetime())
+
+	frappe.db.commit()
+	return requests
+
+def set_failed(requests, error_log):
+	"""Queue the requests again, or mark them Failed once they have failed `max_repost_retries` times"""
+	frappe.db.sql("""update `tabStock Repost Request`
+		set status=if(ifnull(retries, 0) + 1 >= %s, 'Failed', 'Queued'), retries=ifnull(retries, 0) + 1,
+			error_log=%s, started_at=null
+		where name in ({0})""".format(", ".join(["%s"] * len(requests))),
+		tuple([max_repost_retries, error_log] + list(requests)))
+
+def set_status(requests, status, error_log=None, started_at=None):
+	frappe.db.sql("""update `tabStock Repost Request` set status=%s, error_log=%s, started_at=%s
+		where name in ({0})""".format(", ".join(["%s"] * len(requests))),
+		tuple([status, error_log, started_at] + list(requests)))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import flt, nowdate, add_days, add_to_date, now_datetime
+from erpnext.stock.doctype.stock_entry.test_stock_entry import make_stock_entry, get_sle
+from erpnext.stock.doctype.stock_repost_request.stock_repost_request import (repost_entries,
+	is_valuation_pending, set_status, set_failed, repost_lease_timeout, max_repost_retries)
+
+class TestStockRepostRequest(unittest.TestCase):
+	def setUp(self):
+		frappe.db.set_value("Stock Settings", None, "repost_in_background", 1)
+
+	def tearDown(self):
+		frappe.db.set_value("Stock Settings", None, "repost_in_background", 0)
+
+	def test_back_dated_entry_reposted_by_scheduler(self):
+		item_code = "_Test Item 2"
+		warehouse = "_Test Warehouse 1 - _TC"
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=10,
+			posting_date=add_days(nowdate(), -2))
+		qty_before = flt(get_sle(item_code=item_code, warehouse=warehouse)[0].qty_after_transaction)
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=20,
+			posting_date=add_days(nowdate(), -4))
+
+		self.assertTrue(is_valuation_pending(item_code, warehouse))
+
+		repost_entries()
+
+		self.assertFalse(is_valuation_pending(item_code, warehouse))
+		qty_after = flt(get_sle(item_code=item_code, warehouse=warehouse)[0].qty_after_transaction)
+		self.assertEqual(qty_after, qty_before + 10)
+		self.assertEqual(flt(frappe.db.get_value("Bin", {"item_code": item_code,
+			"warehouse": warehouse}, "actual_qty")), qty_after)
+
+	def test_abandoned_request_reposted_after_lease(self):
+		item_code = "_Test Item 2"
+		warehouse = "_Test Warehouse 1 - _TC"
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=10,
+			posting_date=add_days(nowdate(), -2))
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=20,
+			posting_date=add_days(nowdate(), -4))
+
+		request = frappe.db.get_value("Stock Repost Request", {"item_code": item_code,
+			"warehouse": warehouse, "status": "Queued"})
+
+		# being reposted by another run
+		set_status([request], "In Progress", started_at=now_datetime())
+		repost_entries()
+		self.assertEqual(frappe.db.get_value("Stock Repost Request", request, "status"), "In Progress")
+
+		# run stopped without completing it
+		set_status([request], "In Progress",
+			started_at=add_to_date(now_datetime(), seconds=-repost_lease_timeout - 60))
+		repost_entries()
+		self.assertEqual(frappe.db.get_value("Stock Repost Request", request, "status"), "Completed")
+		self.assertFalse(is_valuation_pending(item_code, warehouse))
+
+	def test_failed_request_queued_till_retries_run_out(self):
+		make_stock_entry(item_code="_Test Item 2", target="_Test Warehouse 1 - _TC", qty=5, basic_rate=10,
+			posting_date=add_days(nowdate(), -2))
+		make_stock_entry(item_code="_Test Item 2", target="_Test Warehouse 1 - _TC", qty=10, basic_rate=20,
+			posting_date=add_days(nowdate(), -4))
+
+		request = frappe.db.get_value("Stock Repost Request", {"item_code": "_Test Item 2",
+			"warehouse": "_Test Warehouse 1 - _TC", "status": "Queued"})
+
+		for i in xrange(max_repost_retries - 1):
+			set_failed([request], "error")
+			self.assertEqual(frappe.db.get_value("Stock Repost Request", request, "status"), "Queued")
+
+		set_failed([request], "error")
+		self.assertEqual(frappe.db.get_value("Stock Repost Request", request, "status"), "Failed")
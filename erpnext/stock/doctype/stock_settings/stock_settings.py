@@ -25,4 +25,15 @@ class StockSettings(Document):
 			self.stock_frozen_upto_days = stock_frozen_limit
 			frappe.msgprint (_("`Freeze Stocks Older Than` should be smaller than %d days.") %stock_frozen_limit)
 
+		self.flags.rebuild_stock_balance_snapshots = cint(self.maintain_stock_balance_snapshots) \
+			and not cint(frappe.db.get_single_value("Stock Settings", "maintain_stock_balance_snapshots"))
+
+	def on_update(self):
+		if self.flags.rebuild_stock_balance_snapshots:
+			from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+				import rebuild_stock_balance_snapshots
+
+			for company in frappe.db.sql_list("select name from tabCompany"):
+				rebuild_stock_balance_snapshots(company)
+
 
@@ -32,26 +32,35 @@ def get_item_details(args):
 			"project": ""
 		}
 	"""
+	return _get_item_details(args)
+
+def _get_item_details(args, cache=None):
+	"""Item details for one row, see `get_item_details`
+
+	:param cache: Preloaded masters, set by `get_items_details`
+	"""
 	args = process_args(args)
-	item_doc = frappe.get_doc("Item", args.item_code)
+	item_doc = cache and cache.item_docs.get(args.item_code) or frappe.get_doc("Item", args.item_code)
 	item = item_doc
 
 	validate_item_details(args, item)
 
-	out = get_basic_details(args, item)
+	out = get_basic_details(args, item, cache)
 
 	get_party_item_code(args, item_doc, out)
 
 	if out.get("warehouse"):
-		out.update(get_bin_details(args.item_code, out.warehouse))
+		out.update(get_bin_details_for(args.item_code, out.warehouse, cache))
 
-	if frappe.db.exists("Product Bundle", args.item_code):
+	bundle_items = cache.bundle_items.get(args.item_code) if cache \
+		else (frappe.db.exists("Product Bundle", args.item_code)
+			and frappe.get_doc("Product Bundle", args.item_code).items)
+
+	if bundle_items:
 		valuation_rate = 0.0
-		bundled_items = frappe.get_doc("Product Bundle", args.item_code)
-		
-		for bundle_item in bundled_items.items:
+		for bundle_item in bundle_items:
 			valuation_rate += \
-				flt(get_valuation_rate(bundle_item.item_code, out.get("warehouse")).get("valuation_rate") \
+				flt(get_valuation_rate(bundle_item.item_code, out.get("warehouse"), cache).get("valuation_rate") \
 					* bundle_item.qty)
 
 		out.update({
@@ -59,19 +68,23 @@ def get_item_details(args):
 		})
 
 	else:
-		out.update(get_valuation_rate(args.item_code, out.get("warehouse")))
+		out.update(get_valuation_rate(args.item_code, out.get("warehouse"), cache))
 
-	get_price_list_rate(args, item_doc, out)
+	get_price_list_rate(args, item_doc, out, cache)
 
 	if args.customer and cint(args.is_pos):
-		out.update(get_pos_profile_item_details(args.company, args))
+		out.update(get_pos_profile_item_details(args.company, args,
+			cache.pos_profile if cache else None, cache))
 
 	# update args with out, if key or value not exists
 	for key, value in out.iteritems():
 		if args.get(key) is None:
 			args[key] = value
 
-	out.update(get_pricing_rule_for_item(args))
+	if "variant_of" not in args:
+		args.variant_of = item_doc.variant_of
+
+	out.update(get_pricing_rule_for_item(args, cache.pricing_rule_index if cache else None))
 
 	if args.get("doctype") in ("Sales Invoice", "Delivery Note"):
 		if item_doc.has_serial_no == 1 and not args.serial_no:
@@ -88,6 +101,155 @@ def get_item_details(args):
 
 	return out
 
+@frappe.whitelist()
+def get_items_details(args, items):
+	"""Returns item details for all the rows in `items`, in the same order.
+
+	Item masters, Item Prices, Bins and the pricing rule index are loaded once
+	for all the rows, so that a large list of items can be fetched in one call.
+
+	:param args: Transaction values common to all the rows (see `get_item_details`)
+	:param items: List of rows, each with `item_code` (or `barcode` / `serial_no`)
+		and any row level values like `qty`, `warehouse`"""
+	if isinstance(items, basestring):
+		items = json.loads(items)
+
+	args = process_args(args)
+
+	# party groups are common to all the rows
+	if args.customer and not (args.customer_group and args.territory):
+		customer = frappe.db.get_value("Customer", args.customer, ["customer_group", "territory"])
+		if customer:
+			args.customer_group, args.territory = customer
+
+	if args.supplier and not args.supplier_type:
+		args.supplier_type = frappe.db.get_value("Supplier", args.supplier, "supplier_type")
+
+	meta = frappe.get_meta(args.parenttype or args.doctype)
+	if meta.get_field("currency"):
+		validate_price_list(args)
+		validate_conversion_rate(args, meta)
+
+	item_list = []
+	for item in items:
+		item_args = frappe._dict(args.copy())
+		item_args.update(item)
+		item_list.append(process_args(item_args))
+
+	cache = get_item_details_cache(args, [d.item_code for d in item_list])
+
+	return [_get_item_details(item_args, cache) for item_args in item_list]
+
+def get_item_details_cache(args, item_codes):
+	"""Load Items (with their templates and bundled items), Item Prices, Bins
+	and pricing rules for `get_items_details`"""
+	from erpnext.accounts.doctype.pricing_rule.pricing_rule import get_pricing_rule_index
+
+	cache = frappe._dict({
+		"item_docs": get_item_docs(item_codes),
+		"bundle_items": {},
+		"cached_values": {},
+		"price_list_validated": True
+	})
+
+	if cache.item_docs:
+		for d in frappe.db.sql("""select parent, item_code, qty from `tabProduct Bundle Item`
+			where parenttype='Product Bundle' and parent in ({0})
+			order by parent, idx""".format(", ".join(["%s"] * len(cache.item_docs))),
+			tuple(cache.item_docs), as_dict=1):
+				cache.bundle_items.setdefault(d.parent, []).append(d)
+
+	other_items = set([d.variant_of for d in cache.item_docs.values() if d.variant_of])
+	for bundle_items in cache.bundle_items.values():
+		other_items.update([d.item_code for d in bundle_items])
+
+	cache.item_docs.update(get_item_docs(list(other_items - set(cache.item_docs))))
+
+	for item in cache.item_docs.values():
+		if item.variant_of and cache.item_docs.get(item.variant_of):
+			item.update_template_tables(cache.item_docs[item.variant_of])
+			item.flags.template_tables_updated = True
+
+	item_codes = list(cache.item_docs)
+	cache.item_prices = get_item_prices(args.price_list, item_codes)
+	cache.bins = get_bins(item_codes)
+	cache.purchase_rates = get_purchase_rates([d.name for d in cache.item_docs.values()
+		if not d.is_stock_item])
+
+	if args.customer and cint(args.is_pos):
+		cache.pos_profile = get_pos_profile(args.company)
+
+	if not cint(args.ignore_pricing_rule):
+		cache.pricing_rule_index = get_pricing_rule_index()
+
+	return cache
+
+def get_item_docs(item_codes):
+	"""Returns Item docs with the child tables used for item details, loaded in one query per table"""
+	item_codes = list(set(filter(None, item_codes)))
+	if not item_codes:
+		return {}
+
+	condition = "in ({0})".format(", ".join(["%s"] * len(item_codes)))
+
+	items = dict((d.name, d) for d in frappe.db.sql("""select * from tabItem
+		where name {0}""".format(condition), tuple(item_codes), as_dict=1))
+
+	meta = frappe.get_meta("Item")
+	for fieldname in ("taxes", "uoms", "customer_items", "supplier_items", "reorder_levels"):
+		for item in items.values():
+			item[fieldname] = []
+
+		for d in frappe.db.sql("""select * from `tab{0}` where parenttype='Item' and parentfield=%s
+			and parent {1} order by idx""".format(meta.get_field(fieldname).options, condition),
+			tuple([fieldname] + item_codes), as_dict=1):
+				items[d.parent][fieldname].append(d)
+
+	for name, item in items.items():
+		item.doctype = "Item"
+		items[name] = frappe.get_doc(item)
+
+	return items
+
+def get_item_prices(price_list, item_codes):
+	item_prices = {}
+	if price_list and item_codes:
+		for item_code, price_list_rate in frappe.db.sql("""select item_code, price_list_rate
+			from `tabItem Price` where price_list=%s and item_code in ({0})""".format(
+			", ".join(["%s"] * len(item_codes))), tuple([price_list] + item_codes)):
+				item_prices.setdefault((price_list, item_code), price_list_rate)
+
+	return item_prices
+
+def get_bins(item_codes):
+	if not item_codes:
+		return {}
+
+	return dict(((d.item_code, d.warehouse), d) for d in frappe.db.sql("""select item_code, warehouse,
+		projected_qty, actual_qty, valuation_rate from tabBin
+		where item_code in ({0})""".format(", ".join(["%s"] * len(item_codes))),
+		tuple(item_codes), as_dict=1))
+
+def get_purchase_rates(item_codes):
+	if not item_codes:
+		return {}
+
+	return dict(frappe.db.sql("""select item_code, sum(base_net_amount) / sum(qty)
+		from `tabPurchase Invoice Item`
+		where item_code in ({0}) and docstatus=1
+		group by item_code""".format(", ".join(["%s"] * len(item_codes))), tuple(item_codes)))
+
+def get_cached_value(cache, doctype, name, fieldname):
+	"""`frappe.db.get_value`, remembered in `cache` when loading details for multiple rows"""
+	if not cache:
+		return frappe.db.get_value(doctype, name, fieldname)
+
+	key = (doctype, name, fieldname)
+	if key not in cache["cached_values"]:
+		cache["cached_values"][key] = frappe.db.get_value(doctype, name, fieldname)
+
+	return cache["cached_values"][key]
+
 def process_args(args):
 	if isinstance(args, basestring):
 		args = json.loads(args)
@@ -141,11 +303,11 @@ def validate_item_details(args, item):
 		if args.get("is_subcontracted") == "Yes" and item.is_sub_contracted_item != 1:
 			throw(_("Item {0} must be a Sub-contracted Item").format(item.name))
 
-def get_basic_details(args, item):
+def get_basic_details(args, item, cache=None):
 	if not item:
 		item = frappe.get_doc("Item", args.get("item_code"))
 
-	if item.variant_of:
+	if item.variant_of and not item.flags.template_tables_updated:
 		item.update_template_tables()
 
 	from frappe.defaults import get_user_default_as_list
@@ -161,9 +323,9 @@ def get_basic_details(args, item):
 		"description": cstr(item.description).strip(),
 		"image": cstr(item.image).strip(),
 		"warehouse": warehouse,
-		"income_account": get_default_income_account(args, item),
-		"expense_account": get_default_expense_account(args, item),
-		"cost_center": get_default_cost_center(args, item),
+		"income_account": get_default_income_account(args, item, cache),
+		"expense_account": get_default_expense_account(args, item, cache),
+		"cost_center": get_default_cost_center(args, item, cache),
 		"batch_no": None,
 		"item_tax_rate": json.dumps(dict(([d.tax_type, d.tax_rate] for d in
 			item.get("taxes")))),
@@ -189,48 +351,53 @@ def get_basic_details(args, item):
 	for d in [["Account", "income_account", "default_income_account"], 
 		["Account", "expense_account", "default_expense_account"], 
 		["Cost Center", "cost_center", "cost_center"], ["Warehouse", "warehouse", ""]]:
-			company = frappe.db.get_value(d[0], out.get(d[1]), "company")
+			company = get_cached_value(cache, d[0], out.get(d[1]), "company")
 			if not out[d[1]] or (company and args.company != company):
-				out[d[1]] = frappe.db.get_value("Company", args.company, d[2]) if d[2] else None
+				out[d[1]] = get_cached_value(cache, "Company", args.company, d[2]) if d[2] else None
 
 	for fieldname in ("item_name", "item_group", "barcode", "brand", "stock_uom"):
 		out[fieldname] = item.get(fieldname)
 
 	return out
 
-def get_default_income_account(args, item):
+def get_default_income_account(args, item, cache=None):
 	return (item.income_account
 		or args.income_account
-		or frappe.db.get_value("Item Group", item.item_group, "default_income_account"))
+		or get_cached_value(cache, "Item Group", item.item_group, "default_income_account"))
 
-def get_default_expense_account(args, item):
+def get_default_expense_account(args, item, cache=None):
 	return (item.expense_account
 		or args.expense_account
-		or frappe.db.get_value("Item Group", item.item_group, "default_expense_account"))
+		or get_cached_value(cache, "Item Group", item.item_group, "default_expense_account"))
 
-def get_default_cost_center(args, item):
-	return (frappe.db.get_value("Project", args.get("project"), "cost_center")
+def get_default_cost_center(args, item, cache=None):
+	return (get_cached_value(cache, "Project", args.get("project"), "cost_center")
 		or (item.selling_cost_center if args.get("customer") else item.buying_cost_center)
-		or frappe.db.get_value("Item Group", item.item_group, "default_cost_center")
+		or get_cached_value(cache, "Item Group", item.item_group, "default_cost_center")
 		or args.get("cost_center"))
 
-def get_price_list_rate(args, item_doc, out):
+def get_price_list_rate(args, item_doc, out, cache=None):
 	meta = frappe.get_meta(args.parenttype or args.doctype)
 
 	if meta.get_field("currency"):
-		validate_price_list(args)
-		validate_conversion_rate(args, meta)
+		if not (cache and cache.price_list_validated):
+			validate_price_list(args)
+			validate_conversion_rate(args, meta)
 
-		price_list_rate = get_price_list_rate_for(args.price_list, item_doc.name)
+		price_list_rate = get_price_list_rate_for(args.price_list, item_doc.name, cache)
 
 		# variant
 		if not price_list_rate and item_doc.variant_of:
-			price_list_rate = get_price_list_rate_for(args.price_list, item_doc.variant_of)
+			price_list_rate = get_price_list_rate_for(args.price_list, item_doc.variant_of, cache)
 
 		# insert in database
 		if not price_list_rate:
 			if args.price_list and args.rate:
-				insert_item_price(args)
+				price_list_rate = insert_item_price(args)
+
+				# later rows of the same item get the inserted price, instead of inserting it again
+				if price_list_rate is not None and cache and args.item_code in cache.item_docs:
+					cache.item_prices[(args.price_list, args.item_code)] = price_list_rate
 			return {}
 
 		out.price_list_rate = flt(price_list_rate) * flt(args.plc_conversion_rate) \
@@ -242,7 +409,8 @@ def get_price_list_rate(args, item_doc, out):
 				args.name, args.conversion_rate))
 
 def insert_item_price(args):
-	"""Insert Item Price if Price List and Price List Rate are specified and currency is the same"""
+	"""Insert Item Price if Price List and Price List Rate are specified and currency is the same.
+	Returns the inserted Price List Rate"""
 	if frappe.db.get_value("Price List", args.price_list, "currency") == args.currency \
 		and cint(frappe.db.get_single_value("Stock Settings", "auto_insert_price_list_rate_if_missing")):
 		if frappe.has_permission("Item Price", "write"):
@@ -261,7 +429,12 @@ def insert_item_price(args):
 			frappe.msgprint(_("Item Price added for {0} in Price List {1}").format(args.item_code,
 				args.price_list))
 
-def get_price_list_rate_for(price_list, item_code):
+			return price_list_rate
+
+def get_price_list_rate_for(price_list, item_code, cache=None):
+	if cache and item_code in cache.item_docs:
+		return cache.item_prices.get((price_list, item_code))
+
 	return frappe.db.get_value("Item Price",
 			{"price_list": price_list, "item_code": item_code}, "price_list_rate")
 
@@ -308,7 +481,7 @@ def get_party_item_code(args, item_doc, out):
 		item_supplier = item_doc.get("supplier_items", {"supplier": args.supplier})
 		out.supplier_part_no = item_supplier[0].supplier_part_no if item_supplier else None
 
-def get_pos_profile_item_details(company, args, pos_profile=None):
+def get_pos_profile_item_details(company, args, pos_profile=None, cache=None):
 	res = frappe._dict()
 
 	if not pos_profile:
@@ -320,8 +493,8 @@ def get_pos_profile_item_details(company, args, pos_profile=None):
 				res[fieldname] = pos_profile.get(fieldname)
 
 		if res.get("warehouse"):
-			res.actual_qty = get_bin_details(args.item_code,
-				res.warehouse).get("actual_qty")
+			res.actual_qty = get_bin_details_for(args.item_code,
+				res.warehouse, cache).get("actual_qty")
 
 	return res
 
@@ -376,6 +549,14 @@ def get_bin_details(item_code, warehouse):
 		["projected_qty", "actual_qty"], as_dict=True) \
 		or {"projected_qty": 0, "actual_qty": 0, "valuation_rate": 0}
 
+def get_bin_details_for(item_code, warehouse, cache=None):
+	if cache and item_code in cache.item_docs:
+		bin = cache.bins.get((item_code, warehouse))
+		return {"projected_qty": bin.projected_qty, "actual_qty": bin.actual_qty} if bin \
+			else {"projected_qty": 0, "actual_qty": 0, "valuation_rate": 0}
+
+	return get_bin_details(item_code, warehouse)
+
 @frappe.whitelist()
 def get_batch_qty(batch_no,warehouse,item_code):
 	actual_batch_qty = get_actual_batch_qty(batch_no,warehouse,item_code)
@@ -483,7 +664,15 @@ def get_default_bom(item_code=None):
 		else:
 			frappe.throw(_("No default BOM exists for Item {0}").format(item_code))
 			
-def get_valuation_rate(item_code, warehouse=None):
+def get_valuation_rate(item_code, warehouse=None, cache=None):
+	item = cache and cache.item_docs.get(item_code)
+	if item:
+		if item.is_stock_item:
+			bin = cache.bins.get((item_code, warehouse or item.default_warehouse))
+			return {"valuation_rate": bin.valuation_rate if bin else 0}
+		else:
+			return {"valuation_rate": cache.purchase_rates.get(item_code) or 0.0}
+
 	item = frappe.get_doc("Item", item_code)
 	if item.is_stock_item:
 		if not warehouse:
@@ -5,6 +5,9 @@ import frappe
 from frappe.utils import flt, nowdate, add_days, cint
 from frappe import _
 
+# maximum number of items in one auto generated Material Request
+max_items_per_request = 500
+
 def reorder_item():
 	""" Reorder item if stock reaches reorder level"""
 	# if initial setup not completed, return
@@ -21,7 +24,9 @@ def _reorder_item():
 	default_company = (frappe.defaults.get_defaults().get("company") or
 		frappe.db.sql("""select name from tabCompany limit 1""")[0][0])
 
-	items_to_consider = frappe.db.sql_list("""select name from `tabItem` item
+	items_to_consider = frappe.db.sql("""select name, variant_of, item_name, description,
+			item_group, brand, stock_uom, lead_time_days
+		from `tabItem` item
 		where is_stock_item=1 and has_variants=0
 			and (is_purchase_item=1 or is_sub_contracted_item=1)
 			and disabled=0
@@ -30,12 +35,14 @@ def _reorder_item():
 				or (variant_of is not null and variant_of != ''
 				and exists (select name from `tabItem Reorder` ir where ir.parent=item.variant_of))
 			)""",
-		{"today": nowdate()})
+		{"today": nowdate()}, as_dict=1)
 
 	if not items_to_consider:
 		return
 
-	item_warehouse_projected_qty = get_item_warehouse_projected_qty(items_to_consider)
+	item_details = dict((d.name, d) for d in items_to_consider)
+	reorder_levels = get_reorder_levels(items_to_consider)
+	item_warehouse_projected_qty = get_item_warehouse_projected_qty(item_details.keys())
 
 	def add_to_material_request(item_code, warehouse, reorder_level, reorder_qty, material_request_type):
 		if warehouse not in warehouse_company:
@@ -61,34 +68,54 @@ def _reorder_item():
 				"reorder_qty": reorder_qty
 			})
 
-	for item_code in items_to_consider:
-		item = frappe.get_doc("Item", item_code)
-
-		if item.variant_of and not item.get("reorder_levels"):
-			item.update_template_tables()
+	for item in items_to_consider:
+		# variants without their own re-order levels follow the template
+		item_reorder_levels = reorder_levels.get(item.name)
+		if item.variant_of and not item_reorder_levels:
+			item_reorder_levels = reorder_levels.get(item.variant_of)
 
-		if item.get("reorder_levels"):
-			for d in item.get("reorder_levels"):
-				add_to_material_request(item_code, d.warehouse, d.warehouse_reorder_level,
-					d.warehouse_reorder_qty, d.material_request_type)
+		for d in item_reorder_levels or []:
+			add_to_material_request(item.name, d.warehouse, d.warehouse_reorder_level,
+				d.warehouse_reorder_qty, d.material_request_type)
 
 	if material_requests:
-		return create_material_request(material_requests)
+		return create_material_request(material_requests, item_details)
+
+def get_reorder_levels(items):
+	"""Returns `Item Reorder` rows of the items and of the templates of the variants,
+	as {item_code: [rows]}"""
+	item_codes = list(set([d.name for d in items] + [d.variant_of for d in items if d.variant_of]))
+
+	reorder_levels = {}
+	for i in xrange(0, len(item_codes), 1000):
+		chunk = item_codes[i:i + 1000]
+		for d in frappe.db.sql("""select parent, warehouse, warehouse_reorder_level,
+				warehouse_reorder_qty, material_request_type
+			from `tabItem Reorder`
+			where parenttype='Item' and parent in ({0})
+			order by parent, idx""".format(", ".join(["%s"] * len(chunk))), tuple(chunk), as_dict=1):
+				reorder_levels.setdefault(d.parent, []).append(d)
+
+	return reorder_levels
 
 def get_item_warehouse_projected_qty(items_to_consider):
 	item_warehouse_projected_qty = {}
 
-	for item_code, warehouse, projected_qty in frappe.db.sql("""select item_code, warehouse, projected_qty
-		from tabBin where item_code in ({0})
-			and (warehouse != "" and warehouse is not null)"""\
-		.format(", ".join(["%s"] * len(items_to_consider))), items_to_consider):
+	for i in xrange(0, len(items_to_consider), 1000):
+		chunk = items_to_consider[i:i + 1000]
+		for item_code, warehouse, projected_qty in frappe.db.sql("""select item_code, warehouse, projected_qty
+			from tabBin where item_code in ({0})
+				and (warehouse != "" and warehouse is not null)"""\
+			.format(", ".join(["%s"] * len(chunk))), tuple(chunk)):
 
-		item_warehouse_projected_qty.setdefault(item_code, {})[warehouse] = flt(projected_qty)
+			item_warehouse_projected_qty.setdefault(item_code, {})[warehouse] = flt(projected_qty)
 
 	return item_warehouse_projected_qty
 
-def create_material_request(material_requests):
-	"""	Create indent on reaching reorder level	"""
+def create_material_request(material_requests, item_details=None):
+	"""	Create indent on reaching reorder level.
+
+	Requests with more than `max_items_per_request` items are split"""
 	mr_list = []
 	exceptions_list = []
 
@@ -99,42 +126,46 @@ def create_material_request(material_requests):
 		else:
 			exceptions_list.append(frappe.get_traceback())
 
+	def get_item(item_code):
+		if not (item_details and item_code in item_details):
+			return frappe.get_doc("Item", item_code)
+		return item_details[item_code]
+
 	for request_type in material_requests:
 		for company in material_requests[request_type]:
-			try:
-				items = material_requests[request_type][company]
-				if not items:
-					continue
-
-				mr = frappe.new_doc("Material Request")
-				mr.update({
-					"company": company,
-					"transaction_date": nowdate(),
-					"material_request_type": "Material Transfer" if request_type=="Transfer" else request_type
-				})
-
-				for d in items:
-					d = frappe._dict(d)
-					item = frappe.get_doc("Item", d.item_code)
-					mr.append("items", {
-						"doctype": "Material Request Item",
-						"item_code": d.item_code,
-						"schedule_date": add_days(nowdate(),cint(item.lead_time_days)),
-						"uom":	item.stock_uom,
-						"warehouse": d.warehouse,
-						"item_name": item.item_name,
-						"description": item.description,
-						"item_group": item.item_group,
-						"qty": d.reorder_qty,
-						"brand": item.brand,
+			items = material_requests[request_type][company]
+
+			for i in xrange(0, len(items), max_items_per_request):
+				try:
+					mr = frappe.new_doc("Material Request")
+					mr.update({
+						"company": company,
+						"transaction_date": nowdate(),
+						"material_request_type": "Material Transfer" if request_type=="Transfer" else request_type
 					})
 
-				mr.insert()
-				mr.submit()
-				mr_list.append(mr)
-
-			except:
-				_log_exception()
+					for d in items[i:i + max_items_per_request]:
+						d = frappe._dict(d)
+						item = get_item(d.item_code)
+						mr.append("items", {
+							"doctype": "Material Request Item",
+							"item_code": d.item_code,
+							"schedule_date": add_days(nowdate(),cint(item.lead_time_days)),
+							"uom":	item.stock_uom,
+							"warehouse": d.warehouse,
+							"item_name": item.item_name,
+							"description": item.description,
+							"item_group": item.item_group,
+							"qty": d.reorder_qty,
+							"brand": item.brand,
+						})
+
+					mr.insert()
+					mr.submit()
+					mr_list.append(mr)
+
+				except:
+					_log_exception()
 
 	if mr_list:
 		if getattr(frappe.local, "reorder_email_notify", None) is None:
@@ -35,6 +35,12 @@ frappe.query_reports["Stock Ageing"] = {
 			"label": __("Brand"),
 			"fieldtype": "Link",
 			"options": "Brand"
+		},
+		{
+			"fieldname":"approximate_moving_average",
+			"label": __("Approximate Ages of Moving Average Items"),
+			"fieldtype": "Check",
+			"default": 0
 		}
 	]
 }
\ No newline at end of file
@@ -4,7 +4,8 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import date_diff, flt
+from frappe.utils import date_diff, flt, getdate
+import json
 
 def execute(filters=None):
 
@@ -41,13 +42,127 @@ def get_columns():
 		_("Earliest") + ":Int:80", _("Latest") + ":Int:80", _("UOM") + ":Link/UOM:100"]
 
 def get_fifo_queue(filters):
+	"""Returns {item_code: {"details": item, "fifo_queue": [[qty, posting_date], ...]}} of the
+	stock in hand on `to_date`, across warehouses.
+
+	Batches are read from the FIFO queue of the last Stock Ledger Entry of every item and
+	warehouse. Entries of items whose queue is not kept with posting dates (moving average
+	or serialized items, entries posted before the dates were kept) are replayed, or for
+	moving average items with `approximate_moving_average`, aged from the latest incoming entries."""
+	items = get_items(filters)
 	item_details = {}
-	for d in get_stock_ledger_entries(filters):
-		item_details.setdefault(d.name, {"details": d, "fifo_queue": []})
-		fifo_queue = item_details[d.name]["fifo_queue"]
+	to_replay, to_approximate = set(), {}
+
+	for d in get_last_stock_ledger_entries(filters, items.keys()):
+		item = items[d.item_code]
+		if flt(d.qty_after_transaction) <= 0:
+			continue
+
+		stock_queue = json.loads(d.stock_queue or "[]")
+		posting_dates = json.loads(d.stock_queue_dates or "[]")
+
+		if item.valuation_method == "FIFO" and not item.has_serial_no \
+			and len(posting_dates) == len(stock_queue) and all(posting_dates):
+				add_to_fifo_queue(item_details, item,
+					[[flt(batch[0]), getdate(posting_date)] for batch, posting_date in zip(stock_queue, posting_dates)
+						if flt(batch[0]) > 0])
+
+		elif item.valuation_method == "Moving Average" and filters.get("approximate_moving_average"):
+			to_approximate[(d.item_code, d.warehouse)] = flt(d.qty_after_transaction)
+
+		else:
+			to_replay.add((d.item_code, d.warehouse))
+
+	for (item_code, warehouse), fifo_queue in replay_stock_ledger_entries(filters, to_replay).items():
+		add_to_fifo_queue(item_details, items[item_code], fifo_queue)
+
+	for (item_code, warehouse), fifo_queue in approximate_fifo_queue(filters, to_approximate).items():
+		add_to_fifo_queue(item_details, items[item_code], fifo_queue)
+
+	for d in item_details.values():
+		d["fifo_queue"].sort(key=lambda batch: batch[1])
+
+	return item_details
+
+def add_to_fifo_queue(item_details, item, fifo_queue):
+	item_details.setdefault(item.name, {"details": item, "fifo_queue": []})["fifo_queue"].extend(fifo_queue)
+
+def get_items(filters):
+	default_valuation_method = frappe.db.get_single_value("Stock Settings", "valuation_method") or "FIFO"
+
+	items = {}
+	for d in frappe.db.sql("""select name, item_name, description, stock_uom, brand, item_group,
+			valuation_method, has_serial_no
+		from `tabItem` {item_conditions}""".format(item_conditions=get_item_conditions(filters)),
+		filters, as_dict=True):
+			d.valuation_method = d.valuation_method or default_valuation_method
+			items[d.name] = d
+
+	return items
+
+def get_last_stock_ledger_entries(filters, item_codes):
+	"""Last Stock Ledger Entry of every item and warehouse on or before `to_date`"""
+	item_codes = list(item_codes)
+
+	names = []
+	for i in xrange(0, len(item_codes), 1000):
+		names += [d.split("|", 1)[1] for d in frappe.db.sql_list("""select
+				max(concat(timestamp(posting_date, posting_time), '|', name))
+			from `tabStock Ledger Entry`
+			where company = %(company)s and posting_date <= %(to_date)s
+				and ifnull(is_cancelled, 'No')='No'
+				and item_code in ({item_codes})
+				{sle_conditions}
+			group by item_code, warehouse""".format(
+				item_codes=get_item_codes_condition(item_codes[i:i + 1000]),
+				sle_conditions=get_sle_conditions(filters)),
+			get_item_codes_values(filters, item_codes[i:i + 1000]))]
+
+	entries = []
+	for i in xrange(0, len(names), 1000):
+		entries += frappe.db.sql("""select item_code, warehouse, qty_after_transaction,
+				stock_queue, stock_queue_dates
+			from `tabStock Ledger Entry` where name in ({0})""".format(
+			", ".join(["%s"] * len(names[i:i + 1000]))), tuple(names[i:i + 1000]), as_dict=True)
+
+	return entries
+
+def get_stock_ledger_entries(filters, item_codes, conditions=""):
+	entries = []
+	for i in xrange(0, len(item_codes), 1000):
+		entries += frappe.db.sql("""select item_code, warehouse, actual_qty, posting_date,
+				voucher_type, qty_after_transaction
+			from `tabStock Ledger Entry`
+			where company = %(company)s and posting_date <= %(to_date)s
+				and ifnull(is_cancelled, 'No')='No'
+				and item_code in ({item_codes})
+				{sle_conditions} {conditions}
+			order by posting_date, posting_time, name""".format(
+				item_codes=get_item_codes_condition(item_codes[i:i + 1000]),
+				sle_conditions=get_sle_conditions(filters), conditions=conditions),
+			get_item_codes_values(filters, item_codes[i:i + 1000]), as_dict=True)
+
+	return entries
+
+def get_item_codes_condition(item_codes):
+	return ", ".join(["%(item_code_{0})s".format(j) for j in xrange(len(item_codes))])
+
+def get_item_codes_values(filters, item_codes):
+	return dict(filters, **dict(("item_code_{0}".format(j), item_code)
+		for j, item_code in enumerate(item_codes)))
+
+def replay_stock_ledger_entries(filters, item_warehouses):
+	"""Rebuild FIFO queue with posting dates of the items and warehouses from all their entries"""
+	fifo_queues, qty_after_transaction = {}, {}
+	for d in get_stock_ledger_entries(filters, list(set(d[0] for d in item_warehouses))):
+		key = (d.item_code, d.warehouse)
+		if key not in item_warehouses:
+			continue
+
+		fifo_queue = fifo_queues.setdefault(key, [])
 
 		if d.voucher_type == "Stock Reconciliation":
-			d.actual_qty = flt(d.qty_after_transaction) - flt(item_details[d.name].get("qty_after_transaction", 0))
+			d.actual_qty = flt(d.qty_after_transaction) - flt(qty_after_transaction.get(key, 0))
 
 		if d.actual_qty > 0:
 			fifo_queue.append([d.actual_qty, d.posting_date])
@@ -65,24 +180,26 @@ def get_fifo_queue(filters):
 					batch[0] -= qty_to_pop
 					qty_to_pop = 0
 
-		item_details[d.name]["qty_after_transaction"] = d.qty_after_transaction
+		qty_after_transaction[key] = d.qty_after_transaction
 
-	return item_details
+	return dict((key, [batch for batch in fifo_queue if batch[0] > 0])
+		for key, fifo_queue in fifo_queues.items())
+
+def approximate_fifo_queue(filters, qty_in_hand):
+	"""Age the stock in hand of moving average items, as the latest incoming entries
+	that add up to the qty in hand"""
+	fifo_queues = {}
+	for d in reversed(get_stock_ledger_entries(filters, list(set(d[0] for d in qty_in_hand)),
+		"and actual_qty > 0")):
+			key = (d.item_code, d.warehouse)
+			if not qty_in_hand.get(key):
+				continue
+
+			qty = min(flt(d.actual_qty), qty_in_hand[key])
+			fifo_queues.setdefault(key, []).insert(0, [qty, d.posting_date])
+			qty_in_hand[key] -= qty
 
-def get_stock_ledger_entries(filters):
-	return frappe.db.sql("""select
-			item.name, item.item_name, item_group, brand, description, item.stock_uom,
-			actual_qty, posting_date, voucher_type, qty_after_transaction
-		from `tabStock Ledger Entry` sle,
-			(select name, item_name, description, stock_uom, brand, item_group
-				from `tabItem` {item_conditions}) item
-		where item_code = item.name and
-			company = %(company)s and
-			posting_date <= %(to_date)s
-			{sle_conditions}
-			order by posting_date, posting_time, sle.name"""\
-		.format(item_conditions=get_item_conditions(filters),
-			sle_conditions=get_sle_conditions(filters)), filters, as_dict=True)
+	return fifo_queues
 
 def get_item_conditions(filters):
 	conditions = []
@@ -4,7 +4,11 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import flt, getdate
+from frappe.utils import flt, getdate, get_first_day
+from erpnext.stock.doctype.stock_repost_request.stock_repost_request import (repost_in_background,
+	get_valuation_pending_map)
+from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot import (use_stock_balance_snapshots,
+	get_opening_stock)
 
 def execute(filters=None):
 	if not filters: filters = {}
@@ -15,10 +19,15 @@ def execute(filters=None):
 	item_map = get_item_details(filters)
 	iwb_map = get_item_warehouse_map(filters)
 
+	valuation_pending = None
+	if repost_in_background():
+		columns.append(_("Valuation Pending")+":Check:80")
+		valuation_pending = get_valuation_pending_map()
+
 	data = []
 	for (company, item, warehouse) in sorted(iwb_map):
 		qty_dict = iwb_map[(company, item, warehouse)]
-		data.append([item, item_map[item]["item_name"],
+		row = [item, item_map[item]["item_name"],
 			item_map[item]["item_group"],
 			item_map[item]["brand"],
 			item_map[item]["description"], warehouse,
@@ -28,7 +37,12 @@ def execute(filters=None):
 			qty_dict.out_val, qty_dict.bal_qty,
 			qty_dict.bal_val, qty_dict.val_rate,
 			company
-		])
+		]
+
+		if valuation_pending is not None:
+			row.append(1 if (item, warehouse) in valuation_pending else 0)
+
+		data.append(row)
 
 	return columns, data
 
@@ -57,11 +71,14 @@ def get_columns():
 
 	return columns
 
-def get_conditions(filters):
+def get_conditions(filters, opening_date=None):
 	conditions = ""
 	if not filters.get("from_date"):
 		frappe.throw(_("'From Date' is required"))
 
+	if opening_date:
+		conditions += " and posting_date >= '%s'" % frappe.db.escape(str(opening_date))
+
 	if filters.get("to_date"):
 		conditions += " and posting_date <= '%s'" % frappe.db.escape(filters["to_date"])
 	else:
@@ -75,8 +92,8 @@ def get_conditions(filters):
 
 	return conditions
 
-def get_stock_ledger_entries(filters):
-	conditions = get_conditions(filters)
+def get_stock_ledger_entries(filters, opening_date=None):
+	conditions = get_conditions(filters, opening_date)
 	return frappe.db.sql("""select item_code, warehouse, posting_date, actual_qty, valuation_rate,
 			company, voucher_type, qty_after_transaction, stock_value_difference
 		from `tabStock Ledger Entry` force index (posting_sort_index)
@@ -88,7 +105,22 @@ def get_item_warehouse_map(filters):
 	from_date = getdate(filters["from_date"])
 	to_date = getdate(filters["to_date"])
 
-	sle = get_stock_ledger_entries(filters)
+	if use_stock_balance_snapshots():
+		# opening as per the last snapshot before the month of from date,
+		# stock ledger entries are read only from the start of that month
+		opening_date = get_first_day(from_date)
+		for d in get_opening_stock(from_date, filters.get("item_code"), filters.get("warehouse")):
+			iwb_map[(d.company, d.item_code, d.warehouse)] = frappe._dict({
+				"opening_qty": flt(d.qty_after_transaction), "opening_val": flt(d.stock_value),
+				"in_qty": 0.0, "in_val": 0.0,
+				"out_qty": 0.0, "out_val": 0.0,
+				"bal_qty": flt(d.qty_after_transaction), "bal_val": flt(d.stock_value),
+				"val_rate": d.valuation_rate, "uom": None
+			})
+
+		sle = get_stock_ledger_entries(filters, opening_date)
+	else:
+		sle = get_stock_ledger_entries(filters)
 
 	for d in sle:
 		key = (d.company, d.item_code, d.warehouse)
@@ -141,7 +173,7 @@ def get_item_details(filters):
 	return dict((d.name, d) for d in items)
 
 def validate_filters(filters):
-	if not (filters.get("item_code") or filters.get("warehouse")):
+	if not (filters.get("item_code") or filters.get("warehouse")) and not use_stock_balance_snapshots():
 		sle_count = flt(frappe.db.sql("""select count(name) from `tabStock Ledger Entry`""")[0][0])
 		if sle_count > 500000:
 			frappe.throw(_("Please set filter based on Item or Warehouse"))
@@ -4,9 +4,11 @@ from __future__ import unicode_literals
 
 import frappe
 from frappe import _
-from frappe.utils import cint, flt, cstr, now
+from frappe.utils import cint, flt, cstr, now, get_datetime
 from erpnext.stock.utils import get_valuation_method
+from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot import update_stock_balance_snapshots
 import json
+from collections import deque
 
 # future reposting
 class NegativeStockError(frappe.ValidationError): pass
@@ -16,12 +18,16 @@ _exceptions = frappe.local('stockledger_exceptions')
 
 def make_sl_entries(sl_entries, is_amended=None, allow_negative_stock=False, via_landed_cost_voucher=False):
 	if sl_entries:
-		from erpnext.stock.utils import update_bin
+		from erpnext.stock.utils import update_bin_for_entries, lock_item_warehouses
+
+		# serialize posting per item and warehouse before the previous entries are read
+		lock_item_warehouses([(sle.get("item_code"), sle.get("warehouse")) for sle in sl_entries])
 
 		cancel = True if sl_entries[0].get("is_cancelled") == "Yes" else False
 		if cancel:
 			set_as_cancel(sl_entries[0].get('voucher_no'), sl_entries[0].get('voucher_type'))
 
+		entries_by_item_warehouse = {}
 		for sle in sl_entries:
 			sle_id = None
 			if sle.get('is_cancelled') == 'Yes':
@@ -35,7 +41,11 @@ def make_sl_entries(sl_entries, is_amended=None, allow_negative_stock=False, via
 				"sle_id": sle_id,
 				"is_amended": is_amended
 			})
-			update_bin(args, allow_negative_stock, via_landed_cost_voucher)
+			entries_by_item_warehouse.setdefault((sle.get("item_code"), sle.get("warehouse")), []).append(args)
+
+		# update Bin and repost once per item and warehouse
+		for key in sorted(entries_by_item_warehouse):
+			update_bin_for_entries(entries_by_item_warehouse[key], allow_negative_stock, via_landed_cost_voucher)
 
 		if cancel:
 			delete_cancelled_entry(sl_entries[0].get('voucher_type'), sl_entries[0].get('voucher_no'))
@@ -60,6 +70,13 @@ def delete_cancelled_entry(voucher_type, voucher_no):
 	frappe.db.sql("""delete from `tabStock Ledger Entry`
 		where voucher_type=%s and voucher_no=%s""", (voucher_type, voucher_no))
 
+def get_checkpoint_key(item_code, warehouse):
+	return "stock_reposting_checkpoint:{0}:{1}".format(item_code, warehouse)
+
+def clear_reposting_checkpoint(item_code, warehouse):
+	"""Reposting of the item and warehouse starts over from its posting time next time"""
+	frappe.cache().delete_value(get_checkpoint_key(item_code, warehouse))
+
 class update_entries_after(object):
 	"""
 		update valution rate and qty after transaction
@@ -74,7 +91,11 @@ class update_entries_after(object):
 				"posting_time": "12:00"
 			}
 	"""
-	def __init__(self, args, allow_zero_rate=False, allow_negative_stock=None, via_landed_cost_voucher=False, verbose=1):
+	# number of future entries fetched and written back per round-trip
+	chunk_size = 500
+
+	def __init__(self, args, allow_zero_rate=False, allow_negative_stock=None, via_landed_cost_voucher=False,
+		verbose=1, stop_on_match=False, checkpoint=False, repost_future_in_background=False, save_bin=True):
 		from frappe.model.meta import get_field_precision
 
 		self.exceptions = []
@@ -82,6 +103,13 @@ class update_entries_after(object):
 		self.allow_zero_rate = allow_zero_rate
 		self.allow_negative_stock = allow_negative_stock
 		self.via_landed_cost_voucher = via_landed_cost_voucher
+		self.stop_on_match = stop_on_match
+		self.checkpoint = checkpoint
+		self.repost_future_in_background = repost_future_in_background
+		self.save_bin = save_bin
+		self.repost_queued = False
+		self.checkpoint_start = None
+		self.checkpoint_created = now()
 		if not self.allow_negative_stock:
 			self.allow_negative_stock = cint(frappe.db.get_single_value("Stock Settings",
 				"allow_negative_stock"))
@@ -90,7 +118,9 @@ class update_entries_after(object):
 		for key, value in args.iteritems():
 			setattr(self, key, value)
 
-		self.previous_sle = self.get_sle_before_datetime()
+		self.previous_sle = self.get_checkpoint_sle()
+		if self.previous_sle is None:
+			self.previous_sle = self.get_sle_before_datetime()
 		self.previous_sle = self.previous_sle[0] if self.previous_sle else frappe._dict()
 
 		for key in ("qty_after_transaction", "valuation_rate", "stock_value"):
@@ -101,22 +131,162 @@ class update_entries_after(object):
 			currency=frappe.db.get_value("Company", self.company, "default_currency", cache=True))
 
 		self.prev_stock_value = self.previous_sle.stock_value or 0.0
-		self.stock_queue = json.loads(self.previous_sle.stock_queue or "[]")
+		self.stock_queue = FifoQueue(json.loads(self.previous_sle.stock_queue or "[]"),
+			json.loads(self.previous_sle.stock_queue_dates or "[]"))
 		self.valuation_method = get_valuation_method(self.item_code)
 		self.stock_value_difference = 0.0
-		self.build()
+
+		try:
+			self.build()
+		except Exception:
+			# entries after the checkpoint may not be reposted, start over next time
+			self.clear_checkpoint()
+			raise
 
 	def build(self):
 		# includes current entry!
-		entries_to_fix = self.get_sle_after_datetime()
+		matched = False
+		for entries_to_fix in self.get_sle_after_datetime():
+			entries_to_update, last_processed = [], None
+			for sle in entries_to_fix:
+				if self.process_sle(sle):
+					if self.repost_future_in_background and sle.voucher_no != self.args.get("voucher_no"):
+						# entries of other vouchers are reposted by the scheduler
+						self.queue_repost()
+						break
+
+					entries_to_update.append(sle)
+
+				elif self.can_stop_at(sle):
+					# state carried forward is the same as the one already stored,
+					# so the rest of the ledger is already correct
+					matched = True
+					break
 
-		for sle in entries_to_fix:
-			self.process_sle(sle)
+				last_processed = sle
+
+			update_stock_ledger_entries(entries_to_update)
+			if last_processed:
+				self.set_checkpoint(last_processed)
+
+			if matched or self.repost_queued:
+				break
 
 		if self.exceptions:
 			self.raise_exceptions()
 
-		self.update_bin()
+		if matched:
+			self.set_values_from_last_sle()
+
+		self.clear_checkpoint()
+
+		update_stock_balance_snapshots(self.item_code, self.warehouse, self.args.get("posting_date"))
+
+		# bin is updated once the queued reposting is complete
+		if not self.repost_queued and self.save_bin:
+			self.update_bin()
+
+	def queue_repost(self):
+		from erpnext.stock.doctype.stock_repost_request.stock_repost_request import make_repost_request
+		make_repost_request(self.args)
+		self.repost_queued = True
+
+	def can_stop_at(self, sle):
+		"""Stop reposting only on an unchanged entry strictly after the current time-bucket,
+		entries in the same time-bucket may still be affected by the current voucher"""
+		if not self.stop_on_match or self.exceptions or not self.args.get("posting_date"):
+			return False
+
+		return get_datetime(sle.timestamp) > get_datetime("{0} {1}".format(cstr(self.args.get("posting_date")),
+			cstr(self.args.get("posting_time") or "00:00")))
+
+	def set_values_from_last_sle(self):
+		last_sle = get_stock_ledger_entries(frappe._dict({"item_code": self.item_code,
+			"warehouse": self.warehouse}), None, "desc", "limit 1")
+
+		if last_sle:
+			for key in ("qty_after_transaction", "valuation_rate", "stock_value"):
+				setattr(self, key, flt(last_sle[0].get(key)))
+
+	def get_checkpoint_key(self):
+		return get_checkpoint_key(self.item_code, self.warehouse)
+
+	def get_start_timestamp(self):
+		return get_datetime("{0} {1}".format(cstr(self.args.get("posting_date") or "1900-01-01"),
+			cstr(self.args.get("posting_time") or "00:00")))
+
+	def get_checkpoint_sle(self):
+		"""Resume from the last entry written by an earlier, interrupted reposting
+		of the same item and warehouse, if it started at or before the current one.
+		Returns None to start from the current time-bucket"""
+		if not self.checkpoint:
+			return
+
+		checkpoint = frappe.cache().get_value(self.get_checkpoint_key())
+		if not checkpoint or not isinstance(checkpoint, dict):
+			return
+
+		# entries before the start of the interrupted reposting were not reposted by it
+		if self.get_start_timestamp() < get_datetime(checkpoint.get("start")):
+			return
+
+		sle = frappe.db.sql("""select *, timestamp(posting_date, posting_time) as "timestamp"
+			from `tabStock Ledger Entry`
+			where name=%s and ifnull(is_cancelled, 'No')='No'
+			and timestamp(posting_date, posting_time) >= %s""",
+			(checkpoint.get("sle"), self.get_start_timestamp()), as_dict=1)
+
+		if not sle:
+			return
+
+		# entries made since the interrupted reposting began, posted before its checkpoint,
+		# were not reposted by it
+		missed = frappe.db.sql("""select posting_date, posting_time,
+				timestamp(posting_date, posting_time) as "timestamp"
+			from `tabStock Ledger Entry`
+			where item_code=%(item_code)s and warehouse=%(warehouse)s
+			and ifnull(is_cancelled, 'No')='No' and creation >= %(created)s
+			and (timestamp(posting_date, posting_time) < %(timestamp)s
+				or (timestamp(posting_date, posting_time) = %(timestamp)s and name < %(name)s))
+			order by timestamp(posting_date, posting_time), name limit 1""", {
+				"item_code": self.item_code,
+				"warehouse": self.warehouse,
+				"created": checkpoint.get("created") or "1900-01-01",
+				"timestamp": sle[0].timestamp,
+				"name": sle[0].name
+			}, as_dict=1)
+
+		if missed:
+			if get_datetime(missed[0].timestamp) >= self.get_start_timestamp():
+				return
+
+			# start over from the earliest of them
+			self.checkpoint_start = cstr(missed[0].timestamp)
+			return get_stock_ledger_entries(frappe._dict({
+				"item_code": self.item_code,
+				"warehouse": self.warehouse,
+				"posting_date": missed[0].posting_date,
+				"posting_time": missed[0].posting_time
+			}), "<", "desc", "limit 1", for_update=True)
+
+		# the checkpoint stays with the start of the reposting that made it
+		self.checkpoint_start = checkpoint.get("start")
+		self.checkpoint_created = checkpoint.get("created") or self.checkpoint_created
+
+		return sle
+
+	def set_checkpoint(self, sle):
+		if self.checkpoint and not self.exceptions:
+			frappe.cache().set_value(self.get_checkpoint_key(), {
+				"start": self.checkpoint_start or cstr(self.get_start_timestamp()),
+				"created": self.checkpoint_created,
+				"sle": sle.name
+			})
+			frappe.db.commit()
+
+	def clear_checkpoint(self):
+		if self.checkpoint:
+			clear_reposting_checkpoint(self.item_code, self.warehouse)
 
 	def update_bin(self):
 		# update bin
@@ -145,12 +315,13 @@ class update_entries_after(object):
 		bin_doc.save(ignore_permissions=True)
 
 	def process_sle(self, sle):
+		"""Recompute values for the entry, returns True if the stored values have changed"""
 		if (sle.serial_no and not self.via_landed_cost_voucher) or not cint(self.allow_negative_stock):
 			# validate negative stock for serialized items, fifo valuation
 			# or when negative stock is not allowed for moving average
 			if not self.validate_negative_stock(sle):
 				self.qty_after_transaction += flt(sle.actual_qty)
-				return
+				return False
 
 		if sle.serial_no:
 			self.get_serialized_values(sle)
@@ -161,7 +332,7 @@ class update_entries_after(object):
 				# assert
 				self.valuation_rate = sle.valuation_rate
 				self.qty_after_transaction = sle.qty_after_transaction
-				self.stock_queue = [[self.qty_after_transaction, self.valuation_rate]]
+				self.stock_queue = FifoQueue([[self.qty_after_transaction, self.valuation_rate]], [sle.posting_date])
 				self.stock_value = flt(self.qty_after_transaction) * flt(self.valuation_rate)
 			else:
 				if self.valuation_method == "Moving Average":
@@ -171,7 +342,7 @@ class update_entries_after(object):
 				else:
 					self.get_fifo_values(sle)
 					self.qty_after_transaction += flt(sle.actual_qty)
-					self.stock_value = sum((flt(batch[0]) * flt(batch[1]) for batch in self.stock_queue))
+					self.stock_value = self.stock_queue.value
 
 		# rounding as per precision
 		self.stock_value = flt(self.stock_value, self.precision)
@@ -179,14 +350,44 @@ class update_entries_after(object):
 		stock_value_difference = self.stock_value - self.prev_stock_value
 		self.prev_stock_value = self.stock_value
 
+		if self.is_unchanged(sle, stock_value_difference):
+			return False
+
 		# update current sle
 		sle.qty_after_transaction = self.qty_after_transaction
 		sle.valuation_rate = self.valuation_rate
 		sle.stock_value = self.stock_value
-		sle.stock_queue = json.dumps(self.stock_queue)
+		sle.stock_queue = self.stock_queue.serialize()
+		sle.stock_queue_dates = self.stock_queue.serialize_dates()
 		sle.stock_value_difference = stock_value_difference
-		sle.doctype="Stock Ledger Entry"
-		frappe.get_doc(sle).db_update()
+		return True
+
+	def is_unchanged(self, sle, stock_value_difference):
+		"""check if the recomputed values are the same as the ones already stored in the entry"""
+		if flt(sle.qty_after_transaction, self.precision) != flt(self.qty_after_transaction, self.precision) \
+			or flt(sle.valuation_rate, self.precision) != flt(self.valuation_rate, self.precision) \
+			or flt(sle.stock_value, self.precision) != flt(self.stock_value, self.precision) \
+			or flt(sle.stock_value_difference, self.precision) != flt(stock_value_difference, self.precision):
+				return False
+
+		# entries posted before the dates were kept have none stored, and are aged by replaying
+		# the ledger, so they are not rewritten only for the dates
+		if sle.stock_queue_dates and sle.stock_queue_dates != self.stock_queue.serialize_dates():
+			return False
+
+		if sle.stock_queue == self.stock_queue.serialize():
+			return True
+
+		stored_queue = json.loads(sle.stock_queue or "[]")
+		if len(stored_queue) != len(self.stock_queue):
+			return False
+
+		for stored_batch, batch in zip(stored_queue, self.stock_queue):
+			if flt(stored_batch[0], self.precision) != flt(batch[0], self.precision) \
+				or flt(stored_batch[1], self.precision) != flt(batch[1], self.precision):
+					return False
+
+		return True
 
 	def validate_negative_stock(self, sle):
 		"""
@@ -256,22 +457,30 @@ class update_entries_after(object):
 		actual_qty = flt(sle.actual_qty)
 		outgoing_rate = flt(sle.outgoing_rate)
 
+		posting_date = cstr(sle.posting_date)
+
 		if actual_qty > 0:
 			if not self.stock_queue:
-				self.stock_queue.append([0, 0])
+				self.stock_queue.append(0, 0, posting_date)
+
+			last_batch = self.stock_queue[-1]
 
 			# last row has the same rate, just updated the qty
-			if self.stock_queue[-1][1]==incoming_rate:
-				self.stock_queue[-1][0] += actual_qty
+			# stock in hand is kept in separate batches per posting date, for ageing,
+			# batches without a date are from before the dates were kept and merge as before
+			if last_batch[1]==incoming_rate and (last_batch[2]==posting_date or last_batch[0] <= 0):
+				self.stock_queue.update_batch(last_batch, last_batch[0] + actual_qty, posting_date=posting_date)
+			elif last_batch[1]==incoming_rate and not last_batch[2]:
+				self.stock_queue.update_batch(last_batch, last_batch[0] + actual_qty)
 			else:
-				if self.stock_queue[-1][0] > 0:
-					self.stock_queue.append([actual_qty, incoming_rate])
+				if last_batch[0] > 0:
+					self.stock_queue.append(actual_qty, incoming_rate, posting_date)
 				else:
-					qty = self.stock_queue[-1][0] + actual_qty
+					qty = last_batch[0] + actual_qty
 					if qty == 0:
-						self.stock_queue.pop(-1)
+						self.stock_queue.remove(-1)
 					else:
-						self.stock_queue[-1] = [qty, incoming_rate]
+						self.stock_queue.update_batch(last_batch, qty, incoming_rate, posting_date)
 		else:
 			qty_to_pop = abs(actual_qty)
 			while qty_to_pop:
@@ -280,21 +489,20 @@ class update_entries_after(object):
 						_rate = get_valuation_rate(sle.item_code, sle.warehouse, self.allow_zero_rate)
 					else:
 						_rate = 0
-					self.stock_queue.append([0, _rate])
+					self.stock_queue.append(0, _rate, posting_date)
 
 				index = None
 				if outgoing_rate > 0:
 					# Find the entry where rate matched with outgoing rate
-					for i, v in enumerate(self.stock_queue):
-						if v[1] == outgoing_rate:
-							index = i
-							break
+					index = self.stock_queue.index_of_rate(outgoing_rate)
 
 					# If no entry found with outgoing rate, collapse stack
 					if index == None:
-						new_stock_value = sum((d[0]*d[1] for d in self.stock_queue)) - qty_to_pop*outgoing_rate
-						new_stock_qty = sum((d[0] for d in self.stock_queue)) - qty_to_pop
-						self.stock_queue = [[new_stock_qty, new_stock_value/new_stock_qty if new_stock_qty > 0 else outgoing_rate]]
+						new_stock_value = self.stock_queue.value - qty_to_pop*outgoing_rate
+						new_stock_qty = self.stock_queue.qty - qty_to_pop
+						self.stock_queue = FifoQueue([[new_stock_qty,
+							new_stock_value/new_stock_qty if new_stock_qty > 0 else outgoing_rate]],
+							[self.stock_queue[0][2]])
 						break
 				else:
 					index = 0
@@ -304,33 +512,52 @@ class update_entries_after(object):
 				if qty_to_pop >= batch[0]:
 					# consume current batch
 					qty_to_pop = qty_to_pop - batch[0]
-					self.stock_queue.pop(index)
+					self.stock_queue.remove(index)
 					if not self.stock_queue and qty_to_pop:
 						# stock finished, qty still remains to be withdrawn
 						# negative stock, keep in as a negative batch
-						self.stock_queue.append([-qty_to_pop, outgoing_rate or batch[1]])
+						self.stock_queue.append(-qty_to_pop, outgoing_rate or batch[1], posting_date)
 						break
 
 				else:
 					# qty found in current batch
 					# consume it and exit
-					batch[0] = batch[0] - qty_to_pop
+					self.stock_queue.update_batch(batch, batch[0] - qty_to_pop)
 					qty_to_pop = 0
 
-		stock_value = sum((flt(batch[0]) * flt(batch[1]) for batch in self.stock_queue))
-		stock_qty = sum((flt(batch[0]) for batch in self.stock_queue))
+		stock_value = self.stock_queue.value
+		stock_qty = self.stock_queue.qty
 
 		self.valuation_rate = (stock_value / flt(stock_qty)) if stock_qty else 0
 
 	def get_sle_before_datetime(self):
 		"""get previous stock ledger entry before current time-bucket"""
-		return get_stock_ledger_entries(self.args, "<", "desc", "limit 1", for_update=False)
+		return get_stock_ledger_entries(self.args, "<", "desc", "limit 1", for_update=True)
 
 	def get_sle_after_datetime(self):
-		"""get Stock Ledger Entries after a particular datetime, for reposting"""
-		return get_stock_ledger_entries(self.previous_sle or frappe._dict({
-				"item_code": self.args.get("item_code"), "warehouse": self.args.get("warehouse") }),
-			">", "asc", for_update=True)
+		"""get Stock Ledger Entries after a particular datetime, for reposting,
+		yielded in chunks of `chunk_size` entries"""
+		last_sle = self.previous_sle or frappe._dict({
+			"item_code": self.args.get("item_code"), "warehouse": self.args.get("warehouse") })
+
+		while True:
+			entries = get_stock_ledger_entries(frappe._dict({
+				"item_code": self.args.get("item_code"),
+				"warehouse": self.args.get("warehouse"),
+				"posting_date": last_sle.get("posting_date"),
+				"posting_time": last_sle.get("posting_time"),
+				"name": last_sle.get("name")
+			}), ">", "asc", "limit {0}".format(cint(self.chunk_size)), for_update=True)
+
+			if not entries:
+				break
+
+			yield entries
+
+			if len(entries) < self.chunk_size:
+				break
+
+			last_sle = entries[-1]
 
 	def raise_exceptions(self):
 		deficiency = min(e["diff"] for e in self.exceptions)
@@ -342,6 +569,98 @@ class update_entries_after(object):
 		else:
 			raise NegativeStockError, msg
 
+class FifoQueue(object):
+	"""FIFO stock queue of [qty, rate] batches, with running totals of qty and value.
+	The posting date of every batch is kept separately in `posting_dates`, for stock ageing.
+
+	Batches are added at the end and consumed from the front in O(1). The JSON of every batch
+	is cached, so `serialize` only encodes the batches changed since it was last called.
+	The serialized queue is the same as `json.dumps` of the list of batches."""
+	def __init__(self, batches=None, posting_dates=None):
+		# every batch is [qty, rate, posting date, cached json]
+		self.batches = deque()
+		self.qty = self.value = 0.0
+		self.serialized = self.serialized_dates = None
+
+		posting_dates = posting_dates or []
+		for i, batch in enumerate(batches or []):
+			self.append(batch[0], batch[1], posting_dates[i] if i < len(posting_dates) else None)
+
+	def __len__(self):
+		return len(self.batches)
+
+	def __getitem__(self, index):
+		return self.batches[index]
+
+	def __iter__(self):
+		for batch in self.batches:
+			yield batch[:2]
+
+	def to_list(self):
+		return list(self)
+
+	def append(self, qty, rate, posting_date=None):
+		self.batches.append([qty, rate, posting_date and cstr(posting_date) or None, None])
+		self.serialized_dates = None
+		self.add_to_totals(qty, rate)
+
+	def update_batch(self, batch, qty, rate=None, posting_date=None):
+		"""Set qty, and rate and posting date if given, of a batch of the queue"""
+		self.add_to_totals(-batch[0], batch[1])
+		batch[0] = qty
+		if rate is not None:
+			batch[1] = rate
+		if posting_date:
+			batch[2] = cstr(posting_date)
+			self.serialized_dates = None
+		batch[3] = None
+		self.add_to_totals(batch[0], batch[1])
+
+	def remove(self, index=0):
+		if index == 0:
+			batch = self.batches.popleft()
+		elif index == -1:
+			batch = self.batches.pop()
+		else:
+			batch = self.batches[index]
+			del self.batches[index]
+
+		self.serialized_dates = None
+		self.add_to_totals(-batch[0], batch[1])
+		return batch
+
+	def index_of_rate(self, rate):
+		for i, batch in enumerate(self.batches):
+			if batch[1] == rate:
+				return i
+
+	def add_to_totals(self, qty, rate):
+		self.serialized = None
+
+		if len(self.batches) > 1:
+			self.qty += flt(qty)
+			self.value += flt(qty) * flt(rate)
+		else:
+			# reset running totals, so that rounding errors do not carry forward
+			self.qty = sum(flt(batch[0]) for batch in self.batches)
+			self.value = sum(flt(batch[0]) * flt(batch[1]) for batch in self.batches)
+
+	def serialize(self):
+		if self.serialized is None:
+			for batch in self.batches:
+				if batch[3] is None:
+					batch[3] = json.dumps(batch[:2])
+
+			self.serialized = "[" + ", ".join(batch[3] for batch in self.batches) + "]"
+
+		return self.serialized
+
+	def serialize_dates(self):
+		if self.serialized_dates is None:
+			self.serialized_dates = json.dumps([batch[2] for batch in self.batches])
+
+		return self.serialized_dates
+
 def get_previous_sle(args, for_update=False):
 	"""
 		get the last sle on or before the current time-bucket,
@@ -362,14 +681,23 @@ def get_previous_sle(args, for_update=False):
 
 def get_stock_ledger_entries(previous_sle, operator=None, order="desc", limit=None, for_update=False, debug=False):
 	"""get stock ledger entries filtered by specific posting datetime conditions"""
-	conditions = "timestamp(posting_date, posting_time) {0} timestamp(%(posting_date)s, %(posting_time)s)".format(operator)
 	if not previous_sle.get("posting_date"):
 		previous_sle["posting_date"] = "1900-01-01"
 	if not previous_sle.get("posting_time"):
 		previous_sle["posting_time"] = "00:00"
 
-	if operator in (">", "<=") and previous_sle.get("name"):
-		conditions += " and name!=%(name)s"
+	if not operator:
+		conditions = "1=1"
+	elif operator == ">" and previous_sle.get("name"):
+		# entries after the given entry, in posting order
+		conditions = """(timestamp(posting_date, posting_time) > timestamp(%(posting_date)s, %(posting_time)s)
+			or (timestamp(posting_date, posting_time) = timestamp(%(posting_date)s, %(posting_time)s)
+				and name > %(name)s))"""
+	else:
+		conditions = "timestamp(posting_date, posting_time) {0} timestamp(%(posting_date)s, %(posting_time)s)".format(operator)
+
+		if operator == "<=" and previous_sle.get("name"):
+			conditions += " and name!=%(name)s"
 
 	return frappe.db.sql("""select *, timestamp(posting_date, posting_time) as "timestamp" from `tabStock Ledger Entry`
 		where item_code = %%(item_code)s
@@ -384,6 +712,24 @@ def get_stock_ledger_entries(previous_sle, operator=None, order="desc", limit=No
 			"order": order
 		}, previous_sle, as_dict=1, debug=debug)
 
+def update_stock_ledger_entries(entries):
+	"""Write back recomputed values of multiple Stock Ledger Entries in a single query"""
+	if not entries:
+		return
+
+	fields = ("qty_after_transaction", "valuation_rate", "stock_value", "stock_queue", "stock_queue_dates",
+		"stock_value_difference")
+	set_values, values = [], []
+	for fieldname in fields:
+		set_values.append("`{0}` = case name {1} end".format(fieldname,
+			" ".join(["when %s then %s"] * len(entries))))
+		for sle in entries:
+			values += [sle.name, sle.get(fieldname)]
+
+	names = [sle.name for sle in entries]
+	frappe.db.sql("""update `tabStock Ledger Entry` set {0} where name in ({1})""".format(
+		", ".join(set_values), ", ".join(["%s"] * len(names))), tuple(values + names))
+
 def get_valuation_rate(item_code, warehouse, allow_zero_rate=False):
 	last_valuation_rate = frappe.db.sql("""select valuation_rate
 		from `tabStock Ledger Entry`
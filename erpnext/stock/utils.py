@@ -4,11 +4,17 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-import json
+import json, time, random
+from functools import wraps
+from MySQLdb import OperationalError
 from frappe.utils import flt, cstr, nowdate, nowtime
 
 class InvalidWarehouseCompany(frappe.ValidationError): pass
 
+# lock wait timeout exceeded, deadlock found when trying to get lock
+lock_error_codes = (1205, 1213)
+max_deadlock_retries = 3
+
 def get_stock_value_on(warehouse=None, posting_date=None, item_code=None):
 	if not posting_date: posting_date = nowdate()
 
@@ -79,6 +85,43 @@ def get_bin(item_code, warehouse):
 	bin_obj.flags.ignore_permissions = True
 	return bin_obj
 
+def lock_item_warehouses(item_warehouses):
+	"""Lock Bins of the items and warehouses till the end of the transaction, always in sorted order,
+	so that vouchers posting the same items wait for each other instead of deadlocking.
+	Must be called before reading the previous Stock Ledger Entry of any of them"""
+	for item_code, warehouse in sorted(set(item_warehouses)):
+		if not lock_bin(item_code, warehouse):
+			# there is no Bin to lock before the first posting, make it while holding
+			# the Item, so that the first postings of the item wait for each other too
+			frappe.db.sql("""select name from `tabItem` where name=%s for update""", item_code)
+			if not lock_bin(item_code, warehouse):
+				get_bin(item_code, warehouse)
+
+def lock_bin(item_code, warehouse):
+	return frappe.db.sql("""select name from `tabBin` where item_code=%s and warehouse=%s for update""",
+		(item_code, warehouse))
+
+def is_deadlock(e):
+	return isinstance(e, OperationalError) and e.args and e.args[0] in lock_error_codes
+
+def retry_on_deadlock(fn):
+	"""Roll back and run `fn` again if its transaction is chosen as a deadlock victim,
+	or times out waiting for a lock. `fn` must do all the work of the transaction,
+	as everything before the last commit is lost on rollback"""
+	@wraps(fn)
+	def wrapper(*args, **kwargs):
+		for attempt in xrange(max_deadlock_retries + 1):
+			try:
+				return fn(*args, **kwargs)
+			except OperationalError, e:
+				if not is_deadlock(e) or attempt == max_deadlock_retries:
+					raise
+
+				frappe.db.rollback()
+				time.sleep(random.uniform(0, 0.1 * (attempt + 1)))
+
+	return wrapper
+
 def update_bin(args, allow_negative_stock=False, via_landed_cost_voucher=False):
 	is_stock_item = frappe.db.get_value('Item', args.get("item_code"), 'is_stock_item')
 	if is_stock_item:
@@ -88,6 +131,17 @@ def update_bin(args, allow_negative_stock=False, via_landed_cost_voucher=False):
 	else:
 		frappe.msgprint(_("Item {0} ignored since it is not a stock item").format(args.get("item_code")))
 
+def update_bin_for_entries(entries, allow_negative_stock=False, via_landed_cost_voucher=False):
+	"""Update Bin of an item and warehouse for all the entries of a voucher, with one reposting
+	and one Bin write"""
+	is_stock_item = frappe.db.get_value('Item', entries[0].get("item_code"), 'is_stock_item')
+	if is_stock_item:
+		bin = get_bin(entries[0].get("item_code"), entries[0].get("warehouse"))
+		bin.update_stock_for_entries(entries, allow_negative_stock, via_landed_cost_voucher)
+		return bin
+	else:
+		frappe.msgprint(_("Item {0} ignored since it is not a stock item").format(entries[0].get("item_code")))
+
 @frappe.whitelist()
 def get_incoming_rate(args):
 	"""Get Incoming Rate based on valuation method"""
@@ -33,3 +33,67 @@ def send_newsletter(site, newsletter, event):
 
 	finally:
 		frappe.destroy()
+
+@celery_task()
+def make_recurring_documents(site, doctype, recurring_documents, next_date, run, event=None):
+	try:
+		frappe.connect(site=site)
+		from erpnext.controllers.recurring_document import make_recurring_documents
+		make_recurring_documents(doctype, recurring_documents, next_date, run=run)
+
+	except:
+		frappe.db.rollback()
+
+		task_logger.error(site)
+		task_logger.error(frappe.get_traceback())
+
+		log("make_recurring_documents")
+
+		raise
+
+	finally:
+		frappe.destroy()
+
+@celery_task()
+def send_recurring_document_notification(site, doctype, name):
+	try:
+		frappe.connect(site=site)
+		from erpnext.controllers.recurring_document import send_notification
+		send_notification(frappe.get_doc(doctype, name))
+
+	except:
+		task_logger.error(site)
+		task_logger.error(frappe.get_traceback())
+
+		log("send_recurring_document_notification")
+
+		raise
+
+	else:
+		frappe.db.commit()
+
+	finally:
+		frappe.destroy()
+
+@celery_task()
+def process_payroll(site, method, args, event=None):
+	try:
+		frappe.connect(site=site)
+		from erpnext.hr.doctype.process_payroll import process_payroll as payroll
+		getattr(payroll, method)(*args)
+
+	except:
+		frappe.db.rollback()
+
+		task_logger.error(site)
+		task_logger.error(frappe.get_traceback())
+
+		log("process_payroll")
+
+		raise
+
+	else:
+		frappe.db.commit()
+
+	finally:
+		frappe.destroy()